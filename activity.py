@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class ActivityEvent:
+    """One agent action: who did what, to which task, when and for how long"""
+
+    __slots__ = ('seq', 'ts', 'agent', 'action', 'task_id', 'duration')
+
+    def __init__(self, seq: int, ts: float, agent: str, action: str,
+                 task_id: str = None, duration: float = None):
+        self.seq = seq
+        self.ts = ts
+        self.agent = agent
+        self.action = action
+        self.task_id = task_id
+        self.duration = duration
+
+    @property
+    def time(self) -> str:
+        return datetime.fromtimestamp(self.ts).strftime("%H:%M:%S")
+
+    def to_dict(self) -> Dict:
+        data = {'seq': self.seq, 'ts': self.ts, 'agent': self.agent, 'action': self.action}
+        if self.task_id is not None:
+            data['task_id'] = self.task_id
+        if self.duration is not None:
+            data['duration'] = self.duration
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ActivityEvent':
+        return cls(data['seq'], data['ts'], data['agent'], data['action'],
+                   data.get('task_id'), data.get('duration'))
+
+    def __repr__(self) -> str:
+        return f"ActivityEvent(seq={self.seq}, agent={self.agent!r}, action={self.action!r})"
+
+
+class _TimeIndex:
+    """Ring positions and timestamps of live events, oldest first.
+
+    Evicting moves a head offset; the dead prefix is cut off once it is
+    half the list, so appends and evictions are amortized O(1).
+    """
+
+    __slots__ = ('positions', 'times', 'head')
+
+    def __init__(self):
+        self.positions: List[int] = []
+        self.times: List[float] = []
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.positions) - self.head
+
+    def append(self, position: int, ts: float):
+        self.positions.append(position)
+        self.times.append(ts)
+
+    def evict(self):
+        self.head += 1
+        if self.head >= 64 and self.head * 2 >= len(self.positions):
+            del self.positions[:self.head]
+            del self.times[:self.head]
+            self.head = 0
+
+    def between(self, since: Optional[float], until: Optional[float]) -> List[int]:
+        """Positions of the events with since <= ts < until, oldest first"""
+        lo = self.head if since is None else bisect_left(self.times, since, self.head)
+        hi = len(self.times) if until is None else bisect_left(self.times, until, lo)
+        return self.positions[lo:hi]
+
+
+class ActivityLog:
+    """Bounded, persistent log of agent activity.
+
+    The newest `capacity` events live in a ring buffer, indexed by time
+    overall and per agent, so `query` bisects to a time range instead of
+    scanning and memory stays the same however long the process runs.
+    Timestamps are wall-clock times derived from the monotonic clock, so
+    they never go backwards within a process.
+
+    Events are appended to `filename` as JSON lines by a background
+    thread, in batches every `flush_interval` seconds. The file is rotated
+    at `max_bytes` into `filename.1` ... `filename.<backup_count>`, and the
+    newest events are read back from it on start. If the disk falls more
+    than `capacity` events behind, the oldest unwritten ones are dropped
+    and counted in `dropped`. `filename=None` keeps the log in memory only.
+    """
+
+    def __init__(self, filename: Optional[str] = "activity.jsonl", capacity: int = 1000,
+                 max_bytes: int = 1 << 20, backup_count: int = 3, flush_interval: float = 1.0):
+        if capacity < 1:
+            raise ValueError("an activity log needs room for at least one event")
+        self.filename = filename
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._ring: List[Optional[ActivityEvent]] = [None] * capacity
+        # Events ever inserted; the next one goes to slot _inserted % capacity
+        self._inserted = 0
+        self._seq = 0
+        self._last_ts = 0.0
+        self._all = _TimeIndex()
+        self._by_agent: Dict[str, _TimeIndex] = {}
+        self._epoch = time.time() - time.monotonic()
+        self._cond = threading.Condition()
+        self._pending = deque(maxlen=capacity)
+        self._write_lock = threading.Lock()
+        self._file = None
+        self._thread = None
+        self._closed = False
+        if filename is not None:
+            self._load()
+
+    def _load(self):
+        """Refill the ring with the newest events on disk, newest file first"""
+        files = [self.filename] + [f"{self.filename}.{n}" for n in range(1, self.backup_count + 1)]
+        chunks = []
+        found = 0
+        for filename in files:
+            if found >= self.capacity:
+                break
+            events = self._read(filename)
+            chunks.append(events)
+            found += len(events)
+        newest = deque(maxlen=self.capacity)
+        for events in reversed(chunks):
+            newest.extend(events)
+        for event in newest:
+            self._seq = max(self._seq, event.seq)
+            self._insert(event)
+
+    def _read(self, filename: str) -> deque:
+        events = deque(maxlen=self.capacity)
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        events.append(ActivityEvent.from_dict(json.loads(line)))
+                    except (ValueError, KeyError):
+                        continue  # torn last line after a crash
+        except FileNotFoundError:
+            pass
+        return events
+
+    def record(self, agent: str, action: str, task_id: str = None,
+               duration: float = None) -> ActivityEvent:
+        """Log an event now; `duration` is how long the action took, in seconds"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("activity log is closed")
+            self._seq += 1
+            event = ActivityEvent(self._seq, self._epoch + time.monotonic(), agent, action, task_id, duration)
+            self._insert(event)
+            if self.filename is not None:
+                if len(self._pending) == self._pending.maxlen:
+                    self.dropped += 1
+                self._pending.append(event)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="activity-log", daemon=True)
+                    self._thread.start()
+        return event
+
+    def _insert(self, event: ActivityEvent):
+        # Clamp so the time indexes stay sorted, even for events read back from disk
+        event.ts = max(event.ts, self._last_ts)
+        self._last_ts = event.ts
+        position = self._inserted
+        self._inserted += 1
+        slot = position % self.capacity
+        evicted = self._ring[slot]
+        if evicted is not None:
+            self._all.evict()
+            index = self._by_agent[evicted.agent]
+            index.evict()
+            if not index:
+                del self._by_agent[evicted.agent]
+        self._ring[slot] = event
+        self._all.append(position, event.ts)
+        self._by_agent.setdefault(event.agent, _TimeIndex()).append(position, event.ts)
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def agents(self) -> List[str]:
+        """Agents with events in the buffer"""
+        with self._cond:
+            return sorted(self._by_agent)
+
+    def query(self, agent: str = None, since: float = None, until: float = None,
+              task_id: str = None, limit: int = None) -> List[ActivityEvent]:
+        """Buffered events, newest first, optionally filtered.
+
+        `since` and `until` are epoch seconds (since <= ts < until); `agent`
+        and the time range are served from the indexes, `task_id` filters
+        what they return.
+        """
+        with self._cond:
+            index = self._all if agent is None else self._by_agent.get(agent)
+            if index is None:
+                return []
+            events = []
+            for position in reversed(index.between(since, until)):
+                event = self._ring[position % self.capacity]
+                if task_id is not None and event.task_id != task_id:
+                    continue
+                events.append(event)
+                if limit is not None and len(events) >= limit:
+                    break
+            return events
+
+    def recent(self, limit: int = 10, agent: str = None) -> List[ActivityEvent]:
+        """The newest `limit` events, newest first"""
+        return self.query(agent=agent, limit=limit)
+
+    # Persistence
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Let events gather for an interval, unless closing
+                self._cond.wait_for(lambda: self._closed, self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing activity log: {e}")
+            if closed:
+                return
+
+    def _write(self, events: List[ActivityEvent]):
+        with self._write_lock:
+            if self._file is None:
+                self._file = open(self.filename, 'a', encoding='utf-8')
+            self._file.write(''.join(json.dumps(event.to_dict()) + '\n' for event in events))
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count <= 0:
+            os.remove(self.filename)
+            return
+        for n in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.filename}.{n}"):
+                os.replace(f"{self.filename}.{n}", f"{self.filename}.{n + 1}")
+        os.replace(self.filename, f"{self.filename}.1")
+
+    def flush(self):
+        """Write pending events now"""
+        with self._cond:
+            batch = list(self._pending)
+            self._pending.clear()
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """Write pending events and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
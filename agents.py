@@ -1,26 +1,49 @@
+import asyncio
+import sys
 import uuid
+import time
 from datetime import datetime, timedelta
 import json
+from models import Task, Priority, Status, parse_timestamp
+from scoring import UrgencyScore, score_tasks, rank
+from packing import SchedulePlan
+from tags import TagDictionary
+from metrics import instrument
+from recurrence import OVERDUE_LOOKBACK, expand, is_series, make_series, next_occurrence
 
+@instrument
 class PlannerAgent:
-    """Agent responsible for creating and planning tasks"""
+    """Agent responsible for creating and planning tasks
     
-    def __init__(self):
+    `tagger` turns task text into tags: anything with `extract_tags(text)`
+    and `extract_tags_many(texts)`. The default is a `tags.TagDictionary`
+    over tags.json that falls back to the built-in tags.
+    """
+    
+    def __init__(self, tagger=None):
         self.name = "Planner"
+        self.tagger = tagger or TagDictionary()
     
-    def create_task(self, title, description, priority, due_date):
-        """Create a new task with basic planning logic"""
-        task = {
-            'id': str(uuid.uuid4()),
-            'title': title,
-            'description': description,
-            'priority': priority,
-            'due_date': due_date.isoformat(),
-            'created_date': datetime.now().isoformat(),
-            'status': 'pending',
-            'estimated_duration': self._estimate_duration(title, description),
-            'tags': self._extract_tags(title, description)
-        }
+    def create_task(self, title, description, priority, due_date, recurrence=None):
+        """Create a new task with basic planning logic
+        
+        With `recurrence` (an RRULE-like string or preset name, see
+        `recurrence.RecurrenceRule`) the task is a series starting at
+        `due_date`: stored once, its occurrences are generated on demand.
+        """
+        task = Task(
+            id=str(uuid.uuid4()),
+            title=title,
+            description=description,
+            priority=Priority(priority),
+            status=Status.PENDING,
+            due_ts=parse_timestamp(due_date),
+            created_ts=time.time(),
+            estimated_duration=self._estimate_duration(title, description),
+            tags=self._extract_tags(title, description)
+        )
+        if recurrence:
+            make_series(task, recurrence)
         return task
     
     def _estimate_duration(self, title, description):
@@ -34,135 +57,245 @@ class PlannerAgent:
             return 120  # 2 hours
     
     def _extract_tags(self, title, description):
-        """Extract simple tags from task content"""
-        common_tags = ['meeting', 'call', 'email', 'report', 'review', 'urgent', 'important']
-        content = (title + ' ' + description).lower()
-        found_tags = [tag for tag in common_tags if tag in content]
-        return found_tags
+        """Extract tags from task content"""
+        return self.tagger.extract_tags(title + ' ' + description)
+    
+    def extract_tags_many(self, tasks):
+        """Extract tags from the title and description of each task, in one batch"""
+        tasks = [Task.coerce(task) for task in tasks]
+        return self.tagger.extract_tags_many(f"{task.title} {task.description or ''}" for task in tasks)
+    
+    def tag_tasks(self, tasks):
+        """Add extracted tags to each task's own tags; returns the tasks"""
+        tasks = [Task.coerce(task) for task in tasks]
+        for task, found in zip(tasks, self.extract_tags_many(tasks)):
+            if found:
+                task.tags = tuple(dict.fromkeys(task.tags + tuple(map(sys.intern, found))))
+        return tasks
+
+@instrument
+class SimulatedLLMPlanner(PlannerAgent):
+    """Stand-in for a slow, remote (e.g. LLM-backed) planner
+    
+    `create_task` is a coroutine that waits `latency` seconds, as a network
+    call would, and then plans the task locally. For pipeline tests and
+    benchmarks.
+    """
+    
+    def __init__(self, latency=0.05, tagger=None):
+        super().__init__(tagger)
+        self.name = "LLM Planner"
+        self.latency = latency
+    
+    async def create_task(self, title, description, priority, due_date, recurrence=None):
+        await asyncio.sleep(self.latency)
+        return super().create_task(title, description, priority, due_date, recurrence)
 
+@instrument
 class SchedulerAgent:
-    """Agent responsible for scheduling and optimizing tasks"""
+    """Agent responsible for scheduling and optimizing tasks
+    
+    `formula` scores pending tasks for `optimize_schedule` (see
+    `scoring.UrgencyScore`); large task lists are scored column-wise with
+    NumPy when it is installed.
+    
+    Recurring tasks are ranked and packed as their occurrences due within
+    the next `horizon`, generated as they are needed.
+    """
     
-    def __init__(self):
+    def __init__(self, formula=None, horizon=timedelta(days=7)):
         self.name = "Scheduler"
+        self.formula = formula or UrgencyScore()
+        self.horizon = horizon
     
     def schedule_task(self, task):
         """Add scheduling intelligence to task"""
-        task['scheduled_time'] = self._calculate_optimal_time(task)
-        task['preparation_time'] = self._calculate_prep_time(task)
-        task['buffer_time'] = 15  # 15 minutes buffer
+        task = Task.coerce(task)
+        task.scheduled_ts = self._calculate_optimal_time(task)
+        task.preparation_time = self._calculate_prep_time(task)
+        task.buffer_time = 15  # 15 minutes buffer
         return task
     
     def optimize_schedule(self, tasks):
-        """Optimize the schedule of multiple tasks"""
-        # Sort by priority and due date
-        pending_tasks = [t for t in tasks if t['status'] == 'pending']
+        """Optimize the schedule of multiple tasks
         
-        # Priority scoring
-        priority_scores = {'High': 3, 'Medium': 2, 'Low': 1}
-        
-        for task in pending_tasks:
-            # Calculate urgency score
-            due_date = datetime.fromisoformat(task['due_date'])
-            days_until_due = (due_date - datetime.now()).days
-            
-            urgency_score = max(1, 5 - days_until_due)  # More urgent = higher score
-            priority_score = priority_scores[task['priority']]
-            
-            task['optimization_score'] = urgency_score + priority_score
+        A recurring task is scored by its next open occurrence.
+        """
+        tasks = [Task.coerce(t) for t in tasks]
+        now = time.time()
+        scored = []
+        series = {}
+        for task in tasks:
+            if not is_series(task):
+                scored.append(task)
+                continue
+            occurrence = next_occurrence(task, now - OVERDUE_LOOKBACK)
+            if occurrence is not None:
+                scored.append(occurrence)
+                series[occurrence.id] = task
+        score_tasks(scored, self.formula, now)
+        for task in scored:
+            if task.id in series:
+                series[task.id].optimization_score = task.optimization_score
+        return tasks
+    
+    def rank_tasks(self, tasks, top_k=None):
+        """Pending tasks ordered by optimization score, highest first
         
-        # Sort by optimization score
-        pending_tasks.sort(key=lambda x: x.get('optimization_score', 0), reverse=True)
+        Ties keep their input order. With `top_k` only the best `top_k` tasks
+        are returned, without sorting the rest.
+        """
+        now = time.time()
+        tasks = list(expand(tasks, now - OVERDUE_LOOKBACK, now + self.horizon.total_seconds()))
+        pending_tasks, scores = score_tasks(tasks, self.formula, now)
+        return [pending_tasks[i] for i in rank(scores, top_k)]
+    
+    def pack_schedule(self, tasks, working_hours=(9, 17), workdays=None, plan=None, now=None):
+        """Assign non-overlapping work slots within working hours
         
-        return tasks
+        Pending tasks are packed earliest-deadline-first into the free time
+        from `now` on; each block covers preparation, `estimated_duration`
+        and buffer, with the defaults `schedule_task` uses for missing ones.
+        Recurring tasks are packed as their upcoming occurrences.
+        `scheduled_time` is set on the Task records passed in. Returns the
+        `SchedulePlan`, which re-packs incrementally via `add`/`remove`;
+        pass `plan` to re-pack an existing one in place, keeping its hours.
+        """
+        tasks = [Task.coerce(t) for t in tasks]
+        for task in tasks:
+            if task.preparation_time is None:
+                task.preparation_time = self._calculate_prep_time(task)
+            if task.buffer_time is None:
+                task.buffer_time = 15
+        if plan is None:
+            plan = SchedulePlan(working_hours, workdays, start=now)
+        plan.pack(tasks, start=now)
+        plan.apply(tasks)
+        return plan
     
     def _calculate_optimal_time(self, task):
         """Calculate optimal time to work on task"""
-        due_date = datetime.fromisoformat(task['due_date'])
-        
         # If high priority, schedule earlier
-        if task['priority'] == 'High':
-            optimal_time = due_date - timedelta(hours=2)
-        elif task['priority'] == 'Medium':
-            optimal_time = due_date - timedelta(hours=1)
+        if task.priority is Priority.HIGH:
+            lead_time = timedelta(hours=2)
+        elif task.priority is Priority.MEDIUM:
+            lead_time = timedelta(hours=1)
         else:
-            optimal_time = due_date - timedelta(minutes=30)
+            lead_time = timedelta(minutes=30)
         
-        return optimal_time.isoformat()
+        return task.due_ts - lead_time.total_seconds()
     
     def _calculate_prep_time(self, task):
         """Calculate preparation time needed"""
-        if 'meeting' in task.get('tags', []):
+        if 'meeting' in task.tags:
             return 15  # 15 minutes prep for meetings
-        elif 'report' in task.get('tags', []):
+        elif 'report' in task.tags:
             return 30  # 30 minutes prep for reports
         else:
             return 5   # 5 minutes general prep
 
+@instrument
 class ReminderAgent:
-    """Agent responsible for managing reminders and notifications"""
+    """Agent responsible for managing reminders and notifications
     
-    def __init__(self):
+    Recurring tasks are checked occurrence by occurrence; occurrences are
+    generated lazily for the window that matters, from
+    `recurrence.OVERDUE_LOOKBACK` ago up to the longest threshold ahead.
+    
+    With `views` (a `views.TaskViews`), `check_reminders` and
+    `get_daily_summary` can be called without a task list and read the
+    memoized overdue, due-soon and today views instead of scanning.
+    """
+    
+    def __init__(self, views=None):
         self.name = "Reminder"
+        self.views = views
         self.reminder_thresholds = {
             'High': [timedelta(hours=2), timedelta(hours=1), timedelta(minutes=30)],
             'Medium': [timedelta(hours=1), timedelta(minutes=30)],
             'Low': [timedelta(minutes=30)]
         }
     
-    def check_reminders(self, tasks):
-        """Check which tasks need reminders"""
+    def check_reminders(self, tasks=None):
+        """Check which tasks need reminders
+        
+        Without `tasks`, only the overdue and due-soon views are checked, and
+        the result is memoized like a view: callers share it until the next
+        storage change or minute, so treat it as read-only.
+        """
+        if tasks is None:
+            # The viewed tasks are shared; reminder types are set on copies
+            return self.views.cached(('reminders', id(self)), lambda: self.check_reminders(
+                task.copy() for task in self.views.overdue() + self.views.due_soon(self.reminder_horizon())))
+        
         reminders = []
-        current_time = datetime.now()
+        current_time = time.time()
+        thresholds_by_priority = self.threshold_seconds()
+        default_thresholds = ((timedelta(minutes=30).total_seconds(), "due_in_0:30:00"),)
+        horizon = self.reminder_horizon()
         
-        for task in tasks:
-            if task['status'] == 'completed':
+        for task in expand(tasks, current_time - OVERDUE_LOOKBACK, current_time + horizon):
+            if task.status is Status.COMPLETED:
                 continue
                 
-            due_date = datetime.fromisoformat(task['due_date'])
-            time_until_due = due_date - current_time
+            time_until_due = task.due_ts - current_time
             
             # Check if task is overdue
-            if time_until_due.total_seconds() < 0:
-                task['reminder_type'] = 'overdue'
+            if time_until_due < 0:
+                task.set_extra('reminder_type', 'overdue')
                 reminders.append(task)
                 continue
             
             # Check reminder thresholds
-            thresholds = self.reminder_thresholds.get(task['priority'], [timedelta(minutes=30)])
+            thresholds = thresholds_by_priority.get(task.priority.label, default_thresholds)
             
-            for threshold in thresholds:
+            for threshold, reminder_type in thresholds:
                 if time_until_due <= threshold:
-                    task['reminder_type'] = f"due_in_{threshold}"
-                    if task not in reminders:
-                        reminders.append(task)
+                    task.set_extra('reminder_type', reminder_type)
+                    reminders.append(task)
                     break
         
         return reminders
     
+    def reminder_horizon(self):
+        """Seconds before its due time that a task's first reminder can fire"""
+        return max([seconds for thresholds in self.threshold_seconds().values() for seconds, _ in thresholds]
+                   + [timedelta(minutes=30).total_seconds()])
+    
+    def threshold_seconds(self):
+        """Reminder thresholds per priority as (seconds, reminder_type) pairs"""
+        return {
+            priority: tuple((threshold.total_seconds(), f"due_in_{threshold}")
+                                      for threshold in thresholds)
+            for priority, thresholds in self.reminder_thresholds.items()
+        }
+    
     def create_reminder_message(self, task):
         """Create a formatted reminder message"""
-        due_date = datetime.fromisoformat(task['due_date'])
-        current_time = datetime.now()
-        time_diff = due_date - current_time
+        task = Task.coerce(task)
+        time_diff = timedelta(seconds=task.due_ts - time.time())
         
         if time_diff.total_seconds() < 0:
             return f"⚠️ OVERDUE: '{task['title']}' was due {abs(time_diff)} ago!"
         else:
             return f"🔔 REMINDER: '{task['title']}' is due in {time_diff}!"
     
-    def get_daily_summary(self, tasks):
-        """Get daily task summary"""
-        today = datetime.now().date()
-        today_tasks = []
-        
-        for task in tasks:
-            task_date = datetime.fromisoformat(task['due_date']).date()
-            if task_date == today and task['status'] == 'pending':
-                today_tasks.append(task)
+    def get_daily_summary(self, tasks=None):
+        """Get daily task summary (from `views` without `tasks`)"""
+        if tasks is None:
+            today_tasks = self.views.today()
+        else:
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            start_of_day = today.timestamp()
+            end_of_day = (today + timedelta(days=1)).timestamp()
+            today_tasks = []
+            
+            for task in expand(tasks, start_of_day, end_of_day):
+                if start_of_day <= task.due_ts < end_of_day and task.status is Status.PENDING:
+                    today_tasks.append(task)
         
         return {
             'total_today': len(today_tasks),
-            'high_priority': len([t for t in today_tasks if t['priority'] == 'High']),
+            'high_priority': len([t for t in today_tasks if t.priority is Priority.HIGH]),
             'tasks': today_tasks
         }
\ No newline at end of file
@@ -1,27 +1,136 @@
 import streamlit as st
+import concurrent.futures
 import json
+import math
 import os
+import time
 from datetime import datetime, timedelta
 from agents import PlannerAgent, SchedulerAgent, ReminderAgent
-from storage import TaskStorage
+from storage import create_storage, VersionConflict
+from reminders import ReminderService
+from packing import SchedulePlan
+from pipeline import task_creation_pipeline
+from metrics import METRICS
+from activity import ActivityLog
+from recurrence import OVERDUE_LOOKBACK, complete_occurrence, is_series, next_occurrence, series_rule
+from views import TaskViews
 
-# Initialize storage and agents
-storage = TaskStorage()
-planner = PlannerAgent()
-scheduler = SchedulerAgent()
-reminder = ReminderAgent()
+WORKING_HOURS = (9, 17)
+PAGE_SIZE = 25
+# Completed tasks older than this many days can be moved to the archive
+ARCHIVE_AFTER_DAYS = 30
+# How long the add form waits for the agent pipeline before moving on
+ADD_TASK_WAIT = 2.0
+# Sort choice -> storage query order (priority: highest first; created: newest first)
+SORT_ORDERS = {"Due Date": 'due_date', "Priority": 'priority', "Created": 'created_date'}
+# Repeat choice -> recurrence rule; a repeating task is stored once as a series
+REPEAT_OPTIONS = {"Never": None, "Daily": 'daily', "Weekdays": 'weekdays', "Weekly": 'weekly',
+                  "Monthly": 'monthly'}
 
+# Storage and agents are created once per process and shared by every
+# session and rerun, instead of reloading the task file on each click
+@st.cache_resource
+def get_storage():
+    """Shared task storage; backend chosen via TODO_STORAGE_BACKEND"""
+    return create_storage()
+
+@st.cache_resource
+def get_views():
+    """Shared memoized day and due-soon views, invalidated by any storage change"""
+    return TaskViews(get_storage())
+
+@st.cache_resource
+def get_agents():
+    """Shared, stateless planner, scheduler and reminder agents"""
+    return PlannerAgent(), SchedulerAgent(), ReminderAgent(views=get_views())
+
+@st.cache_resource
+def get_activity_log():
+    """Shared agent activity log, persisted to activity.jsonl"""
+    return ActivityLog()
+
+@st.cache_resource
+def get_reminder_service():
+    """One reminder service per process, pushing reminders as they fall due"""
+    service = ReminderService(get_agents()[2], get_storage())
+    activity = get_activity_log()
+    service.subscribe(lambda note: activity.record(
+        'Reminder', f"{note['reminder_type']}: {note['title']}", task_id=note['task_id']))
+    service.start()
+    return service
+
+@st.cache_resource
+def get_schedule_plan():
+    """Shared work plan, re-packed incrementally as tasks are added or completed"""
+    plan = SchedulePlan(WORKING_HOURS)
+    plan.attach(get_storage())
+    return plan
+
+@st.cache_resource
+def get_pipeline():
+    """Background Planner -> Scheduler -> storage pipeline for new tasks"""
+    storage = get_storage()
+    plan = get_schedule_plan()
+    
+    def place_in_plan(tasks):
+        """Give new tasks free slots and store the tasks they push back"""
+        moved = set()
+        for task in tasks:
+            moved.update(plan.add(task))
+        plan.apply(tasks)
+        moved -= {task.id for task in tasks}
+        pushed = [storage.get_task_by_id(task_id) for task_id in moved]
+        storage.bulk_update(plan.apply([task for task in pushed if task is not None]))
+    
+    planner, scheduler, _ = get_agents()
+    pipeline = task_creation_pipeline(planner, scheduler, storage, before_write=place_in_plan)
+    pipeline.start_background()
+    return pipeline
+
+# Must be the first Streamlit command, ahead of the cached getters below
 st.set_page_config(page_title="Smart To-Do App", layout="wide")
+
+run_started = time.perf_counter()
+storage = get_storage()
+views = get_views()
+activity = get_activity_log()
+planner, scheduler, reminder = get_agents()
+reminder_service = get_reminder_service()
+schedule_plan = get_schedule_plan()
+pipeline = get_pipeline()
+
 st.title("🤖 Multi-Agent To-Do & Reminder App")
 
 # Sidebar for agent logs
 with st.sidebar:
     st.header("🔍 Agent Activity Log")
-    if 'agent_logs' not in st.session_state:
-        st.session_state.agent_logs = []
+    agent_filter = st.selectbox("Agent", ["All"] + activity.agents())
+    for event in activity.recent(10, agent=None if agent_filter == "All" else agent_filter):
+        took = f" ({event.duration * 1000:.0f} ms)" if event.duration is not None else ""
+        st.text(f"{event.time}: {event.agent} - {event.action}{took}")
     
-    for log in st.session_state.agent_logs[-10:]:  # Show last 10 logs
-        st.text(f"{log['time']}: {log['agent']} - {log['action']}")
+    # Process-wide: collecting applies to every session
+    with st.expander("🐞 Debug: Timings"):
+        if st.toggle("Collect timings", value=METRICS.enabled):
+            METRICS.enable()
+        else:
+            METRICS.disable()
+        snapshot = METRICS.snapshot()
+        if snapshot['timers']:
+            st.dataframe([
+                {'name': name, 'calls': t['count'], 'total ms': round(t['sum'] * 1000, 1),
+                 'p50 ms': round(t['p50'] * 1000, 3), 'p99 ms': round(t['p99'] * 1000, 3),
+                 'max ms': round(t['max'] * 1000, 3),
+                 'errors': snapshot['counters'].get(f"{name}.errors", 0)}
+                for name, t in sorted(snapshot['timers'].items(), key=lambda item: -item[1]['sum'])
+            ], hide_index=True)
+            st.download_button("Prometheus", METRICS.to_prometheus(), "metrics.prom", mime="text/plain")
+            st.download_button("JSON", METRICS.to_json(), "metrics.json", mime="application/json")
+            if st.button("Reset timings"):
+                METRICS.reset()
+                st.rerun()
+        elif METRICS.enabled:
+            st.caption("No calls timed yet.")
 
 # Main interface
 col1, col2 = st.columns([2, 1])
@@ -35,42 +144,44 @@ with col1:
         priority = st.selectbox("Priority", ["Low", "Medium", "High"])
         due_date = st.date_input("Due Date", min_value=datetime.now().date())
         due_time = st.time_input("Due Time")
+        repeat = st.selectbox("Repeat", list(REPEAT_OPTIONS))
         
         if st.form_submit_button("Add Task"):
             if task_title:
                 # Combine date and time
                 due_datetime = datetime.combine(due_date, due_time)
                 
-                # Create task using planner agent
-                task = planner.create_task(task_title, task_desc, priority, due_datetime)
-                
-                # Schedule task using scheduler agent
-                scheduled_task = scheduler.schedule_task(task)
-                
-                # Store task
-                storage.add_task(scheduled_task)
-                
-                # Log agent activity
-                st.session_state.agent_logs.append({
-                    'time': datetime.now().strftime("%H:%M"),
-                    'agent': 'Planner',
-                    'action': f'Created task: {task_title}'
-                })
-                st.session_state.agent_logs.append({
-                    'time': datetime.now().strftime("%H:%M"),
-                    'agent': 'Scheduler',
-                    'action': f'Scheduled task for {due_datetime.strftime("%m/%d %H:%M")}'
-                })
-                
-                st.success("Task added successfully!")
-                st.rerun()
+                # Planner, scheduler and work plan run in the agent pipeline;
+                # the write is batched with other sessions' new tasks
+                started = time.monotonic()
+                request = {'title': task_title, 'description': task_desc,
+                           'priority': priority, 'due_date': due_datetime}
+                if REPEAT_OPTIONS[repeat]:
+                    request['recurrence'] = REPEAT_OPTIONS[repeat]
+                future = pipeline.submit(request)
+                try:
+                    task = future.result(timeout=ADD_TASK_WAIT)
+                except concurrent.futures.TimeoutError:
+                    st.info("Task queued; it will appear once the agents finish.")
+                except Exception as e:
+                    st.error(f"Error adding task: {e}")
+                else:
+                    # Log agent activity; the duration covers the whole pipeline
+                    activity.record('Planner', f'Created task: {task_title}', task_id=task.id,
+                                    duration=time.monotonic() - started)
+                    activity.record('Scheduler', f'Scheduled task for {due_datetime.strftime("%m/%d %H:%M")}',
+                                    task_id=task.id)
+                    
+                    st.success("Task added successfully!")
+                    st.rerun()
 
 with col2:
     st.header("⚡ Quick Actions")
     
     if st.button("🔔 Check Reminders"):
-        tasks = storage.get_all_tasks()
-        reminders = reminder.check_reminders(tasks)
+        started = time.monotonic()
+        # Only the overdue and due-soon views are checked, not every task
+        reminders = reminder.check_reminders()
         
         if reminders:
             st.warning(f"🚨 {len(reminders)} reminders!")
@@ -80,33 +191,77 @@ with col2:
             st.success("No urgent reminders")
         
         # Log reminder check
-        st.session_state.agent_logs.append({
-            'time': datetime.now().strftime("%H:%M"),
-            'agent': 'Reminder',
-            'action': f'Checked {len(reminders)} reminders'
-        })
+        activity.record('Reminder', f'Checked {len(reminders)} reminders', duration=time.monotonic() - started)
 
     if st.button("🧹 Auto-Organize"):
-        tasks = storage.get_all_tasks()
+        started = time.monotonic()
+        tasks = [task.copy() for task in storage.get_all_tasks()]
         organized_tasks = scheduler.optimize_schedule(tasks)
+        scheduler.pack_schedule(organized_tasks, plan=schedule_plan)
         
-        for task in organized_tasks:
-            storage.update_task(task['id'], task)
-        
-        st.success("Tasks reorganized!")
-        st.session_state.agent_logs.append({
-            'time': datetime.now().strftime("%H:%M"),
-            'agent': 'Scheduler',
-            'action': 'Optimized task schedule'
-        })
+        # One batched, atomic write instead of a save per task; all or
+        # nothing if another worker changed a task in the meantime
+        try:
+            storage.bulk_update(organized_tasks)
+        except VersionConflict:
+            st.warning("Tasks changed while organizing; nothing was saved. Try again.")
+        else:
+            st.success("Tasks reorganized!")
+            activity.record('Scheduler', 'Optimized task schedule', duration=time.monotonic() - started)
+
+    st.subheader("📅 Upcoming")
+    summary = reminder.get_daily_summary()
+    due_col, week_col = st.columns(2)
+    due_col.metric("Due today", summary['total_today'], f"{summary['high_priority']} high priority",
+                   delta_color="off")
+    week_col.metric("This week", len(views.this_week()))
+    with st.expander("Next 7 days"):
+        upcoming = views.next_days(7)
+        for task in upcoming[:PAGE_SIZE]:
+            st.text(f"{datetime.fromtimestamp(task.due_ts):%a %m/%d %H:%M}  {task.title}")
+        if len(upcoming) > PAGE_SIZE:
+            st.caption(f"...and {len(upcoming) - PAGE_SIZE} more")
+        if not upcoming:
+            st.caption("Nothing due in the next 7 days.")
+
+    with st.expander("📥 Import Tasks"):
+        upload = st.file_uploader("CSV, JSON or JSONL file", type=["csv", "jsonl", "json"])
+        if upload is not None and st.button("Import"):
+            started = time.monotonic()
+            skipped = []
+            try:
+                imported = storage.import_file(upload, prepare=planner.tag_tasks, errors=skipped)
+            except Exception as e:
+                st.error(f"Import failed: {e}")
+            else:
+                st.success(f"Imported {imported} tasks")
+                activity.record('Planner', f'Imported {imported} tasks from {upload.name}',
+                                duration=time.monotonic() - started)
+            if skipped:
+                st.warning(f"Skipped {len(skipped)} invalid rows")
+                st.text("\n".join(skipped[:PAGE_SIZE]))
+
+    with st.expander("🗄️ Backup & Archive"):
+        if st.button("Back up now"):
+            if storage.backup_tasks():
+                st.success("Backup written")
+            else:
+                st.error("Backup failed")
+        if st.button(f"Archive tasks completed over {ARCHIVE_AFTER_DAYS} days ago"):
+            started = time.monotonic()
+            archived = storage.archive_completed(older_than_days=ARCHIVE_AFTER_DAYS)
+            st.success(f"Archived {archived} completed tasks")
+            activity.record('Scheduler', f'Archived {archived} completed tasks', duration=time.monotonic() - started)
 
 # Display tasks
 st.header("📋 Your Tasks")
 
-tasks = storage.get_all_tasks()
-if not tasks:
+stats = storage.get_stats()
+if not stats['total_tasks']:
     st.info("No tasks yet. Add your first task above!")
 else:
+    search_text = st.text_input("🔎 Search tasks", placeholder="Words from a title, description or tag")
+
     # Filter options
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -114,24 +269,40 @@ else:
     with col2:
         priority_filter = st.selectbox("Filter by Priority", ["All", "High", "Medium", "Low"])
     with col3:
-        sort_by = st.selectbox("Sort by", ["Due Date", "Priority", "Created"])
-
-    # Apply filters
-    filtered_tasks = tasks
-    if status_filter != "All":
-        filtered_tasks = [t for t in filtered_tasks if t['status'] == status_filter.lower()]
-    if priority_filter != "All":
-        filtered_tasks = [t for t in filtered_tasks if t['priority'] == priority_filter]
-
-    # Sort tasks
-    if sort_by == "Due Date":
-        filtered_tasks.sort(key=lambda x: x['due_date'])
-    elif sort_by == "Priority":
-        priority_order = {"High": 3, "Medium": 2, "Low": 1}
-        filtered_tasks.sort(key=lambda x: priority_order[x['priority']], reverse=True)
+        # Search results come best match first
+        sort_by = st.selectbox("Sort by", ["Due Date", "Priority", "Created"], disabled=bool(search_text))
+
+    # Filter, sort or search, and page through the storage indexes; only
+    # the visible page is fetched and rendered
+    query = {
+        'status': None if status_filter == "All" else status_filter.lower(),
+        'priority': None if priority_filter == "All" else priority_filter,
+    }
+
+    def fetch(**page_args):
+        if search_text:
+            return storage.search(search_text, **query, **page_args)
+        return storage.query(**query, sort_by=SORT_ORDERS[sort_by], **page_args)
+
+    # One fetch gives both the page and the total; the page number is
+    # clamped afterwards, refetching only when it fell past the last page
+    page_key = f"task_page_{status_filter}_{priority_filter}_{search_text}"
+    page = st.session_state.get(page_key, 1)
+    page_tasks, matching = fetch(offset=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE)
+    pages = max(1, math.ceil(matching / PAGE_SIZE))
+    if page > pages:
+        page = st.session_state[page_key] = pages
+        page_tasks, matching = fetch(offset=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE)
+    st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    if search_text and not matching:
+        st.caption("No tasks match your search.")
+    if page_tasks:
+        first = (page - 1) * PAGE_SIZE + 1
+        st.caption(f"Showing {first}-{first + len(page_tasks) - 1} of {matching} tasks")
 
     # Display tasks
-    for task in filtered_tasks:
+    render_started = time.perf_counter()
+    for task in page_tasks:
         with st.container():
             col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
             
@@ -143,23 +314,41 @@ else:
                 if task['description']:
                     st.caption(task['description'])
                 
-                # Check if overdue
-                due_dt = datetime.fromisoformat(task['due_date'])
-                if due_dt < datetime.now() and task['status'] != 'completed':
+                # Check if overdue; a recurring task by its next open occurrence
+                occurrence = None
+                if is_series(task):
+                    st.caption(f"🔁 Repeats {series_rule(task).describe()}")
+                    occurrence = next_occurrence(task, time.time() - OVERDUE_LOOKBACK)
+                due_dt = datetime.fromtimestamp((occurrence or task).due_ts)
+                if is_series(task) and occurrence is None:
+                    st.caption("No open occurrences left")
+                elif due_dt < datetime.now() and task['status'] != 'completed':
                     st.error(f"⚠️ Overdue by {datetime.now() - due_dt}")
                 else:
                     st.caption(f"Due: {due_dt.strftime('%m/%d/%Y %H:%M')}")
             
             with col2:
                 if st.button("✓", key=f"complete_{task['id']}", help="Mark Complete"):
-                    task['status'] = 'completed'
-                    task['completed_date'] = datetime.now().isoformat()
-                    storage.update_task(task['id'], task)
-                    st.rerun()
+                    # Edit a copy: the listed tasks are shared with other sessions
+                    if occurrence is not None:
+                        # Only this occurrence is done; the series goes on
+                        completed = complete_occurrence(task, occurrence.extra['occurrence'])
+                    else:
+                        completed = task.copy()
+                        completed['status'] = 'completed'
+                        completed['completed_date'] = datetime.now().isoformat()
+                    try:
+                        storage.update_task(task['id'], completed)
+                    except VersionConflict:
+                        st.warning("This task was just changed elsewhere; check it and try again.")
+                    else:
+                        st.rerun()
             
             with col3:
                 if st.button("✏️", key=f"edit_{task['id']}", help="Edit Task"):
                     st.session_state[f"edit_task_{task['id']}"] = True
+                    # Saving is checked against the version being edited
+                    st.session_state[f"edit_version_{task['id']}"] = task.version
             
             with col4:
                 if st.button("🗑️", key=f"delete_{task['id']}", help="Delete Task"):
@@ -178,40 +367,59 @@ else:
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.form_submit_button("Save Changes"):
-                            task['title'] = new_title
-                            task['description'] = new_desc
-                            task['priority'] = new_priority
-                            storage.update_task(task['id'], task)
-                            st.session_state[f"edit_task_{task['id']}"] = False
-                            st.rerun()
+                            edited = task.copy()
+                            edited['title'] = new_title
+                            edited['description'] = new_desc
+                            edited['priority'] = new_priority
+                            try:
+                                storage.update_task(task['id'], edited, expected_version=st.session_state.get(
+                                    f"edit_version_{task['id']}"))
+                            except VersionConflict as e:
+                                # A second save is a deliberate overwrite
+                                st.session_state[f"edit_version_{task['id']}"] = e.actual
+                                st.warning("Someone else changed this task while you were editing. "
+                                           "Save again to overwrite their changes, or cancel.")
+                            else:
+                                st.session_state[f"edit_task_{task['id']}"] = False
+                                st.rerun()
                     with col2:
                         if st.form_submit_button("Cancel"):
                             st.session_state[f"edit_task_{task['id']}"] = False
                             st.rerun()
             
             st.divider()
+    METRICS.observe('app.render_task_list', time.perf_counter() - render_started)
 
 # Statistics
-if tasks:
+if stats['total_tasks']:
     st.header("📊 Statistics")
     col1, col2, col3, col4 = st.columns(4)
     
-    total_tasks = len(tasks)
-    completed_tasks = len([t for t in tasks if t['status'] == 'completed'])
-    pending_tasks = total_tasks - completed_tasks
-    overdue_tasks = len([t for t in tasks if datetime.fromisoformat(t['due_date']) < datetime.now() 
-                        and t['status'] != 'completed'])
+    col1.metric("Total Tasks", stats['total_tasks'])
+    col2.metric("Completed", stats['completed_tasks'])
+    col3.metric("Pending", stats['pending_tasks'])
+    col4.metric("Overdue", stats['overdue_tasks'])
     
-    col1.metric("Total Tasks", total_tasks)
-    col2.metric("Completed", completed_tasks)
-    col3.metric("Pending", pending_tasks)
-    col4.metric("Overdue", overdue_tasks)
+    if stats['search_index_bytes']:
+        st.caption(f"Search index: {stats['search_index_bytes'] / 2 ** 20:.1f} MiB")
 
-# Auto-refresh for reminders (every 60 seconds)
+    histogram = storage.get_completion_histogram(days=14)
+    st.bar_chart({
+        'Day': [day.strftime('%m/%d') for day in histogram],
+        'Completed': list(histogram.values())
+    }, x='Day', y='Completed')
+
+# Auto-refresh for reminders: the reminder service pushes notifications in
+# the background (and logs them), this fragment only polls for new ones
 if st.button("🔄 Auto-Refresh Reminders"):
     st.session_state.auto_refresh = True
 
-if st.session_state.get('auto_refresh', False):
-    import time
-    time.sleep(60)  # Wait 60 seconds
-    st.rerun()
\ No newline at end of file
+@st.fragment(run_every=10 if st.session_state.get('auto_refresh', False) else None)
+def reminder_feed():
+    last_seq = st.session_state.get('last_reminder_seq', 0)
+    for note in reminder_service.notifications_since(last_seq):
+        st.toast(note['message'])
+        st.session_state.last_reminder_seq = note['seq']
+
+reminder_feed()
+METRICS.observe('app.run', time.perf_counter() - run_started)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import itertools
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from models import Task, task_to_json
+from streams import iter_json_file, open_stream
+
+# First line of a backup: {"__backup__": "full" | "diff", ...}
+HEADER_KEY = '__backup__'
+# Characters `read_header` reads; headers are far smaller, task files can be one huge line
+MAX_HEADER_SIZE = 1 << 16
+
+
+def task_line(task) -> str:
+    """One task (record or dict) as a JSON line, without the newline"""
+    return json.dumps(task, default=task_to_json)
+
+
+def task_rows(tasks: Iterable) -> Iterator[Tuple[str, str]]:
+    """(id, JSON line) pairs for tasks, as `write_backup` takes them"""
+    for task in tasks:
+        yield task['id'], task_line(task)
+
+
+def read_header(filename) -> Dict:
+    """The header of a JSONL backup; {} for a plain task file or JSON array"""
+    with open_stream(filename) as f:
+        line = f.readline(MAX_HEADER_SIZE)
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return {}
+    return header if isinstance(header, dict) and HEADER_KEY in header else {}
+
+
+def _base_rows(filename) -> Iterator[Tuple[str, str]]:
+    """(id, line) pairs of a full backup, in the file's (id) order"""
+    with open_stream(filename) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                task = json.loads(line)
+                if HEADER_KEY not in task:
+                    yield task['id'], line
+
+
+def _diff(base: Iterator[Tuple[str, str]], current: Iterator[Tuple[str, str]]) -> Iterator[str]:
+    """Change records turning `base` into `current`, both sorted by id, as JSON lines"""
+    old = next(base, None)
+    new = next(current, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield json.dumps({'op': 'delete', 'id': old[0]})
+            old = next(base, None)
+        else:
+            if old is None or new[0] < old[0]:
+                yield f'{{"op": "add", "task": {new[1]}}}'
+            else:
+                if new[1] != old[1]:
+                    yield f'{{"op": "update", "task": {new[1]}}}'
+                old = next(base, None)
+            new = next(current, None)
+
+
+def _checked_order(rows: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    last = None
+    for row in rows:
+        if last is not None and row[0] <= last:
+            raise ValueError(f"backup rows are not sorted by id ({row[0]!r} after {last!r})")
+        last = row[0]
+        yield row
+
+
+def write_backup(filename, rows: Iterable[Tuple[str, str]], base: Optional[str] = None) -> int:
+    """Stream a JSONL backup (gzip or zstd by extension); returns the number of lines.
+
+    `rows` are (id, JSON line) pairs sorted by id, e.g. `task_rows` over
+    sorted tasks. A full backup holds every task. With `base`, a full
+    backup, only the changes since it are written, as add/update/delete
+    log records: a differential backup, restored together with its base.
+    Either way one task at a time is in memory, and the file only replaces
+    `filename` once it is complete.
+    """
+    rows = _checked_order(rows)
+    header = {HEADER_KEY: 'full', 'created': time.time()}
+    if base is not None:
+        if read_header(base).get(HEADER_KEY) != 'full':
+            raise ValueError(f"{base} is not a full backup")
+        base_path = os.path.relpath(base, os.path.dirname(os.path.abspath(filename)))
+        header.update({HEADER_KEY: 'diff', 'base': base_path})
+        lines = _diff(_base_rows(base), rows)
+    else:
+        lines = (line for _, line in rows)
+
+    count = 0
+    with open_stream(filename, 'w', atomic=True) as f:
+        f.write(json.dumps(header) + '\n')
+        for line in lines:
+            f.write(line + '\n')
+            count += 1
+    return count
+
+
+def iter_backup(filename) -> Iterator[Dict]:
+    """Yield the task dicts a backup restores to, one at a time.
+
+    Reads full and differential JSONL backups (plain or compressed) as well
+    as plain JSON or JSONL task files. A differential backup is merged with
+    its base as both are read.
+    """
+    header = read_header(filename)
+    if header.get(HEADER_KEY) != 'diff':
+        for task in iter_json_file(filename):
+            if HEADER_KEY not in task:
+                yield task
+        return
+
+    base = os.path.join(os.path.dirname(os.path.abspath(filename)), header['base'])
+    tasks = iter_backup(base)
+    task = next(tasks, None)
+    for record in iter_json_file(filename):
+        if HEADER_KEY in record:
+            continue
+        record_id = record['id'] if record['op'] == 'delete' else record['task']['id']
+        while task is not None and task['id'] < record_id:
+            yield task
+            task = next(tasks, None)
+        if task is not None and task['id'] == record_id:
+            task = next(tasks, None)
+        if record['op'] != 'delete':
+            yield record['task']
+    while task is not None:
+        yield task
+        task = next(tasks, None)
+
+
+def archive_tasks(filename, tasks: Iterable) -> int:
+    """Append tasks to a JSONL archive (plain or compressed) and sync it; returns the count"""
+    tasks = iter(tasks)
+    first = next(tasks, None)
+    if first is None:
+        return 0
+    count = 0
+    with open_stream(filename, 'a') as f:
+        for task in itertools.chain((first,), tasks):
+            f.write(task_line(task) + '\n')
+            count += 1
+    return count
+
+
+def iter_archive(filename) -> Iterator[Task]:
+    """Yield the Task records of an archive, one at a time"""
+    if not os.path.exists(filename):
+        return
+    for task in iter_json_file(filename):
+        yield Task.from_dict(task)
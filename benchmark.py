@@ -0,0 +1,687 @@
+"""Micro-benchmarks for storage and agent hot paths.
+
+Usage:
+    python benchmark.py                      # run every benchmark
+    python benchmark.py indexes --sizes 10000 100000
+    python benchmark.py ops --samples 5000   # ops/sec and p50/p99 per operation
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict
+
+from activity import ActivityLog
+from agents import SchedulerAgent, ReminderAgent, SimulatedLLMPlanner
+from engines import JSONFileEngine, MemoryEngine, _write_json_atomic
+from metrics import METRICS
+from models import Task, Status
+from pipeline import task_creation_pipeline
+from recurrence import make_series
+from reminders import ReminderScheduler
+from scoring import numpy, rank, score_tasks
+from storage import TaskStorage, VersionConflict, create_storage
+from tags import TagAutomaton
+from views import TaskViews
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under `name`"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def make_tasks(count: int, seed: int = 42) -> List[Dict]:
+    """Generate a reproducible synthetic task set"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    priorities = ['High', 'Medium', 'Low']
+    tags = ['meeting', 'call', 'email', 'report', 'review', 'urgent', 'important']
+    tasks = []
+    for i in range(count):
+        due = now + timedelta(minutes=rng.randint(-30 * 24 * 60, 30 * 24 * 60))
+        tasks.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'title': f"Task {i}",
+            'description': f"Synthetic task number {i}",
+            'priority': rng.choice(priorities),
+            'due_date': due.isoformat(),
+            'created_date': (now - timedelta(days=rng.randint(0, 60))).isoformat(),
+            'status': 'completed' if rng.random() < 0.3 else 'pending',
+            'estimated_duration': rng.choice([30, 60, 120]),
+            'tags': rng.sample(tags, rng.randint(0, 2)),
+        })
+    return tasks
+
+
+def timed(func, repeat: int = 5) -> float:
+    """Best-of-`repeat` wall time of `func()` in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def latencies(func, count: int) -> List[float]:
+    """Wall time of `func(i)` for i in range(count), in seconds, sorted"""
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """The `q` quantile of sorted samples (nearest rank)"""
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def report(rows: List[tuple], headers: tuple):
+    widths = [max(len(str(v)) for v in col) for col in zip(headers, *rows)]
+    line = "  ".join(f"{{:>{w}}}" for w in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
+
+
+# Linear-scan reference implementations (the pre-index TaskStorage code)
+
+def _scan_by_id(tasks, task_id):
+    for task in tasks:
+        if task['id'] == task_id:
+            return task
+    return None
+
+
+def _scan_by_status(tasks, status):
+    return [task for task in tasks if task['status'] == status]
+
+
+def _scan_overdue(tasks):
+    current_time = datetime.now()
+    return [task for task in tasks
+            if task['status'] != 'completed'
+            and datetime.fromisoformat(task['due_date']) < current_time]
+
+
+@benchmark("indexes")
+def bench_indexes(sizes):
+    """Indexed TaskStorage lookups vs. the old linear scans"""
+    rows = []
+    for size in sizes:
+        tasks = make_tasks(size)
+        storage = TaskStorage(engine=MemoryEngine(tasks))
+        probe = tasks[len(tasks) // 2]['id']
+
+        rows.append((size, "get_task_by_id",
+                     f"{timed(lambda: _scan_by_id(tasks, probe)):.3f}",
+                     f"{timed(lambda: storage.get_task_by_id(probe)):.3f}"))
+        rows.append((size, "get_tasks_by_status",
+                     f"{timed(lambda: _scan_by_status(tasks, 'completed')):.3f}",
+                     f"{timed(lambda: storage.get_tasks_by_status('completed')):.3f}"))
+        rows.append((size, "get_overdue_tasks",
+                     f"{timed(lambda: _scan_overdue(tasks), repeat=2):.3f}",
+                     f"{timed(storage.get_overdue_tasks, repeat=2):.3f}"))
+    report(rows, ("tasks", "operation", "scan ms", "indexed ms"))
+
+
+def _scan_page(storage, status, offset, limit):
+    """The old task list: copy everything, filter, sort by due date, slice"""
+    tasks = [t for t in storage.get_all_tasks() if t.status.label == status]
+    tasks.sort(key=lambda t: (t.due_ts is None, t.due_ts or 0))
+    return tasks[offset:offset + limit]
+
+
+@benchmark("query")
+def bench_query(sizes):
+    """One 25-task page of the task list: filter and sort in the app vs. storage.query"""
+    rows = []
+    for size in sizes:
+        storage = TaskStorage(engine=MemoryEngine(make_tasks(size)))
+        for offset in (0, size // 2):
+            rows.append((size, offset,
+                         f"{timed(lambda: _scan_page(storage, 'pending', offset, 25), 2):.3f}",
+                         f"{timed(lambda: storage.query(status='pending', offset=offset, limit=25)):.3f}"))
+    report(rows, ("tasks", "offset", "scan ms", "query ms"))
+
+
+# Dict-based agent passes as they were before Task records
+
+def _legacy_check_reminders(tasks, reminder_thresholds):
+    reminders = []
+    current_time = datetime.now()
+    for task in tasks:
+        if task['status'] == 'completed':
+            continue
+        time_until_due = datetime.fromisoformat(task['due_date']) - current_time
+        if time_until_due.total_seconds() < 0:
+            reminders.append(task)
+            continue
+        for threshold in reminder_thresholds.get(task['priority'], [timedelta(minutes=30)]):
+            if time_until_due <= threshold:
+                reminders.append(task)
+                break
+    return reminders
+
+
+def _legacy_optimize_schedule(tasks):
+    priority_scores = {'High': 3, 'Medium': 2, 'Low': 1}
+    pending_tasks = [t for t in tasks if t['status'] == 'pending']
+    for task in pending_tasks:
+        days_until_due = (datetime.fromisoformat(task['due_date']) - datetime.now()).days
+        task['optimization_score'] = max(1, 5 - days_until_due) + priority_scores[task['priority']]
+    pending_tasks.sort(key=lambda x: x.get('optimization_score', 0), reverse=True)
+    return tasks
+
+
+def _legacy_daily_summary(tasks):
+    today = datetime.now().date()
+    return [t for t in tasks
+            if datetime.fromisoformat(t['due_date']).date() == today and t['status'] == 'pending']
+
+
+def _allocated_bytes(build) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+@benchmark("records")
+def bench_records(sizes):
+    """Memory per task and agent pass time: dict tasks vs. Task records"""
+    scheduler = SchedulerAgent()
+    reminder = ReminderAgent()
+    rows = []
+    for size in sizes:
+        dicts = make_tasks(size)
+        records = [Task.from_dict(t) for t in dicts]
+
+        blob = json.dumps(dicts)
+        dict_bytes = _allocated_bytes(lambda: json.loads(blob))
+        task_bytes = _allocated_bytes(lambda: [Task.from_dict(t) for t in json.loads(blob)])
+        rows.append((size, "bytes per task", dict_bytes // size, task_bytes // size))
+
+        rows.append((size, "check_reminders ms",
+                     f"{timed(lambda: _legacy_check_reminders(dicts, reminder.reminder_thresholds), 2):.1f}",
+                     f"{timed(lambda: reminder.check_reminders(records), 2):.1f}"))
+        rows.append((size, "optimize_schedule ms",
+                     f"{timed(lambda: _legacy_optimize_schedule(dicts), 2):.1f}",
+                     f"{timed(lambda: scheduler.optimize_schedule(records), 2):.1f}"))
+        rows.append((size, "get_daily_summary ms",
+                     f"{timed(lambda: _legacy_daily_summary(dicts), 2):.1f}",
+                     f"{timed(lambda: reminder.get_daily_summary(records), 2):.1f}"))
+    report(rows, ("tasks", "measure", "dict", "Task"))
+
+
+@benchmark("reminders")
+def bench_reminders(sizes):
+    """Reminder tick: full check_reminders pass vs. due-time heap"""
+    reminder = ReminderAgent()
+    rows = []
+    for size in sizes:
+        records = [Task.from_dict(t) for t in make_tasks(size)]
+        scheduler = ReminderScheduler(reminder.threshold_seconds())
+        start = time.time()
+
+        build_ms = timed(lambda: scheduler.rebuild(records, now=start), repeat=1)
+        scheduler.pop_due(start)  # initial burst of already-due reminders
+        ticks = iter(range(1, 10_000))
+
+        def tick():
+            return scheduler.pop_due(start + 60 * next(ticks))
+
+        rows.append((size, f"{timed(lambda: reminder.check_reminders(records), 2):.2f}",
+                     f"{timed(tick, 20):.3f}", f"{build_ms:.1f}", len(scheduler)))
+    report(rows, ("tasks", "poll ms", "heap tick ms", "heap build ms", "heap entries"))
+
+
+@benchmark("scoring")
+def bench_scoring(sizes):
+    """optimize_schedule scoring and ranking: Python loop vs. NumPy columns"""
+    if numpy is None:
+        print("NumPy is not installed; only the Python path is available")
+        return
+    rows = []
+    for size in sizes:
+        records = [Task.from_dict(t) for t in make_tasks(size)]
+        now = time.time()
+
+        def python_full():
+            pending, _ = score_tasks(records, now=now, vectorize=False)
+            pending.sort(key=lambda x: x.optimization_score, reverse=True)
+
+        def numpy_full():
+            _, scores = score_tasks(records, now=now, vectorize=True)
+            rank(scores)
+
+        def numpy_top():
+            _, scores = score_tasks(records, now=now, vectorize=True)
+            rank(scores, 20)
+
+        rows.append((size, f"{timed(python_full, 3):.1f}", f"{timed(numpy_full, 3):.1f}",
+                     f"{timed(numpy_top, 3):.1f}"))
+    report(rows, ("tasks", "python ms", "numpy full rank ms", "numpy top-20 ms"))
+
+
+@benchmark("tags")
+def bench_tags(sizes):
+    """Tag extraction with a 5,000-keyword dictionary: substring scan per keyword vs. automaton"""
+    keywords = [f"prj-{i}" for i in range(4000)] + [f"word{i}" for i in range(1000)]
+    automaton = TagAutomaton({keyword: [] for keyword in keywords})
+    rows = []
+    for size in sizes:
+        texts = [f"{t['title']} {t['description']} prj-{i % 5000}" for i, t in enumerate(make_tasks(size))]
+        sample = texts[:max(1, size // 100)]
+
+        def scan():
+            for text in sample:
+                content = text.lower()
+                [keyword for keyword in keywords if keyword in content]
+
+        per_task_scan = timed(scan, 1) / len(sample)
+        rows.append((size, f"{per_task_scan * size:.1f}",
+                     f"{timed(lambda: [automaton.extract(text) for text in texts], 1):.1f}"))
+    report(rows, ("tasks", "scan ms (extrapolated)", "automaton ms"))
+
+
+@benchmark("pipeline")
+def bench_pipeline(sizes):
+    """Queued task creations with a 10 ms planner: one at a time vs. the agent pipeline"""
+    planner, scheduler = SimulatedLLMPlanner(latency=0.01), SchedulerAgent()
+    due = datetime.now() + timedelta(days=3)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            count = min(size, 20_000)  # the sequential side sleeps 10 ms per task
+            requests = [{'title': f"Task {i}", 'description': "Review the weekly report",
+                         'priority': 'Medium', 'due_date': due} for i in range(count)]
+
+            async def sequential():
+                storage = TaskStorage(os.path.join(tmp, f"seq_{size}.json"))
+                for request in requests[:200]:
+                    storage.add_task(scheduler.schedule_task(await planner.create_task(**request)))
+                storage.close()
+
+            async def pipelined(concurrency):
+                storage = TaskStorage(os.path.join(tmp, f"pipe_{size}_{concurrency}.json"))
+                async with task_creation_pipeline(planner, scheduler, storage,
+                                                  planner_concurrency=concurrency) as pipeline:
+                    futures = [await pipeline.put(request) for request in requests]
+                    await asyncio.gather(*futures)
+                storage.close()
+
+            per_task = timed(lambda: asyncio.run(sequential()), 1) / 200
+            row = [count, f"{1000 / per_task:.0f}"]
+            for concurrency in (16, 128):
+                elapsed = timed(lambda: asyncio.run(pipelined(concurrency)), 1)
+                row.append(f"{count / elapsed * 1000:.0f}")
+            rows.append(tuple(row))
+    report(rows, ("tasks", "sequential tasks/s", "pipeline x16 tasks/s", "pipeline x128 tasks/s"))
+
+
+def _contention_worker(backend, filename, worker, count):
+    """One process: add `count` tasks and bump the shared counter as often, retrying on conflict"""
+    storage = create_storage(backend, filename)
+    conflicts = 0
+    for i in range(count):
+        storage.add_task({'id': f"w{worker}-{i}", 'title': f"Worker {worker} task {i}"})
+        while True:
+            counter = storage.get_task_by_id('counter')
+            counter['count'] = counter.get('count', 0) + 1
+            try:
+                storage.update_task('counter', counter)
+                break
+            except VersionConflict:
+                conflicts += 1
+    storage.close()
+    return conflicts
+
+
+@benchmark("contention")
+def bench_contention(sizes):
+    """Processes sharing one task file: lost writes and throughput under contention"""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            operations = min(size, 2000)  # adds plus counter updates per run
+            for backend in ('log', 'json'):
+                for processes in (2, 8):
+                    filename = os.path.join(tmp, f"{backend}_{size}_{processes}.json")
+                    setup = create_storage(backend, filename)
+                    setup.add_task({'id': 'counter', 'title': "Shared counter", 'count': 0})
+                    setup.close()
+                    per_process = operations // (2 * processes)
+
+                    start = time.perf_counter()
+                    with multiprocessing.Pool(processes) as pool:
+                        conflicts = sum(pool.starmap(_contention_worker, [
+                            (backend, filename, worker, per_process) for worker in range(processes)]))
+                    elapsed = time.perf_counter() - start
+
+                    check = create_storage(backend, filename)
+                    expected = processes * per_process
+                    lost = (expected - (len(check.get_all_tasks()) - 1)
+                            + expected - check.get_task_by_id('counter')['count'])
+                    check.close()
+                    rows.append((2 * expected, backend, processes, f"{2 * expected / elapsed:.0f}",
+                                 conflicts, lost))
+    report(rows, ("writes", "engine", "processes", "writes/s", "CAS retries", "lost writes"))
+
+
+def _peak_bytes(func) -> int:
+    """Peak traced allocation of one `func()` call, in bytes"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _legacy_restore(storage, filename):
+    with open(filename, 'r') as f:
+        storage.tasks = [Task.from_dict(task) for task in json.load(f)]
+    storage.index.rebuild(storage.tasks)
+    storage._notify('reset')
+
+
+@benchmark("backup")
+def bench_backup(sizes):
+    """Backup and restore: whole-file JSON vs. streaming (differential) JSONL"""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            storage = TaskStorage(engine=MemoryEngine(make_tasks(size)))
+            legacy = os.path.join(tmp, "backup.json")
+            full = os.path.join(tmp, "backup.jsonl.gz")
+            diff = os.path.join(tmp, "backup_diff.jsonl.gz")
+            runs = [
+                ("backup", "json", lambda: _write_json_atomic(legacy, storage.tasks)),
+                ("backup", "jsonl.gz", lambda: storage.backup_tasks(full)),
+            ]
+            for name, fmt, func in runs:
+                filename = legacy if fmt == "json" else full
+                rows.append((size, name, fmt, f"{timed(func, 1):.0f}", _peak_bytes(func) // 1024,
+                             os.path.getsize(filename) // 1024))
+
+            # 1% of the tasks change between the full and the differential backup
+            for task in storage.get_all_tasks()[::100]:
+                task = task.copy()
+                task['title'] += " (edited)"
+                storage.update_task(task['id'], task)
+            backup_diff = lambda: storage.backup_tasks(diff, base=full)
+            rows.append((size, "backup", "diff", f"{timed(backup_diff, 1):.0f}", _peak_bytes(backup_diff) // 1024,
+                         os.path.getsize(diff) // 1024))
+
+            for fmt, func in (("json", lambda: _legacy_restore(storage, legacy)),
+                              ("jsonl.gz", lambda: storage.restore_from_backup(full)),
+                              ("diff", lambda: storage.restore_from_backup(diff))):
+                rows.append((size, "restore", fmt, f"{timed(func, 1):.0f}", _peak_bytes(func) // 1024, ""))
+            storage.close()
+    report(rows, ("tasks", "step", "format", "ms", "peak KiB", "file KiB"))
+
+
+@benchmark("ops")
+def bench_ops(sizes, samples=1000):
+    """Storage and agent operations on a task file: ops/sec and p50/p99 latency"""
+    scheduler = SchedulerAgent()
+    reminder = ReminderAgent()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            filename = os.path.join(tmp, f"ops_{size}.json")
+            JSONFileEngine(filename).write_snapshot(make_tasks(size))
+            storage = TaskStorage(filename)
+            new_tasks = make_tasks(samples, seed=7)
+            ids = [task['id'] for task in random.Random(1).sample(storage.get_all_tasks(), min(samples, size))]
+            pages = max(1, size // 2 // 25)
+
+            def update(i):
+                task = storage.get_task_by_id(ids[i % len(ids)])
+                task['title'] += "!"
+                storage.update_task(task['id'], task)
+
+            # Whole-list agent passes get fewer samples on large sets
+            passes = max(3, min(samples, 200_000 // size))
+            ops = [
+                ("add", lambda i: storage.add_task(new_tasks[i]), samples),
+                ("update", update, samples),
+                ("query", lambda i: storage.query(status='pending', sort_by='priority',
+                                                  offset=(i % pages) * 25, limit=25), samples),
+                ("optimize", lambda i: scheduler.optimize_schedule(storage.get_all_tasks()), passes),
+                ("reminders", lambda i: reminder.check_reminders(storage.get_all_tasks()), passes),
+            ]
+            for name, func, count in ops:
+                timings = latencies(func, count)
+                rows.append((size, name, count, f"{count / sum(timings):,.0f}",
+                             f"{percentile(timings, 0.5) * 1000:.3f}", f"{percentile(timings, 0.99) * 1000:.3f}"))
+            storage.close()
+    report(rows, ("tasks", "operation", "samples", "ops/s", "p50 ms", "p99 ms"))
+
+
+@benchmark("metrics")
+def bench_metrics(sizes, samples=1000):
+    """Instrumentation overhead per storage call: collection off vs. on"""
+    rows = []
+    for size in sizes:
+        storage = TaskStorage(engine=MemoryEngine(make_tasks(size)))
+        ids = [task['id'] for task in storage.get_all_tasks()[:1000]]
+
+        def lookups():
+            for task_id in ids:
+                storage.get_task_by_id(task_id)
+
+        was_enabled = METRICS.enabled
+        METRICS.disable()
+        off = timed(lookups, 20) / len(ids) * 1e6
+        METRICS.enable()
+        on = timed(lookups, 20) / len(ids) * 1e6
+        if not was_enabled:
+            METRICS.disable()
+        METRICS.reset()
+        rows.append((size, f"{off:.0f}", f"{on:.0f}", f"{on - off:.0f}"))
+        storage.close()
+    report(rows, ("tasks", "get_task_by_id off ns", "on ns", "overhead ns"))
+
+
+@benchmark("recurring")
+def bench_recurring(sizes):
+    """Recurring tasks: a year of bulk-inserted copies vs. one stored series each"""
+    reminder = ReminderAgent()
+    rows = []
+    for size in sizes:
+        base = [Task.from_dict(t) for t in make_tasks(size)]
+        first = (datetime.now() - timedelta(days=30)).timestamp()
+        copies = []
+        series = []
+        for task in base:
+            task.status = Status.PENDING
+            task.due_ts = first + (task.due_ts % 86400)
+            for day in range(365):
+                copy = task.copy()
+                copy.id = f"{task.id}-{day}"
+                copy.due_ts = task.due_ts + day * 86400
+                copies.append(copy)
+            series.append(make_series(task.copy(), 'daily'))
+        for label, tasks in (("copies", copies), ("series", series)):
+            rows.append((size, label, len(tasks), len(json.dumps(tasks, default=Task.to_dict)) // 1024,
+                         f"{timed(lambda: reminder.check_reminders(tasks), 2):.2f}",
+                         f"{timed(lambda: reminder.get_daily_summary(tasks), 2):.2f}"))
+    report(rows, ("series", "stored as", "records", "JSON KiB", "check_reminders ms", "daily summary ms"))
+
+
+@benchmark("views")
+def bench_views(sizes):
+    """Daily summary, reminders and next-7-days: full scans vs. memoized calendar views"""
+    rows = []
+    for size in sizes:
+        storage = TaskStorage(engine=MemoryEngine([Task.from_dict(t) for t in make_tasks(size)]))
+        views = TaskViews(storage)
+        scan, viewed = ReminderAgent(), ReminderAgent(views)
+        tasks = storage.get_all_tasks()
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        week_end = (today + timedelta(days=7)).timestamp()
+
+        def scan_week():
+            return sorted((t for t in tasks if t.status is Status.PENDING
+                           and today.timestamp() <= t.due_ts < week_end), key=lambda t: t.due_ts)
+
+        def touch():
+            # Any mutation bumps the storage generation
+            task = tasks[0].copy()
+            task.version = None
+            storage.update_task(task.id, task)
+
+        for label, full, cached in (
+                ("daily summary", lambda: scan.get_daily_summary(tasks), viewed.get_daily_summary),
+                ("check_reminders", lambda: scan.check_reminders(tasks), viewed.check_reminders),
+                ("next 7 days", scan_week, lambda: views.next_days(7))):
+            def cold():
+                touch()
+                return cached()
+            rows.append((size, label, f"{timed(full):.3f}", f"{timed(cold) - timed(touch):.3f}",
+                         f"{timed(cached):.4f}"))
+    report(rows, ("tasks", "view", "scan ms", "view miss ms", "view hit ms"))
+
+
+SEARCH_PAGE = 20
+
+
+def _scan_search(tasks, query):
+    words = query.lower().split()
+    matches = [t for t in tasks
+               if all(w in ' '.join((t.title, t.description, *t.tags)).lower() for w in words)]
+    return matches[:SEARCH_PAGE], len(matches)
+
+
+@benchmark("search")
+def bench_search(sizes):
+    """Full-text search: substring scan vs. inverted index (top 20 by BM25, with and without filters)"""
+    rows = []
+    for size in sizes:
+        storage = TaskStorage(engine=MemoryEngine([Task.from_dict(t) for t in make_tasks(size)]))
+        tasks = storage.get_all_tasks()
+        start = time.perf_counter()
+        storage.search('warm up')
+        build_ms = (time.perf_counter() - start) * 1000
+        rows.append((size, "build index", "", f"{build_ms:.0f}", ""))
+        for query, filters in (("report", {}), ("urgent review", {}), (f"task {size // 3}", {}),
+                               ("number 12", {}), ("synthetic", {}),
+                               ("report", {'status': 'pending', 'priority': 'High'})):
+            label = query + (" (pending, High)" if filters else "")
+            _, total = storage.search(query, **filters, limit=SEARCH_PAGE)
+            scan = ((lambda q=query: _scan_search(tasks, q)) if not filters else
+                    (lambda q=query: _scan_search([t for t in tasks if t.status is Status.PENDING
+                                                   and t.priority.label == 'High'], q)))
+            rows.append((size, label, f"{timed(scan, 1):.1f}",
+                         f"{timed(lambda q=query, f=filters: storage.search(q, **f, limit=SEARCH_PAGE)):.2f}", total))
+        stats = storage.get_stats()
+        rows.append((size, "index MiB", "", f"{stats['search_index_bytes'] / 2 ** 20:.1f}",
+                     f"{storage.search_index.terms()} terms"))
+    report(rows, ("tasks", "query", "scan ms", "index ms", "matches"))
+
+
+@benchmark("activity")
+def bench_activity(sizes):
+    """Agent activity log: unbounded session list vs. ring buffer with indexes"""
+    agents = ['Planner', 'Scheduler', 'Reminder']
+    rows = []
+    for size in sizes:
+        def legacy_log():
+            logs = []
+            for i in range(size):
+                logs.append({'time': datetime.now().strftime("%H:%M"), 'agent': agents[i % 3],
+                             'action': f"Created task: Task {i}"})
+            return logs
+
+        def ring_log():
+            log = ActivityLog(None)
+            for i in range(size):
+                log.record(agents[i % 3], f"Created task: Task {i}")
+            return log
+
+        logs = legacy_log()
+        log = ring_log()
+        since = time.time() - 60
+        minute = datetime.now().strftime("%H:%M")
+        rows.append((size, "record ns/event", f"{timed(legacy_log, 1) / size * 1e6:.0f}",
+                     f"{timed(ring_log, 1) / size * 1e6:.0f}"))
+        rows.append((size, "memory KiB", _allocated_bytes(legacy_log) // 1024, _allocated_bytes(ring_log) // 1024))
+        rows.append((size, "last 10 Scheduler ms",
+                     f"{timed(lambda: [l for l in logs if l['agent'] == 'Scheduler'][-10:]):.3f}",
+                     f"{timed(lambda: log.recent(10, agent='Scheduler')):.3f}"))
+        rows.append((size, "Planner, last minute ms",
+                     f"{timed(lambda: [l for l in logs if l['agent'] == 'Planner' and l['time'] == minute]):.3f}",
+                     f"{timed(lambda: log.query(agent='Planner', since=since)):.3f}"))
+    report(rows, ("events", "measure", "session list", "ActivityLog"))
+
+
+@benchmark("refresh")
+def bench_refresh(sizes):
+    """Per-rerun cost: reloading the task file vs. polling a shared storage"""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            filename = os.path.join(tmp, f"tasks_{size}.json")
+            JSONFileEngine(filename).write_snapshot(make_tasks(size))
+            shared = TaskStorage(filename, refresh_interval=0)
+            other = TaskStorage(filename)
+            extra = iter(make_tasks(1000, seed=7))
+
+            def external_write():
+                other.add_task(next(extra))
+                shared.refresh()
+
+            rows.append((size, f"{timed(lambda: TaskStorage(filename), 1):.1f}",
+                         f"{timed(shared.refresh, 20):.3f}", f"{timed(external_write, 20):.3f}"))
+            other.close()
+            shared.close()
+    report(rows, ("tasks", "reload ms", "poll (unchanged) ms", "poll (1 external write) ms"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*',
+                        help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+                        help="task counts to benchmark")
+    parser.add_argument('--samples', type=int, default=1000,
+                        help="timed calls per operation for the ops and metrics benchmarks")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    for name in args.names or sorted(BENCHMARKS):
+        print(f"\n== {name}: {BENCHMARKS[name].__doc__}")
+        func = BENCHMARKS[name]
+        if 'samples' in inspect.signature(func).parameters:
+            func(args.sizes, samples=args.samples)
+        else:
+            func(args.sizes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+import json
+import os
+import threading
+import time
+import weakref
+from typing import List, Dict, Optional
+from locks import FileLock
+from metrics import instrument
+from models import task_to_json
+from streams import _fsync_dir, file_signature, iter_json
+
+
+def _write_json_temp(tmp_filename: str, tasks: List[Dict], indent=2):
+    """Write a JSON task list to a temp file and sync it, ready to rename into place"""
+    with open(tmp_filename, 'w') as f:
+        json.dump(tasks, f, indent=indent, default=task_to_json)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_json_atomic(filename: str, tasks: List[Dict], indent=2):
+    """Write a JSON task list to a temp file and rename it into place"""
+    tmp_filename = f"{filename}.tmp"
+    _write_json_temp(tmp_filename, tasks, indent)
+    os.replace(tmp_filename, filename)
+    _fsync_dir(filename)
+
+
+def _read_json(filename: str) -> List[Dict]:
+    """Read a JSON task list; a missing file is empty, an unreadable one an error"""
+    try:
+        with open(filename, 'r') as f:
+            return list(iter_json(f))
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError as e:
+        # Writers only ever rename complete files into place, so this is
+        # damage from outside; don't let the next save replace it
+        raise ValueError(f"{filename} is not a valid task file: {e}") from e
+
+
+def apply_record(state: Dict[str, Dict], record: Dict):
+    """Apply one log record to an id-keyed, insertion-ordered task map.
+
+    Records are idempotent: `add` and `update` upsert the full task and
+    `delete` removes it if present, so replaying a log over a snapshot that
+    already contains its effects yields the same state.
+    """
+    op = record['op']
+    if op in ('add', 'update'):
+        task = record['task']
+        state[task['id']] = task
+    elif op == 'delete':
+        state.pop(record['id'], None)
+    elif op == 'reset':
+        state.clear()
+        state.update((task['id'], task) for task in record['tasks'])
+    elif op == 'batch':
+        for sub_record in record['ops']:
+            apply_record(state, sub_record)
+
+
+@instrument
+class JSONFileEngine:
+    """Legacy engine: rewrite the whole JSON file on every mutation
+
+    `lock` is held across processes while the file is read or replaced;
+    TaskStorage also holds it for the whole of each mutation.
+    """
+
+    def __init__(self, filename="tasks.json"):
+        self.filename = filename
+        self.lock = FileLock(f"{filename}.lock")
+        self._signature = None
+
+    def load(self) -> List[Dict]:
+        """Load tasks from JSON file"""
+        with self.lock:
+            self._signature = file_signature(self.filename)
+            return _read_json(self.filename)
+
+    def poll(self) -> Optional[List[Dict]]:
+        """A 'reset' record with the reloaded tasks if another process rewrote the file"""
+        if file_signature(self.filename) == self._signature:
+            return None
+        return [{'op': 'reset', 'tasks': self.load()}]
+
+    def append(self, record: Dict, tasks: List[Dict]):
+        """Persist one mutation by rewriting the full task list"""
+        self.write_snapshot(tasks)
+
+    def append_batch(self, records: List[Dict], tasks: List[Dict]):
+        """Persist a group of mutations with a single rewrite"""
+        self.write_snapshot(tasks)
+
+    def write_snapshot(self, tasks: List[Dict]):
+        """Save tasks to JSON file via a temp file and atomic rename"""
+        with self.lock:
+            _write_json_atomic(self.filename, tasks)
+            self._signature = file_signature(self.filename)
+
+    def size(self) -> int:
+        """Bytes used on disk"""
+        return os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.lock.close()
+
+
+class MemoryEngine:
+    """Engine that keeps nothing on disk, for benchmarks and scratch storage"""
+
+    def __init__(self, tasks: List[Dict] = None):
+        self._initial = list(tasks or [])
+        self.lock = threading.RLock()
+
+    def load(self) -> List[Dict]:
+        return list(self._initial)
+
+    def poll(self) -> Optional[List[Dict]]:
+        return None
+
+    def append(self, record: Dict, tasks: List[Dict]):
+        pass
+
+    def append_batch(self, records: List[Dict], tasks: List[Dict]):
+        pass
+
+    def write_snapshot(self, tasks: List[Dict]):
+        pass
+
+    def size(self) -> int:
+        return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@instrument
+class LogEngine:
+    """Append-only operation log on top of a JSON snapshot.
+
+    Mutations are appended as one JSON record per line to `<filename>.wal`
+    and flushed to the OS immediately; `fsync` is batched, either every
+    `sync_batch` records or every `sync_interval` seconds from a background
+    thread. Once the log holds `compact_threshold` records the same thread
+    folds it into the snapshot, which stays in the plain JSON list format
+    used by `JSONFileEngine`.
+
+    On load the snapshot is read and the log replayed on top of it. A torn
+    trailing record from a crash mid-write is discarded.
+
+    Several processes can share the files. `lock` (a `FileLock` on
+    `<filename>.lock`) is held while records are appended, while the state
+    is read and for the two renames of a compaction; TaskStorage also holds
+    it for the whole of each mutation. Folding the log into the snapshot
+    happens outside it, and `<filename>.compact.lock` keeps two processes
+    from compacting at once.
+
+    `poll` picks up writes made by other processes: the snapshot is tracked
+    by inode, mtime and size and the log by inode and read offset, so an
+    unchanged tree costs two `stat` calls and a grown log only the new tail.
+    """
+
+    def __init__(self, filename="tasks.json", sync_interval=0.05, sync_batch=64,
+                 compact_threshold=1000):
+        self.filename = filename
+        self.log_filename = f"{filename}.wal"
+        self.compacting_filename = f"{filename}.wal.compacting"
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self.compact_threshold = compact_threshold
+
+        self.lock = FileLock(f"{filename}.lock")
+        self._compact_file_lock = FileLock(f"{filename}.compact.lock")
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._log = None
+        self._unsynced = 0
+        self._log_records = 0
+        self._disk_size = None
+        self._worker = None
+        self._closed = False
+        # What has been read or written so far, for change detection
+        self._snapshot_signature = None
+        # Set when other processes' records left the log before we read them
+        self._reload_needed = False
+        self._log_inode = None
+        self._log_offset = 0
+
+    # Loading and replay
+
+    def load(self) -> List[Dict]:
+        """Load the snapshot and replay any logged operations on top of it"""
+        with self.lock, self._lock:
+            leftover = os.path.exists(self.compacting_filename)
+            state = self._read_state(repair=True)
+
+        if leftover:
+            # A compaction was interrupted (or is running in another
+            # process, in which case this is a no-op); finish it
+            self.compact()
+        return list(state.values())
+
+    def _read_state(self, repair=False) -> Dict[str, Dict]:
+        """Snapshot plus every log on disk, remembering what was read"""
+        if self._log is not None:
+            # Another process may have rotated the log; reopen it on the next write
+            self._sync_locked()
+            self._log.close()
+            self._log = None
+        self._reload_needed = False
+        self._snapshot_signature = file_signature(self.filename)
+        state = {task['id']: task for task in _read_json(self.filename)}
+        if os.path.exists(self.compacting_filename):
+            self._replay(self.compacting_filename, state)
+        log_signature = file_signature(self.log_filename)
+        self._log_records, self._log_offset = self._replay(self.log_filename, state, repair=repair)
+        self._log_inode = log_signature[0] if log_signature else None
+        return state
+
+    def _replay(self, log_filename: str, state, repair=False, offset=0) -> tuple:
+        """Apply every complete record in a log file from `offset`.
+
+        `state` is an id-keyed map, or a list that collects the raw records.
+        Returns the record count and the offset just past the last complete
+        record.
+        """
+        if not os.path.exists(log_filename):
+            return 0, 0
+
+        count = 0
+        good_offset = offset
+        with open(log_filename, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if isinstance(state, list):
+                    state.append(record)
+                else:
+                    apply_record(state, record)
+                good_offset += len(line)
+                count += 1
+
+        if repair and good_offset < os.path.getsize(log_filename):
+            # Drop the torn tail so new records don't get glued onto it
+            with open(log_filename, 'r+b') as f:
+                f.truncate(good_offset)
+        return count, good_offset
+
+    def poll(self) -> Optional[List[Dict]]:
+        """Records other processes wrote since the last load, append or poll.
+
+        Returns None if nothing changed, the new log records if the log only
+        grew, or a single 'reset' record with the reloaded task set if the
+        snapshot was replaced or the log rotated underneath us. The files are
+        only locked and read once the `stat` calls show a change.
+        """
+        if not self._changed():
+            return None
+        with self.lock, self._lock:
+            if self._reload_needed or file_signature(self.filename) != self._snapshot_signature:
+                return [self._reload_locked()]
+            log_signature = file_signature(self.log_filename)
+            if log_signature is None:
+                return None if self._log_inode is None else [self._reload_locked()]
+            if log_signature[0] != self._log_inode:
+                if self._log_inode is not None or self._log_offset:
+                    return [self._reload_locked()]
+                self._log_inode = log_signature[0]
+            if log_signature[2] < self._log_offset:
+                return [self._reload_locked()]
+            if log_signature[2] == self._log_offset:
+                return None
+            records = []
+            count, self._log_offset = self._replay(self.log_filename, records,
+                                                   offset=self._log_offset)
+            self._log_records += count
+            self._disk_size = None
+            return records
+
+    def _changed(self) -> bool:
+        """Unlocked check whether the files differ from what was last read or written"""
+        if self._reload_needed or file_signature(self.filename) != self._snapshot_signature:
+            return True
+        log_signature = file_signature(self.log_filename)
+        if log_signature is None:
+            return self._log_inode is not None
+        return log_signature[0] != self._log_inode or log_signature[2] != self._log_offset
+
+    def _reload_locked(self) -> Dict:
+        self._disk_size = None
+        return {'op': 'reset', 'tasks': list(self._read_state().values())}
+
+    # Writing
+
+    def append(self, record: Dict, tasks: List[Dict] = None):
+        """Append one mutation record to the log"""
+        self._write_record(record, 1)
+
+    def append_batch(self, records: List[Dict], tasks: List[Dict] = None):
+        """Append a group of mutations as one record, so replay sees all or none"""
+        self._write_record({'op': 'batch', 'ops': records}, len(records))
+        self.flush()
+
+    def _write_record(self, record: Dict, weight: int):
+        line = json.dumps(record, default=task_to_json, separators=(',', ':')) + '\n'
+        with self.lock, self._lock:
+            self._closed = False
+            if self._log is None:
+                self._log = open(self.log_filename, 'a')
+                self._log_inode = os.fstat(self._log.fileno()).st_ino
+            self._log.write(line)
+            self._log.flush()
+            # Not tell(): the file object's position doesn't count other
+            # processes' appends. Under `lock` the file ends with our record.
+            self._log_offset = os.fstat(self._log.fileno()).st_size
+            if self._disk_size is not None:
+                self._disk_size += len(line)
+            self._unsynced += weight
+            self._log_records += weight
+            if self._unsynced >= self.sync_batch:
+                self._sync_locked()
+        self._ensure_worker()
+
+    def write_snapshot(self, tasks: List[Dict]):
+        """Replace the whole task set with a single log record"""
+        self.append({'op': 'reset', 'tasks': tasks})
+        self.flush()
+        # The caller may hold `lock`; waiting for a compaction that needs it would deadlock
+        self.compact(blocking=False)
+
+    def flush(self):
+        """Force buffered records to stable storage"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._log is not None and self._unsynced:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+
+    def size(self) -> int:
+        """Bytes used on disk by the snapshot and log, tracked across appends"""
+        if self._disk_size is None:
+            total = 0
+            for name in (self.filename, self.log_filename, self.compacting_filename):
+                if os.path.exists(name):
+                    total += os.path.getsize(name)
+            self._disk_size = total
+        return self._disk_size
+
+    # Compaction
+
+    def needs_compaction(self) -> bool:
+        return self._log_records >= self.compact_threshold
+
+    def compact(self, blocking: bool = True):
+        """Fold the current log into a fresh snapshot.
+
+        The live log is renamed aside under the write lock so appends continue
+        into a new file while the snapshot is rebuilt from disk. Replay is
+        idempotent, so a crash at any point leaves a loadable state. Does
+        nothing if another process is compacting, or, unless `blocking`, if
+        another thread is.
+        """
+        if not self._compact_lock.acquire(blocking):
+            return
+        try:
+            if not self._compact_file_lock.acquire(blocking=False):
+                return
+            try:
+                self._compact_locked()
+            finally:
+                self._compact_file_lock.release()
+        finally:
+            self._compact_lock.release()
+
+    def _compact_locked(self):
+        with self.lock, self._lock:
+            self._sync_locked()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            # Changes other processes made since our last poll are about to
+            # leave the log unseen; the next poll must reload everything
+            if self._changed():
+                self._reload_needed = True
+            self._log_inode = None
+            self._log_offset = 0
+            if os.path.exists(self.log_filename):
+                if os.path.exists(self.compacting_filename):
+                    # Leftover from an interrupted compaction; keep both
+                    with open(self.compacting_filename, 'ab') as dst, \
+                            open(self.log_filename, 'rb') as src:
+                        dst.write(src.read())
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(self.log_filename)
+                else:
+                    os.replace(self.log_filename, self.compacting_filename)
+            self._log_records = 0
+
+        if not os.path.exists(self.compacting_filename):
+            return
+
+        state = {task['id']: task for task in _read_json(self.filename)}
+        self._replay(self.compacting_filename, state)
+        tmp_filename = f"{self.compacting_filename}.tmp"
+        _write_json_temp(tmp_filename, list(state.values()))
+        with self.lock:
+            os.replace(tmp_filename, self.filename)
+            os.remove(self.compacting_filename)
+            _fsync_dir(self.filename)
+            self._snapshot_signature = file_signature(self.filename)
+            self._disk_size = None
+
+    # Background worker
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=_log_worker, args=(weakref.ref(self),),
+                name="task-log-sync", daemon=True
+            )
+            self._worker.start()
+
+    def close(self):
+        """Sync and close the log file, waiting for a running compaction"""
+        with self._compact_lock, self._lock:
+            self._closed = True
+            self._sync_locked()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        self.lock.close()
+        self._compact_file_lock.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _log_worker(engine_ref):
+    """Periodically fsync and compact; exits once the engine is collected"""
+    while True:
+        engine = engine_ref()
+        if engine is None or engine._closed:
+            return
+        interval = engine.sync_interval
+        try:
+            engine.flush()
+            if engine.needs_compaction():
+                engine.compact()
+        except Exception as e:
+            print(f"Error in storage log worker: {e}")
+        del engine
+        time.sleep(interval)
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from typing import Dict, Iterator, List
+
+from models import Priority, Status, Task
+from streams import base_extension, iter_json, open_stream
+
+INTEGER_FIELDS = ('estimated_duration', 'preparation_time', 'buffer_time', 'optimization_score', 'version')
+# Keys every imported row must have; the agents and the task list assume a due date
+REQUIRED_FIELDS = ('title', 'due_date')
+PRIORITY_LABELS = frozenset(p.label for p in Priority)
+STATUS_LABELS = frozenset(s.label for s in Status)
+
+
+def _normalize_row(row: Dict) -> Dict:
+    """Fill in defaults and coerce CSV strings to the task JSON shape
+
+    Raises ValueError for a row missing a required field or with an unknown
+    priority or status.
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    row = {key: value for key, value in row.items() if value not in (None, '')}
+    missing = [field for field in REQUIRED_FIELDS if field not in row]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if row.get('priority', 'Medium') not in PRIORITY_LABELS:
+        raise ValueError(f"unknown priority {row['priority']!r}")
+    if row.get('status', 'pending') not in STATUS_LABELS:
+        raise ValueError(f"unknown status {row['status']!r}")
+    row.setdefault('id', str(uuid.uuid4()))
+    row.setdefault('created_date', time.time())
+    tags = row.get('tags', [])
+    if isinstance(tags, str):
+        row['tags'] = [tag.strip() for tag in tags.replace(';', ',').split(',') if tag.strip()]
+    for field in INTEGER_FIELDS:
+        if isinstance(row.get(field), str):
+            row[field] = int(row[field])
+    return row
+
+
+def iter_task_file(source, fmt: str = None, errors: List[str] = None) -> Iterator[Task]:
+    """Yield tasks from a CSV, JSON or JSONL file one row at a time.
+
+    `source` is a path (optionally .gz or .zst compressed) or an open file
+    (text or binary, e.g. a Streamlit upload). The format is `fmt` if given,
+    else taken from the file name: `.csv` means CSV, `.json` a JSON array
+    and anything else JSON lines. CSV headers use the task JSON
+    keys; `tags` may be comma- or semicolon-separated. Missing ids are
+    generated.
+
+    Rows without a title or due date, with an unknown priority or status,
+    or that don't parse are skipped. Each is reported as "row N: reason"
+    (N counts from 1; for CSV and JSON lines it is the line number), appended
+    to `errors` if given, else printed.
+    """
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+    if fmt is None:
+        extension = base_extension(name)
+        fmt = 'csv' if extension == '.csv' else 'json' if extension == '.json' else 'jsonl'
+
+    if isinstance(source, (str, os.PathLike)):
+        with open_stream(source) as f:
+            yield from _iter_rows(f, fmt, errors)
+    elif isinstance(source, io.TextIOBase):
+        yield from _iter_rows(source, fmt, errors)
+    else:
+        yield from _iter_rows(io.TextIOWrapper(source, encoding='utf-8', newline=''), fmt, errors)
+
+
+def _iter_records(f, fmt: str) -> Iterator[tuple]:
+    """(row number, parsed row or the exception parsing it) for each row"""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'json':
+        yield from enumerate(iter_json(f), 1)
+    else:
+        for line_num, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_num, e
+
+
+def _iter_rows(f, fmt: str, errors: List[str] = None) -> Iterator[Task]:
+    for row_num, row in _iter_records(f, fmt):
+        try:
+            if isinstance(row, Exception):
+                raise row
+            task = Task.from_dict(_normalize_row(row))
+        except (ValueError, TypeError) as e:
+            message = f"row {row_num}: {e}"
+            if errors is None:
+                print(f"Skipping task {message}")
+            else:
+                errors.append(message)
+            continue
+        yield task
@@ -0,0 +1,218 @@
+import math
+from bisect import bisect_left, insort
+from typing import List, Dict, Optional, Iterable, Tuple
+from models import Task, Priority
+from recurrence import is_series
+
+
+def _or_inf(timestamp: Optional[float]) -> float:
+    return math.inf if timestamp is None else timestamp
+
+
+# Orders available to `TaskIndex.query`: name -> sort key of a Task record.
+# Every key ends with the task id, so keys are unique.
+SORT_KEYS = {
+    'due_date': lambda task: (_or_inf(task.due_ts), task.id),
+    'priority': lambda task: (-task.priority.rank, _or_inf(task.due_ts), task.id),
+    'created_date': lambda task: (math.inf if task.created_ts is None else -task.created_ts, task.id),
+}
+# Orders kept as sorted lists. Within one priority the 'priority' order is
+# the 'due_date' one, so it is served from those lists a priority at a time.
+STORED_ORDERS = ('due_date', 'created_date')
+PRIORITY_LABELS = tuple(p.label for p in sorted(Priority, key=lambda p: -p.rank))
+
+
+class TaskIndex:
+    """In-memory indexes over a TaskStorage task list.
+
+    - `positions`: id -> position in the task list
+    - `by_status` / `by_priority`: value -> {id: task}
+    - `open_due`: sorted (due timestamp, id, task) entries for tasks that are not
+      completed, so "overdue" and "due before X" are range queries; recurring
+      tasks are left out, as their due date is only the start of the series
+    - `orders`: for 'due_date' and 'created_date', sorted (key..., task)
+      entries split by (status, priority), so a filtered, sorted page is a
+      merge of at most six lists (see `query`)
+
+    The index remembers what it recorded for each id, so a task that was
+    mutated in place before `update_task` is still removed from the right
+    buckets.
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, int] = {}
+        self.by_status: Dict[str, Dict[str, Task]] = {}
+        self.by_priority: Dict[str, Dict[str, Task]] = {}
+        self.open_due: List[tuple] = []
+        self.orders: Dict[str, Dict[tuple, List[tuple]]] = {name: {} for name in STORED_ORDERS}
+        self._entries: Dict[str, tuple] = {}
+
+    def rebuild(self, tasks: List[Task]):
+        """Index a full task list from scratch"""
+        self.positions = {}
+        self.by_status = {}
+        self.by_priority = {}
+        self.orders = {name: {} for name in STORED_ORDERS}
+        self._entries = {}
+        for pos, task in enumerate(tasks):
+            self.positions[task.id] = pos
+            self._add_entry(task)
+        for status, priority, order_entries in self._entries.values():
+            for name, order_entry in zip(STORED_ORDERS, order_entries):
+                self.orders[name].setdefault((status, priority), []).append(order_entry)
+        for partitions in self.orders.values():
+            for entries in partitions.values():
+                entries.sort()
+        self.open_due = [entry for (status, _), entries in self.orders['due_date'].items()
+                         for entry in entries if self._is_open_due(status, entry)]
+        self.open_due.sort()
+
+    def add(self, task: Task, pos: int):
+        """Index a task stored at `pos`"""
+        self.positions[task.id] = pos
+        status, priority, order_entries = self._add_entry(task)
+        for name, order_entry in zip(STORED_ORDERS, order_entries):
+            insort(self.orders[name].setdefault((status, priority), []), order_entry)
+        if self._is_open_due(status, order_entries[0]):
+            insort(self.open_due, order_entries[0])
+
+    def remove(self, task_id: str):
+        """Drop a task from every index"""
+        self.positions.pop(task_id, None)
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return
+        status, priority, order_entries = entry
+        self._discard(self.by_status, status, task_id)
+        self._discard(self.by_priority, priority, task_id)
+        for name, order_entry in zip(STORED_ORDERS, order_entries):
+            self._remove_entry(self.orders[name].get((status, priority)), order_entry)
+        if self._is_open_due(status, order_entries[0]):
+            self._remove_entry(self.open_due, order_entries[0])
+
+    def shift(self, tasks: List[Task], start: int):
+        """Refresh positions after tasks from `start` onwards moved"""
+        for pos in range(start, len(tasks)):
+            self.positions[tasks[pos].id] = pos
+
+    def position(self, task_id: str) -> Optional[int]:
+        return self.positions.get(task_id)
+
+    def tasks_with_status(self, status: str) -> List[Task]:
+        return list(self.by_status.get(status, {}).values())
+
+    def tasks_with_priority(self, priority: str) -> List[Task]:
+        return list(self.by_priority.get(priority, {}).values())
+
+    def count_with_status(self, status: str) -> int:
+        return len(self.by_status.get(status, ()))
+
+    def open_due_before(self, timestamp: float) -> List[Task]:
+        """Non-completed tasks due strictly before `timestamp`, earliest first"""
+        end = bisect_left(self.open_due, (timestamp,))
+        return [entry[2] for entry in self.open_due[:end]]
+
+    def query(self, statuses: Iterable[str] = None, priorities: Iterable[str] = None,
+              sort_by: str = 'due_date', descending: bool = False,
+              offset: int = 0, limit: int = None) -> Tuple[List[Task], int]:
+        """One page of tasks in `sort_by` order, plus the number of matches.
+
+        `statuses` / `priorities` restrict the result to those labels (None
+        means any). Page boundaries are found by a rank search over the
+        matching sorted lists, so the cost depends on the page size rather
+        than on `offset` or the number of tasks.
+        """
+        offset = max(offset, 0)
+        if sort_by != 'priority':
+            return self._page(sort_by, statuses, priorities, descending, offset, limit)
+
+        # Highest priority first, each priority in due-date order
+        labels = [label for label in PRIORITY_LABELS if priorities is None or label in priorities]
+        if descending:
+            labels.reverse()
+        tasks, total = [], 0
+        for label in labels:
+            remaining = None if limit is None else limit - len(tasks)
+            page, count = self._page('due_date', statuses, (label,), descending,
+                                     max(offset - total, 0), remaining)
+            tasks.extend(page)
+            total += count
+        return tasks, total
+
+    def _page(self, sort_by, statuses, priorities, descending, offset, limit) -> Tuple[List[Task], int]:
+        partitions = [entries for (status, priority), entries in self.orders[sort_by].items()
+                      if (statuses is None or status in statuses)
+                      and (priorities is None or priority in priorities)]
+        total = sum(map(len, partitions))
+        start = min(offset, total)
+        end = total if limit is None else min(start + max(limit, 0), total)
+        if descending:
+            start, end = total - end, total - start
+        if start >= end:
+            return [], total
+
+        lower = _split(partitions, start)
+        upper = _split(partitions, end)
+        page = []
+        for entries, lo, hi in zip(partitions, lower, upper):
+            page += entries[lo:hi]
+        page.sort()  # merges the sorted runs
+        tasks = [entry[-1] for entry in page]
+        if descending:
+            tasks.reverse()
+        return tasks, total
+
+    def _add_entry(self, task: Task) -> tuple:
+        task_id = task.id
+        status = task.status.label
+        priority = task.priority.label
+        self.by_status.setdefault(status, {})[task_id] = task
+        self.by_priority.setdefault(priority, {})[task_id] = task
+        entry = (status, priority, tuple(SORT_KEYS[name](task) + (task,) for name in STORED_ORDERS))
+        self._entries[task_id] = entry
+        return entry
+
+    @staticmethod
+    def _is_open_due(status: str, due_entry: tuple) -> bool:
+        return status != 'completed' and due_entry[0] != math.inf and not is_series(due_entry[-1])
+
+    @staticmethod
+    def _remove_entry(entries: Optional[List[tuple]], entry: tuple):
+        if entries:
+            i = bisect_left(entries, entry[:-1])
+            if i < len(entries) and entries[i] is entry:
+                del entries[i]
+
+    @staticmethod
+    def _discard(buckets: Dict[str, Dict[str, Task]], value, task_id: str):
+        bucket = buckets.get(value)
+        if bucket is not None:
+            bucket.pop(task_id, None)
+            if not bucket:
+                del buckets[value]
+
+
+def _split(partitions: List[List[tuple]], rank: int) -> List[int]:
+    """Per-list cut points below which lie the `rank` smallest entries overall.
+
+    Binary search on the entry value: each round halves the widest remaining
+    range by counting, in every list, the entries below its midpoint. For k
+    lists of up to N entries that is O(k^2 log^2 N).
+    """
+    lo = [0] * len(partitions)
+    hi = [len(entries) for entries in partitions]
+    while True:
+        widest = max(range(len(partitions)), key=lambda i: hi[i] - lo[i], default=None)
+        if widest is None or hi[widest] == lo[widest]:
+            return lo
+        pivot = partitions[widest][(lo[widest] + hi[widest]) // 2][:-1]
+        below = [bisect_left(entries, pivot) for entries in partitions]
+        count = sum(below)
+        if count == rank:
+            return below
+        if count < rank:
+            # The pivot itself and everything below it are in the prefix
+            below[widest] += 1
+            lo = [max(l, b) for l, b in zip(lo, below)]
+        else:
+            hi = [min(h, b) for h, b in zip(hi, below)]
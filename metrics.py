@@ -0,0 +1,245 @@
+import functools
+import inspect
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, List
+
+# Histogram bucket upper bounds in seconds: 1 µs to about 67 s, doubling
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(27))
+
+
+class Histogram:
+    """Call count, total and a log-scale histogram of durations in seconds"""
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimated `q` quantile, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, perf_counter() - self.start)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.metrics.count(f"{self.name}.errors")
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Process-wide call timers, counters and latency histograms.
+
+    Collection is off until `enable()` (or TODO_METRICS=1 in the
+    environment). Classes marked with `instrument` are left untouched while
+    it is off; enabling swaps each registered method for a timing wrapper
+    and disabling puts the original back, so the disabled cost is nothing
+    at all. `timer(name)` blocks and `count` calls check a flag and return.
+
+    Every method gets a histogram named `Class.method`, plus a
+    `Class.method.errors` counter for calls that raise. Export with
+    `snapshot` / `to_json` or `to_prometheus`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        # (class, attribute, original function, metric name)
+        self._targets: List[tuple] = []
+
+    def enable(self):
+        """Start collecting: wrap every instrumented method"""
+        with self._lock:
+            if not self.enabled:
+                for owner, attribute, func, name in self._targets:
+                    setattr(owner, attribute, self._wrap(func, name))
+                self.enabled = True
+
+    def disable(self):
+        """Stop collecting and restore the original methods; collected data is kept"""
+        with self._lock:
+            if self.enabled:
+                for owner, attribute, func, _ in self._targets:
+                    setattr(owner, attribute, func)
+                self.enabled = False
+
+    def reset(self):
+        """Drop everything collected so far"""
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def instrument(self, cls=None, *, include=(), exclude=()):
+        """Class decorator registering the public methods of `cls` for timing.
+
+        Private methods named in `include` are timed too and methods in
+        `exclude` are skipped. Generator functions and context managers are
+        skipped, since a call only creates them.
+        """
+        def register(cls):
+            for attribute, func in list(vars(cls).items()):
+                if not inspect.isfunction(func) or attribute in exclude:
+                    continue
+                if attribute.startswith('_') and attribute not in include:
+                    continue
+                if inspect.isgeneratorfunction(inspect.unwrap(func)):
+                    continue
+                target = (cls, attribute, func, f"{cls.__name__}.{attribute}")
+                with self._lock:
+                    self._targets.append(target)
+                    if self.enabled:
+                        setattr(cls, attribute, self._wrap(func, target[3]))
+            return cls
+        return register if cls is None else register(cls)
+
+    def _wrap(self, func, name: str):
+        observe = self.observe
+        if inspect.iscoroutinefunction(func):
+            async def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    self.count(f"{name}.errors")
+                    raise
+                finally:
+                    observe(name, perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    self.count(f"{name}.errors")
+                    raise
+                finally:
+                    observe(name, perf_counter() - start)
+        return functools.update_wrapper(timed, func)
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration for `name`"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, n: int = 1):
+        """Add `n` to the counter `name`"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def timer(self, name: str):
+        """Context manager timing its block into the histogram `name`"""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def snapshot(self) -> Dict:
+        """Per-name call count, total, mean, p50, p99 and max (seconds), and the counters"""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = dict(self._counters)
+        return {
+            'enabled': self.enabled,
+            'timers': {
+                name: {
+                    'count': h.count,
+                    'sum': h.sum,
+                    'mean': h.sum / h.count,
+                    'p50': h.quantile(0.5),
+                    'p99': h.quantile(0.99),
+                    'max': h.max,
+                }
+                for name, h in sorted(histograms)
+            },
+            'counters': dict(sorted(counters.items())),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'todo') -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            histograms = [(name, list(h.counts), h.count, h.sum) for name, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        lines = [f"# HELP {prefix}_duration_seconds Time spent in instrumented calls and blocks",
+                 f"# TYPE {prefix}_duration_seconds histogram"]
+        for name, counts, count, total in histograms:
+            label = _label(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{prefix}_duration_seconds_bucket{{name="{label}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_bucket{{name="{label}",le="+Inf"}} {count}')
+            lines.append(f'{prefix}_duration_seconds_sum{{name="{label}"}} {total:.9g}')
+            lines.append(f'{prefix}_duration_seconds_count{{name="{label}"}} {count}')
+        lines += [f"# HELP {prefix}_events_total Counted events, including errors raised by timed calls",
+                  f"# TYPE {prefix}_events_total counter"]
+        for name, value in counters:
+            lines.append(f'{prefix}_events_total{{name="{_label(name)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = Metrics()
+instrument = METRICS.instrument
+timer = METRICS.timer
+count = METRICS.count
+
+if os.environ.get('TODO_METRICS', '').lower() in ('1', 'true', 'yes', 'on'):
+    METRICS.enable()
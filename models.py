@@ -0,0 +1,252 @@
+import sys
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Optional, Iterator
+
+
+class Priority(Enum):
+    LOW = 'Low', 1
+    MEDIUM = 'Medium', 2
+    HIGH = 'High', 3
+
+    def __new__(cls, label: str, rank: int):
+        member = object.__new__(cls)
+        member._value_ = label
+        # Plain attributes: cheaper than Enum's `.value` in per-task loops
+        member.label = label
+        member.rank = rank
+        return member
+
+
+class Status(Enum):
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+
+    def __new__(cls, label: str):
+        member = object.__new__(cls)
+        member._value_ = label
+        member.label = label
+        return member
+
+
+_PRIORITIES = {p.label: p for p in Priority}
+_STATUSES = {s.label: s for s in Status}
+
+# JSON key -> slot holding the same value as epoch seconds
+TIMESTAMP_FIELDS = {
+    'due_date': 'due_ts',
+    'created_date': 'created_ts',
+    'scheduled_time': 'scheduled_ts',
+    'completed_date': 'completed_ts',
+}
+# JSON keys stored directly in a slot of the same name
+PLAIN_FIELDS = ('id', 'title', 'description', 'estimated_duration', 'preparation_time', 'buffer_time',
+                'optimization_score', 'version')
+# Order of keys produced by `Task.to_dict`, matching PlannerAgent/SchedulerAgent output
+FIELD_ORDER = ('id', 'title', 'description', 'priority', 'due_date', 'created_date', 'status',
+               'estimated_duration', 'tags', 'scheduled_time', 'preparation_time', 'buffer_time',
+               'completed_date', 'optimization_score', 'version')
+KNOWN_KEYS = frozenset(FIELD_ORDER)
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """Epoch seconds for an ISO-8601 string, datetime or number"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def format_timestamp(timestamp: float) -> str:
+    """ISO-8601 string for epoch seconds, in the same local-time form the agents write"""
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class Task:
+    """Compact task record.
+
+    Timestamps are parsed once into epoch seconds, status and priority are
+    shared enum members and tags are an interned tuple. Any keys outside the
+    known schema live in `extra`. `version` counts the stored revisions of
+    the task; storage bumps it on every update and uses it for
+    compare-and-swap.
+
+    Tasks also behave like the JSON dicts they replace: `task['due_date']`
+    returns an ISO string and `task['priority'] = 'High'` parses it back, so
+    code written against the dict shape keeps working. Hot paths should use
+    the attributes (`task.due_ts`, `task.priority`) directly.
+    """
+
+    __slots__ = ('id', 'title', 'description', 'priority', 'status',
+                 'due_ts', 'created_ts', 'scheduled_ts', 'completed_ts',
+                 'estimated_duration', 'preparation_time', 'buffer_time',
+                 'optimization_score', 'version', 'tags', 'extra')
+
+    def __init__(self, id: str, title: str, description: str = '',
+                 priority: Priority = Priority.MEDIUM, status: Status = Status.PENDING,
+                 due_ts: float = None, created_ts: float = None, scheduled_ts: float = None,
+                 completed_ts: float = None, estimated_duration: int = None,
+                 preparation_time: int = None, buffer_time: int = None,
+                 optimization_score: int = None, tags: tuple = (), extra: Dict = None,
+                 version: int = None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.priority = priority if isinstance(priority, Priority) else _PRIORITIES[priority]
+        self.status = status if isinstance(status, Status) else _STATUSES[status]
+        self.due_ts = due_ts
+        self.created_ts = created_ts
+        self.scheduled_ts = scheduled_ts
+        self.completed_ts = completed_ts
+        self.estimated_duration = estimated_duration
+        self.preparation_time = preparation_time
+        self.buffer_time = buffer_time
+        self.optimization_score = optimization_score
+        self.version = version
+        self.tags = tuple(sys.intern(tag) for tag in tags)
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Task':
+        """Build a Task from the JSON dict shape"""
+        get = data.get
+        task = cls.__new__(cls)
+        task.id = get('id')
+        task.title = get('title', '')
+        task.description = get('description', '')
+        task.priority = _PRIORITIES[get('priority', 'Medium')]
+        task.status = _STATUSES[get('status', 'pending')]
+        task.due_ts = parse_timestamp(get('due_date'))
+        task.created_ts = parse_timestamp(get('created_date'))
+        task.scheduled_ts = parse_timestamp(get('scheduled_time'))
+        task.completed_ts = parse_timestamp(get('completed_date'))
+        task.estimated_duration = get('estimated_duration')
+        task.preparation_time = get('preparation_time')
+        task.buffer_time = get('buffer_time')
+        task.optimization_score = get('optimization_score')
+        task.version = get('version')
+        task.tags = tuple(map(sys.intern, get('tags', ())))
+        extra = {key: value for key, value in data.items() if key not in KNOWN_KEYS}
+        task.extra = extra or None
+        return task
+
+    @classmethod
+    def coerce(cls, task) -> 'Task':
+        """Return `task` unchanged if it is a Task, else convert it from a dict"""
+        return task if isinstance(task, cls) else cls.from_dict(task)
+
+    def to_dict(self) -> Dict:
+        """Convert back to the JSON dict shape"""
+        data = {}
+        for key in FIELD_ORDER:
+            value = self.get(key)
+            if value is not None:
+                data[key] = value
+        data['tags'] = list(self.tags)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def copy(self) -> 'Task':
+        clone = Task.__new__(Task)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.extra = dict(self.extra) if self.extra else None
+        return clone
+
+    @property
+    def is_completed(self) -> bool:
+        return self.status is Status.COMPLETED
+
+    # Dict-style access
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default=None):
+        if key in TIMESTAMP_FIELDS:
+            timestamp = getattr(self, TIMESTAMP_FIELDS[key])
+            return default if timestamp is None else format_timestamp(timestamp)
+        if key == 'priority':
+            return self.priority.label
+        if key == 'status':
+            return self.status.label
+        if key == 'tags':
+            return self.tags
+        if key in PLAIN_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def __setitem__(self, key: str, value):
+        if key not in KNOWN_KEYS:
+            self.set_extra(key, value)
+        elif key in TIMESTAMP_FIELDS:
+            setattr(self, TIMESTAMP_FIELDS[key], parse_timestamp(value))
+        elif key == 'priority':
+            self.priority = value if isinstance(value, Priority) else _PRIORITIES[value]
+        elif key == 'status':
+            self.status = value if isinstance(value, Status) else _STATUSES[value]
+        elif key == 'tags':
+            self.tags = tuple(sys.intern(tag) for tag in value)
+        else:
+            setattr(self, key, value)
+
+    def set_extra(self, key: str, value):
+        """Set a key outside the fixed schema, e.g. a series' `completions`"""
+        if self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Task):
+            return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+        if isinstance(other, dict):
+            return self.to_dict() == Task.coerce(other).to_dict()
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Task(id={self.id!r}, title={self.title!r}, status={self.status.label!r})"
+
+
+_MISSING = object()
+
+
+def due_timestamp(task) -> Optional[float]:
+    """Epoch-second due date of a Task or task dict"""
+    if isinstance(task, Task):
+        return task.due_ts
+    try:
+        return parse_timestamp(task.get('due_date'))
+    except (TypeError, ValueError):
+        return None
+
+
+def task_to_json(obj):
+    """`json.dump` default hook that serializes Task records as dicts"""
+    if isinstance(obj, Task):
+        return obj.to_dict()
+    return str(obj)
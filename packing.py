@@ -0,0 +1,372 @@
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime, time as clock_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from models import Task, Status
+from recurrence import OVERDUE_LOOKBACK, is_series, occurrences, series_signature
+
+DEFAULT_DURATION = 30  # minutes, for tasks without an estimate
+INITIAL_HORIZON = 32  # days; the plan grows as needed
+RECURRENCE_HORIZON = 14  # days of a recurring task's occurrences that get slots
+
+
+def _as_clock(value) -> clock_time:
+    """datetime.time for a `time` or a number of hours such as 9 or 17.5"""
+    if isinstance(value, clock_time):
+        return value
+    minutes = int(round(float(value) * 60))
+    return clock_time(minutes // 60, minutes % 60)
+
+
+def block_seconds(task: Task) -> float:
+    """Time a task occupies: preparation, work and buffer"""
+    minutes = ((task.preparation_time or 0) + (task.estimated_duration or DEFAULT_DURATION)
+               + (task.buffer_time or 0))
+    return minutes * 60.0
+
+
+class _MaxTree:
+    """Segment tree over day numbers holding each day's longest free interval"""
+
+    def __init__(self, values: List[float]):
+        self.size = 1
+        while self.size < len(values):
+            self.size *= 2
+        self.tree = [0.0] * (2 * self.size)
+        self.tree[self.size:self.size + len(values)] = values
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def set(self, index: int, value: float):
+        node = index + self.size
+        self.tree[node] = value
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def first_at_least(self, lo: int, need: float) -> Optional[int]:
+        """Smallest index >= lo whose value is at least `need`"""
+        return self._find(1, 0, self.size - 1, lo, need)
+
+    def _find(self, node, node_lo, node_hi, lo, need):
+        if node_hi < lo or self.tree[node] < need:
+            return None
+        if node_lo == node_hi:
+            return node_lo
+        mid = (node_lo + node_hi) // 2
+        found = self._find(2 * node, node_lo, mid, lo, need)
+        if found is None:
+            found = self._find(2 * node + 1, mid + 1, node_hi, lo, need)
+        return found
+
+
+class SchedulePlan:
+    """Non-overlapping work slots for pending tasks inside working hours.
+
+    Tasks are packed earliest-deadline-first (higher priority first on equal
+    deadlines), each into the earliest free gap long enough for its
+    preparation, work and buffer time. Free time is a sorted interval list
+    per working day plus a segment tree of each day's longest gap, so a
+    placement costs O(log D) and packing N tasks O(N log N).
+
+    The plan is incremental: `add` places one task into the existing plan,
+    displacing only tasks due later when it would otherwise miss its
+    deadline, and `remove` frees a completed or deleted task's slot without
+    moving anything. `attach` keeps a plan in step with a storage backend.
+    Tasks longer than a working day can't be placed and are listed in
+    `unscheduled`.
+
+    A recurring task is planned as its occurrences due in the next
+    `RECURRENCE_HORIZON` days, each a task of its own (by occurrence id);
+    later ones get slots when the plan is packed again.
+    """
+
+    def __init__(self, working_hours=(9, 17), workdays=None, start: float = None):
+        self.day_start, self.day_end = (_as_clock(value) for value in working_hours)
+        if self.day_end <= self.day_start:
+            raise ValueError("working hours must end after they start")
+        self.workdays = frozenset(range(7) if workdays is None else workdays)
+        if not self.workdays:
+            raise ValueError("at least one working day is required")
+        self._max_window = (datetime.combine(date.min, self.day_end) -
+                            datetime.combine(date.min, self.day_start)).total_seconds()
+        self._storage = None
+        self._lock = threading.RLock()
+        self._reset(time.time() if start is None else start)
+
+    def _reset(self, start: float):
+        self.start = start
+        self.origin = date.fromtimestamp(start)
+        # task id -> (start, end) of its slot
+        self._slots: Dict[str, Tuple[float, float]] = {}
+        # task id -> (EDF key, seconds needed, signature)
+        self._entries: Dict[str, tuple] = {}
+        # (start, task id) of every slot in time order
+        self._timeline: List[tuple] = []
+        # series id -> (signature, ids of its planned occurrences)
+        self._series: Dict[str, tuple] = {}
+        self._free: Dict[int, List[List[float]]] = {}
+        self._days = 0
+        self._tree = _MaxTree([])
+        self.unscheduled = set()
+        self._grow(INITIAL_HORIZON)
+
+    # Working-day calendar
+
+    def _window(self, day: int) -> Optional[Tuple[float, float]]:
+        """Working hours of day number `day` as epoch seconds, or None on a day off"""
+        current = self.origin + timedelta(days=day)
+        if current.weekday() not in self.workdays:
+            return None
+        return (datetime.combine(current, self.day_start).timestamp(),
+                datetime.combine(current, self.day_end).timestamp())
+
+    def _day_of(self, timestamp: float) -> int:
+        return (date.fromtimestamp(timestamp) - self.origin).days
+
+    def _grow(self, days: int):
+        """Extend the horizon by `days` working-day windows"""
+        for day in range(self._days, self._days + days):
+            window = self._window(day)
+            if window is None:
+                continue
+            begin, end = max(window[0], self.start), window[1]
+            if end > begin:
+                self._free[day] = [[begin, end]]
+        self._days += days
+        self._tree = _MaxTree([self._longest(day) for day in range(self._days)])
+
+    def _longest(self, day: int) -> float:
+        return max((end - begin for begin, end in self._free.get(day, ())), default=0.0)
+
+    # Free-slot bookkeeping
+
+    def _reserve(self, need: float, earliest: float) -> Optional[Tuple[float, float]]:
+        """Take the earliest free gap of `need` seconds starting no sooner than `earliest`"""
+        if need > self._max_window:
+            return None
+        day = max(0, self._day_of(earliest))
+        while True:
+            found = self._tree.first_at_least(day, need) if day < self._days else None
+            if found is None:
+                self._grow(self._days)
+                continue
+            intervals = self._free[found]
+            for i, (begin, end) in enumerate(intervals):
+                slot_start = max(begin, earliest)
+                if end - slot_start >= need:
+                    pieces = []
+                    if slot_start > begin:
+                        pieces.append([begin, slot_start])
+                    if end > slot_start + need:
+                        pieces.append([slot_start + need, end])
+                    intervals[i:i + 1] = pieces
+                    self._tree.set(found, self._longest(found))
+                    return slot_start, slot_start + need
+            # Only the part of the day before `earliest` was long enough
+            day = found + 1
+
+    def _release(self, slot: Tuple[float, float]):
+        """Return a slot to the free list, merging it with adjacent gaps"""
+        begin, end = slot
+        day = self._day_of(begin)
+        if day < 0 or day >= self._days:
+            return
+        intervals = self._free.setdefault(day, [])
+        i = bisect_left(intervals, [begin, end])
+        if i < len(intervals) and intervals[i][0] == end:
+            end = intervals.pop(i)[1]
+        if i > 0 and intervals[i - 1][1] == begin:
+            i -= 1
+            begin = intervals.pop(i)[0]
+        intervals.insert(i, [begin, end])
+        self._tree.set(day, self._longest(day))
+
+    # Planning
+
+    @staticmethod
+    def _edf_key(task: Task) -> tuple:
+        due = math.inf if task.due_ts is None else task.due_ts
+        return (due, -task.priority.rank, task.id)
+
+    def pack(self, tasks: List[Task], start: float = None) -> 'SchedulePlan':
+        """Discard the current plan and pack every pending task from `start` (default now)"""
+        with self._lock:
+            self._reset(time.time() if start is None else start)
+            pending = []
+            for task in map(Task.coerce, tasks):
+                if is_series(task):
+                    planned = list(self._occurrences(task, self.start))
+                    self._series[task.id] = (self._series_signature(task), [o.id for o in planned])
+                    pending.extend(planned)
+                else:
+                    pending.append(task)
+            pending = [task for task in pending if task.status is not Status.COMPLETED]
+            pending.sort(key=self._edf_key)
+            for task in pending:
+                self._place(task, self.start)
+            return self
+
+    def _place(self, task: Task, earliest: float) -> bool:
+        self._entries[task.id] = (self._edf_key(task), block_seconds(task), self._signature(task))
+        return self._place_entry(task.id, earliest)
+
+    def _place_entry(self, task_id: str, earliest: float) -> bool:
+        slot = self._reserve(self._entries[task_id][1], earliest)
+        if slot is None:
+            self.unscheduled.add(task_id)
+            return False
+        self._slots[task_id] = slot
+        insort(self._timeline, (slot[0], task_id))
+        return True
+
+    @staticmethod
+    def _signature(task: Task) -> tuple:
+        return (task.due_ts, task.priority, task.status, block_seconds(task))
+
+    @classmethod
+    def _series_signature(cls, task: Task) -> tuple:
+        return cls._signature(task) + series_signature(task)
+
+    def _occurrences(self, series: Task, now: float):
+        """Occurrences of a series that get slots: missed ones still relevant and those in the horizon"""
+        return occurrences(series, now - OVERDUE_LOOKBACK,
+                           max(self.start, now) + timedelta(days=RECURRENCE_HORIZON).total_seconds())
+
+    def _add_series(self, series: Task, now: float) -> List[str]:
+        entry = self._series.get(series.id)
+        signature = self._series_signature(series)
+        if entry is not None and entry[0] == signature:
+            return []
+        self._remove_series(series.id)
+        if series.status is Status.COMPLETED:
+            return []
+        changed = []
+        planned = []
+        for occurrence in self._occurrences(series, now):
+            planned.append(occurrence.id)
+            changed.extend(self.add(occurrence, now))
+        self._series[series.id] = (signature, planned)
+        return changed
+
+    def _remove_series(self, series_id: str):
+        for task_id in self._series.pop(series_id, (None, ()))[1]:
+            self._unplace(task_id)
+
+    def add(self, task: Task, now: float = None) -> List[str]:
+        """Place or re-place one task; returns the ids whose slot changed.
+
+        A task whose plan inputs (due date, priority, status, durations) are
+        unchanged keeps its slot. If the earliest free gap would make the
+        task late, the not-yet-started tasks that sit before its deadline but
+        are due after it are unpacked and placed again behind it; the rest of
+        the plan is left alone. A recurring task re-places its occurrences.
+        """
+        task = Task.coerce(task)
+        now = time.time() if now is None else now
+        with self._lock:
+            if is_series(task):
+                return self._add_series(task, now)
+            entry = self._entries.get(task.id)
+            if entry is not None and entry[2] == self._signature(task):
+                return []
+            self._unplace(task.id)
+            if task.status is Status.COMPLETED:
+                return []
+            earliest = max(self.start, now)
+            if not self._place(task, earliest):
+                return []
+            slot = self._slots[task.id]
+            if task.due_ts is None or slot[1] <= task.due_ts:
+                return [task.id]
+
+            # Late: take back the slots before the deadline held by tasks due later
+            key = self._entries[task.id][0]
+            first = bisect_left(self._timeline, (earliest,))
+            last = bisect_left(self._timeline, (task.due_ts,))
+            later = sorted(self._entries[task_id][0] for _, task_id in self._timeline[first:last]
+                           if self._entries[task_id][0] > key)
+            if not later:
+                return [task.id]
+            previous = {other[2]: self._slots[other[2]] for other in later}
+            for other in later:
+                self._unplace(other[2], forget=False)
+            self._unplace(task.id, forget=False)
+            changed = [task.id]
+            for other in [key] + later:
+                task_id = other[2]
+                if not self._place_entry(task_id, earliest):
+                    continue
+                if task_id != task.id and previous[task_id] != self._slots[task_id]:
+                    changed.append(task_id)
+            return changed
+
+    def remove(self, task_id: str):
+        """Free a task's slot; other tasks keep theirs"""
+        with self._lock:
+            self._remove_series(task_id)
+            self._unplace(task_id)
+
+    def _unplace(self, task_id: str, forget: bool = True):
+        self.unscheduled.discard(task_id)
+        if forget:
+            self._entries.pop(task_id, None)
+        slot = self._slots.pop(task_id, None)
+        if slot is None:
+            return
+        del self._timeline[bisect_left(self._timeline, (slot[0], task_id))]
+        self._release(slot)
+
+    # Results
+
+    def slot(self, task_id: str) -> Optional[Tuple[float, float]]:
+        """(start, end) of a task's block, preparation and buffer included"""
+        return self._slots.get(task_id)
+
+    def slots(self) -> List[Tuple[float, float, str]]:
+        """Every planned block as (start, end, task_id), in time order"""
+        with self._lock:
+            return sorted((begin, end, task_id) for task_id, (begin, end) in self._slots.items())
+
+    def late(self) -> List[str]:
+        """Ids of planned tasks whose block ends after their due date"""
+        with self._lock:
+            return [task_id for task_id, (_, end) in self._slots.items()
+                    if self._entries[task_id][0][0] < end]
+
+    def apply(self, tasks: List[Task]) -> List[Task]:
+        """Set `scheduled_time` (work start, after preparation) from the plan.
+
+        Returns the tasks whose scheduled time changed.
+        """
+        changed = []
+        for task in tasks:
+            slot = self._slots.get(task.id)
+            if slot is None:
+                continue
+            scheduled_ts = slot[0] + (task.preparation_time or 0) * 60.0
+            if task.scheduled_ts != scheduled_ts:
+                task.scheduled_ts = scheduled_ts
+                changed.append(task)
+        return changed
+
+    # Storage integration
+
+    def attach(self, storage):
+        """Pack a storage backend's pending tasks and follow its mutations"""
+        self._storage = storage
+        self.pack(storage.get_all_tasks())
+        storage.add_listener(self.on_change)
+
+    def on_change(self, op: str, task_id: Optional[str], task: Optional[Task]):
+        """Storage listener callback"""
+        if op in ('add', 'update'):
+            self.add(task)
+        elif op == 'delete':
+            self.remove(task_id)
+        elif op == 'reset':
+            self.pack(self._storage.get_all_tasks())
@@ -0,0 +1,276 @@
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+from typing import Callable, List, Optional
+
+from models import Task
+
+
+class Stage:
+    """One agent step of an `AgentPipeline`.
+
+    `func` takes an item and returns the item for the next stage (None
+    drops it). It may be a coroutine function, a plain function that is
+    cheap enough to run on the event loop, or, with `threaded`, a blocking
+    call that runs in the default thread pool. `concurrency` workers serve
+    the stage, each call is limited to `timeout` seconds, and at most
+    `queue_size` items wait in front of it.
+    """
+
+    def __init__(self, name: str, func: Callable, concurrency: int = 1,
+                 timeout: float = None, threaded: bool = False, queue_size: int = 100):
+        if concurrency < 1:
+            raise ValueError("a stage needs at least one worker")
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.threaded = threaded
+        self.queue_size = queue_size
+
+    async def run(self, item):
+        if self.threaded:
+            call = asyncio.get_running_loop().run_in_executor(None, self.func, item)
+        else:
+            call = self.func(item)
+            if not inspect.isawaitable(call):
+                return call
+        return await asyncio.wait_for(call, self.timeout)
+
+
+class _Job:
+    __slots__ = ('item', 'future')
+
+    def __init__(self, item, future: asyncio.Future):
+        self.item = item
+        self.future = future
+
+
+class AgentPipeline:
+    """Agents as concurrent asyncio stages feeding batched storage writes.
+
+    Each stage reads from a bounded queue and writes to the next one, so a
+    slow stage holds back its producers instead of buffering without limit,
+    and `put` waits while the first queue is full. Tasks leaving the last
+    stage are stored with one `transaction()` per batch of up to
+    `batch_size`, collected for at most `flush_interval` seconds.
+    `before_write(tasks)` runs inside that transaction, before the batch is
+    added, and may update the tasks in place.
+
+    Every item gets a future for the stored Task. It fails with the stage's
+    exception (`asyncio.TimeoutError` on a timeout), resolves to None when a
+    stage drops the item, and cancelling it skips the item's remaining
+    stages. Use the pipeline from asyncio code (`async with`, `put`,
+    `process`) or, from a thread such as the Streamlit script, via
+    `start_background` and `submit`.
+    """
+
+    def __init__(self, stages: List[Stage], storage, batch_size: int = 100,
+                 flush_interval: float = 0.05, before_write: Callable = None):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        self.stages = stages
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.before_write = before_write
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+        self._closed = False
+
+    # asyncio interface
+
+    async def start(self):
+        """Start the stage workers and the writer on the running loop"""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        self._queues = [asyncio.Queue(stage.queue_size) for stage in self.stages]
+        self._queues.append(asyncio.Queue(self.batch_size))
+        for stage, inbox, outbox in zip(self.stages, self._queues, self._queues[1:]):
+            for n in range(stage.concurrency):
+                self._workers.append(asyncio.create_task(self._work(stage, inbox, outbox),
+                                                         name=f"{stage.name}-{n}"))
+        self._workers.append(asyncio.create_task(self._write(self._queues[-1]), name="storage-writer"))
+
+    async def put(self, item) -> asyncio.Future:
+        """Queue an item, waiting while the first stage is full; returns its future"""
+        if self._closed or not self._workers:
+            raise RuntimeError("pipeline is not running")
+        future = self._loop.create_future()
+        await self._queues[0].put(_Job(item, future))
+        return future
+
+    async def process(self, item) -> Optional[Task]:
+        """Run one item through the pipeline and return the stored task"""
+        return await (await self.put(item))
+
+    async def join(self):
+        """Wait until every queued item has been stored or failed"""
+        for queue in self._queues:
+            await queue.join()
+
+    async def close(self):
+        """Finish the queued items, then stop the workers"""
+        self._closed = True
+        await self.join()
+        await self._stop_workers()
+
+    async def cancel(self):
+        """Stop the workers now and cancel every item still queued"""
+        self._closed = True
+        await self._stop_workers()
+        for queue in self._queues:
+            while not queue.empty():
+                queue.get_nowait().future.cancel()
+                queue.task_done()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.cancel()
+
+    async def _stop_workers(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self, stage: Stage, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            job = await inbox.get()
+            try:
+                if job.future.done():  # cancelled by the caller
+                    continue
+                result = await stage.run(job.item)
+                if job.future.done():
+                    continue
+                if result is None:
+                    job.future.set_result(None)
+                else:
+                    job.item = result
+                    await outbox.put(job)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                inbox.task_done()
+
+    async def _write(self, inbox: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await inbox.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if inbox.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(inbox.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(inbox.get_nowait())
+            try:
+                live = [job for job in batch if not job.future.done()]
+                if live:
+                    stored = await loop.run_in_executor(None, self._store, [job.item for job in live])
+                    for job, ok in zip(live, stored):
+                        if job.future.done():
+                            continue
+                        if ok:
+                            job.future.set_result(job.item)
+                        else:
+                            job.future.set_exception(RuntimeError(f"Error saving task {job.item.id}"))
+            except asyncio.CancelledError:
+                for job in batch:
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                print(f"Error writing task batch: {e}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            finally:
+                for _ in batch:
+                    inbox.task_done()
+
+    def _store(self, tasks: List[Task]) -> List[bool]:
+        """One storage transaction for a batch; per-task success"""
+        with self.storage.transaction():
+            if self.before_write is not None:
+                self.before_write(tasks)
+            return [bool(self.storage.add_task(task)) for task in tasks]
+
+    # Thread interface
+
+    def start_background(self):
+        """Run the pipeline on its own event loop in a daemon thread"""
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="agent-pipeline", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def submit(self, item) -> concurrent.futures.Future:
+        """Queue an item from another thread; returns a future for the stored task
+
+        Blocks while the first stage's queue is full.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.put(item), self._loop).result()
+        return asyncio.run_coroutine_threadsafe(self._wait(future), self._loop)
+
+    @staticmethod
+    async def _wait(future: asyncio.Future):
+        return await future
+
+    def stop_background(self, drain: bool = True):
+        """Stop the background loop, finishing queued items unless `drain` is false"""
+        if self._thread is None:
+            return
+        stop = self.close() if drain else self.cancel()
+        asyncio.run_coroutine_threadsafe(stop, self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+
+def task_creation_pipeline(planner, scheduler, storage, planner_concurrency: int = 4,
+                           scheduler_concurrency: int = 1, timeout: float = None,
+                           extra_stages: List[Stage] = (), **options) -> AgentPipeline:
+    """Planner -> Scheduler -> (extra stages) -> storage for task requests.
+
+    Items are `planner.create_task` keyword arguments (title, description,
+    priority, due_date and optionally recurrence). `planner.create_task` may be a coroutine, as for a
+    remote planner; a blocking one should be wrapped in a threaded Stage.
+    """
+    stages = [
+        Stage(planner.name, lambda request: planner.create_task(**request),
+              concurrency=planner_concurrency, timeout=timeout),
+        Stage(scheduler.name, scheduler.schedule_task, concurrency=scheduler_concurrency, timeout=timeout),
+    ]
+    stages.extend(extra_stages)
+    return AgentPipeline(stages, storage, **options)
@@ -0,0 +1,393 @@
+import calendar
+import functools
+import heapq
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Iterable, Iterator, Optional, Tuple
+
+from models import Task, Status, format_timestamp, parse_timestamp
+
+# Keys a recurring task (a "series") keeps in `Task.extra`
+RECURRENCE_KEY = 'recurrence'  # the rule, as an RRULE string
+EXCEPTIONS_KEY = 'exceptions'  # occurrence key -> changed fields, or {'skipped': True}
+COMPLETIONS_KEY = 'completions'  # occurrence key -> completed date
+SERIES_KEYS = frozenset((RECURRENCE_KEY, EXCEPTIONS_KEY, COMPLETIONS_KEY))
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# Shorthands accepted by `RecurrenceRule.parse`
+PRESETS = {
+    'daily': 'FREQ=DAILY',
+    'weekdays': 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+    'weekly': 'FREQ=WEEKLY',
+    'monthly': 'FREQ=MONTHLY',
+    'yearly': 'FREQ=YEARLY',
+}
+# Missed occurrences older than this are no longer reminded about or scheduled
+OVERDUE_LOOKBACK = timedelta(days=1).total_seconds()
+
+_UNTIL_FORMAT = '%Y%m%dT%H%M%S'
+_due_ts = attrgetter('due_ts')
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip('Z')
+    for fmt in (_UNTIL_FORMAT, '%Y%m%d'):
+        try:
+            until = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        # A bare date includes the whole day
+        return until if fmt == _UNTIL_FORMAT else until.replace(hour=23, minute=59, second=59)
+    return datetime.fromisoformat(value)
+
+
+class RecurrenceRule:
+    """RRULE-like recurrence: FREQ, INTERVAL, BYDAY (weekly), COUNT and UNTIL.
+
+    Occurrences keep the time of day of the series start. WEEKLY rules
+    repeat on the BYDAY weekdays (default: the start's weekday) of every
+    INTERVAL-th week, weeks starting on Monday; MONTHLY and YEARLY ones on
+    the start's day of the month, skipping months too short for it. COUNT
+    and UNTIL end the series; without either it runs forever. Rules are
+    immutable, so parsed ones are shared (see `parse_rule`).
+    """
+
+    __slots__ = ('freq', 'interval', 'weekdays', 'count', 'until')
+
+    def __init__(self, freq: str, interval: int = 1, weekdays: Iterable[int] = (),
+                 count: int = None, until: datetime = None):
+        freq = freq.upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown recurrence frequency {freq!r}, expected one of {FREQUENCIES}")
+        if interval < 1:
+            raise ValueError("recurrence interval must be at least 1")
+        if count is not None and count < 1:
+            raise ValueError("recurrence count must be at least 1")
+        self.freq = freq
+        self.interval = interval
+        self.weekdays = tuple(sorted(set(weekdays)))
+        if self.weekdays and freq != 'WEEKLY':
+            raise ValueError("BYDAY is only supported for weekly rules")
+        self.count = count
+        self.until = until
+
+    @classmethod
+    def parse(cls, text: str) -> 'RecurrenceRule':
+        """Rule from an RRULE string such as 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10' or a preset name"""
+        text = PRESETS.get(text.strip().lower(), text.strip())
+        if text.upper().startswith('RRULE:'):
+            text = text[6:]
+        parts = {}
+        for part in filter(None, text.split(';')):
+            name, _, value = part.partition('=')
+            parts[name.strip().upper()] = value.strip()
+        if 'FREQ' not in parts:
+            raise ValueError(f"Recurrence rule {text!r} has no FREQ")
+        try:
+            weekdays = [WEEKDAYS.index(day.strip().upper()) for day in parts['BYDAY'].split(',')] \
+                if parts.get('BYDAY') else ()
+        except ValueError:
+            raise ValueError(f"Unknown weekday in BYDAY={parts['BYDAY']!r}") from None
+        return cls(parts['FREQ'], int(parts.get('INTERVAL', 1)), weekdays,
+                   int(parts['COUNT']) if 'COUNT' in parts else None,
+                   _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None)
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.weekdays:
+            parts.append("BYDAY=" + ','.join(WEEKDAYS[day] for day in self.weekdays))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.strftime(_UNTIL_FORMAT)}")
+        return ';'.join(parts)
+
+    def __repr__(self) -> str:
+        return f"RecurrenceRule({str(self)!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RecurrenceRule) and str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def describe(self) -> str:
+        """Human-readable form, e.g. 'every 2 weeks on Mon, Wed'"""
+        unit = {'DAILY': 'day', 'WEEKLY': 'week', 'MONTHLY': 'month', 'YEARLY': 'year'}[self.freq]
+        text = f"every {unit}" if self.interval == 1 else f"every {self.interval} {unit}s"
+        if self.weekdays:
+            text += " on " + ', '.join(calendar.day_abbr[day] for day in self.weekdays)
+        if self.count is not None:
+            text += f", {self.count} times"
+        if self.until is not None:
+            text += f", until {self.until.strftime('%m/%d/%Y')}"
+        return text
+
+    @property
+    def is_finite(self) -> bool:
+        return self.count is not None or self.until is not None
+
+    # Expansion
+
+    def starts(self, dtstart: datetime, after: datetime = None) -> Iterator[datetime]:
+        """Yield occurrence times from `dtstart` on, lazily; with `after`, only those at or after it.
+
+        Periods (days, weeks, months) before `after` are skipped
+        arithmetically, so starting late in a long series costs no more
+        than starting at its beginning.
+        """
+        period = 0 if after is None or after <= dtstart else self._period_of(dtstart, after)
+        index = self._count_before(dtstart, period) if self.count is not None else 0
+        while True:
+            try:
+                candidates = list(self._period(dtstart, period))
+            except OverflowError:  # past year 9999
+                return
+            for start in candidates:
+                if start < dtstart:
+                    continue
+                if self.count is not None and index >= self.count:
+                    return
+                if self.until is not None and start > self.until:
+                    return
+                index += 1
+                if after is None or start >= after:
+                    yield start
+            period += 1
+
+    def _period_of(self, dtstart: datetime, moment: datetime) -> int:
+        """The period containing `moment`, or one before it"""
+        if self.freq == 'DAILY':
+            return (moment - dtstart).days // self.interval
+        if self.freq == 'WEEKLY':
+            week = dtstart.date() - timedelta(days=dtstart.weekday())
+            return (moment.date() - week).days // (7 * self.interval)
+        months = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+        return max(0, months) // self._months()
+
+    def _months(self) -> int:
+        return self.interval * (12 if self.freq == 'YEARLY' else 1)
+
+    def _period(self, dtstart: datetime, period: int) -> Iterator[datetime]:
+        """Candidate occurrence times of one period, in order"""
+        if self.freq == 'DAILY':
+            yield dtstart + timedelta(days=period * self.interval)
+        elif self.freq == 'WEEKLY':
+            week = dtstart - timedelta(days=dtstart.weekday() - 7 * self.interval * period)
+            for day in self.weekdays or (dtstart.weekday(),):
+                yield week + timedelta(days=day)
+        else:
+            month = dtstart.month - 1 + period * self._months()
+            year, month = dtstart.year + month // 12, month % 12 + 1
+            if year > datetime.max.year:
+                raise OverflowError("date out of range")
+            if dtstart.day <= calendar.monthrange(year, month)[1]:
+                yield dtstart.replace(year=year, month=month)
+
+    def _count_before(self, dtstart: datetime, period: int) -> int:
+        """Occurrences (ignoring COUNT and UNTIL) in the periods before `period`"""
+        if period <= 0:
+            return 0
+        if self.freq == 'DAILY':
+            return period
+        if self.freq == 'WEEKLY':
+            weekdays = self.weekdays or (dtstart.weekday(),)
+            return period * len(weekdays) - sum(1 for day in weekdays if day < dtstart.weekday())
+        if dtstart.day <= 28:
+            return period
+        return sum(1 for p in range(period) for _ in self._period(dtstart, p))
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_rule(text: str) -> RecurrenceRule:
+    """`RecurrenceRule.parse`, cached: series are expanded far more often than edited"""
+    return RecurrenceRule.parse(text)
+
+
+# Series and occurrences
+
+def is_series(task) -> bool:
+    """Whether a Task record carries a recurrence rule"""
+    return task.extra is not None and RECURRENCE_KEY in task.extra
+
+
+def series_rule(task: Task) -> Optional[RecurrenceRule]:
+    return parse_rule(task.extra[RECURRENCE_KEY]) if is_series(task) else None
+
+
+def make_series(task: Task, rule) -> Task:
+    """Turn `task` into a series repeating by `rule` (a rule, RRULE string or preset) from its due date"""
+    if task.due_ts is None:
+        raise ValueError("a recurring task needs a due date to start from")
+    rule = rule if isinstance(rule, RecurrenceRule) else parse_rule(rule)
+    task.set_extra(RECURRENCE_KEY, str(rule))
+    return task
+
+
+def series_signature(task: Task) -> tuple:
+    """Everything about a series' occurrences besides the task fields, for change detection"""
+    extra = task.extra or {}
+    return (extra.get(RECURRENCE_KEY), tuple(sorted(extra.get(COMPLETIONS_KEY, {}).items())),
+            repr(sorted(extra.get(EXCEPTIONS_KEY, {}).items())))
+
+
+def occurrence_key(timestamp: float) -> str:
+    """Key of the occurrence originally due at `timestamp`: its local ISO time"""
+    return format_timestamp(timestamp)
+
+
+def occurrence_id(series_id: str, key: str) -> str:
+    return f"{series_id}@{key}"
+
+
+def split_occurrence_id(task_id: str) -> Optional[Tuple[str, str]]:
+    """(series id, occurrence key) of an occurrence id, or None for any other id"""
+    series_id, sep, key = task_id.rpartition('@')
+    return (series_id, key) if sep and series_id else None
+
+
+def _occurrence(series: Task, key: str, timestamp: float) -> Task:
+    """The task for one occurrence, with its exception and completion applied"""
+    task = series.copy()
+    task.id = occurrence_id(series.id, key)
+    if series.scheduled_ts is not None:
+        task.scheduled_ts = series.scheduled_ts + timestamp - series.due_ts
+    task.due_ts = timestamp
+    task.extra = {k: v for k, v in series.extra.items() if k not in SERIES_KEYS}
+    task.extra.update(series_id=series.id, occurrence=key)
+    for field, value in series.extra.get(EXCEPTIONS_KEY, {}).get(key, {}).items():
+        if field != 'skipped':
+            task[field] = value
+    completed = series.extra.get(COMPLETIONS_KEY, {}).get(key)
+    if completed is not None:
+        task.status = Status.COMPLETED
+        task.completed_ts = parse_timestamp(completed)
+    return task
+
+
+def occurrences(series: Task, start: float = None, end: float = None) -> Iterator[Task]:
+    """Yield the occurrences of a series due in [start, end), in due order, one at a time.
+
+    Skipped occurrences are left out; moved ones (a 'due_date' exception)
+    appear at their new time. Without `end` an open-ended series never
+    stops, so take what you need.
+    """
+    if series.due_ts is None:
+        return
+    rule = series_rule(series)
+    exceptions = series.extra.get(EXCEPTIONS_KEY, {})
+    moved = []
+    for key, changes in exceptions.items():
+        if 'due_date' in changes and not changes.get('skipped'):
+            timestamp = parse_timestamp(changes['due_date'])
+            if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                moved.append(_occurrence(series, key, parse_timestamp(key)))
+    moved.sort(key=_due_ts)
+
+    def in_place():
+        after = None if start is None else datetime.fromtimestamp(start)
+        for moment in rule.starts(datetime.fromtimestamp(series.due_ts), after):
+            timestamp = moment.timestamp()
+            if end is not None and timestamp >= end:
+                return
+            key = occurrence_key(timestamp)
+            changes = exceptions.get(key)
+            if changes and (changes.get('skipped') or 'due_date' in changes):
+                continue
+            yield _occurrence(series, key, timestamp)
+
+    yield from heapq.merge(in_place(), moved, key=_due_ts) if moved else in_place()
+
+
+def expand(tasks: Iterable, start: float = None, end: float = None) -> Iterator[Task]:
+    """Yield one-off tasks as they are and the occurrences of each series due in [start, end)"""
+    for task in tasks:
+        task = Task.coerce(task)
+        if is_series(task):
+            yield from occurrences(task, start, end)
+        else:
+            yield task
+
+
+def next_occurrence(series: Task, after: float, include_completed: bool = False) -> Optional[Task]:
+    """The first open (or, with `include_completed`, any) occurrence due at or after `after`"""
+    for task in occurrences(series, after):
+        if include_completed or task.status is not Status.COMPLETED:
+            return task
+    return None
+
+
+def get_occurrence(series: Task, key: str) -> Optional[Task]:
+    """The occurrence with a given key, or None if the rule has no such occurrence or it was skipped"""
+    changes = series.extra.get(EXCEPTIONS_KEY, {}).get(key, {})
+    if changes.get('skipped'):
+        return None
+    timestamp = parse_timestamp(key)
+    start = datetime.fromtimestamp(series.due_ts)
+    if next(series_rule(series).starts(start, datetime.fromtimestamp(timestamp)), None) \
+            != datetime.fromtimestamp(timestamp):
+        return None
+    return _occurrence(series, key, timestamp)
+
+
+def resolve_task(storage, task_id: str) -> Optional[Task]:
+    """A stored task, or the occurrence an occurrence id stands for"""
+    task = storage.get_task_by_id(task_id)
+    if task is not None:
+        return task
+    parts = split_occurrence_id(task_id)
+    if parts is None:
+        return None
+    series = storage.get_task_by_id(parts[0])
+    if series is None or not is_series(series):
+        return None
+    return get_occurrence(series, parts[1])
+
+
+# Editing a series: each returns an updated copy to store with `update_task`
+
+def _with_entry(series: Task, name: str, key: str, value) -> Task:
+    series = series.copy()
+    entries = dict(series.extra.get(name, {}))
+    if value is None:
+        entries.pop(key, None)
+    else:
+        entries[key] = value
+    if entries:
+        series.extra[name] = entries
+    else:
+        series.extra.pop(name, None)
+    return series
+
+
+def complete_occurrence(series: Task, key: str, completed_ts: float = None) -> Task:
+    """Mark one occurrence done; a finite series with nothing left open is completed too"""
+    completed_ts = datetime.now().timestamp() if completed_ts is None else completed_ts
+    series = _with_entry(series, COMPLETIONS_KEY, key, format_timestamp(completed_ts))
+    if series_rule(series).is_finite and next_occurrence(series, series.due_ts) is None:
+        series.status = Status.COMPLETED
+        series.completed_ts = completed_ts
+    return series
+
+
+def reopen_occurrence(series: Task, key: str) -> Task:
+    """Undo `complete_occurrence` for one occurrence"""
+    series = _with_entry(series, COMPLETIONS_KEY, key, None)
+    series.status = Status.PENDING
+    series.completed_ts = None
+    return series
+
+
+def skip_occurrence(series: Task, key: str) -> Task:
+    """Cancel one occurrence of a series"""
+    return _with_entry(series, EXCEPTIONS_KEY, key, {'skipped': True})
+
+
+def edit_occurrence(series: Task, key: str, **changes) -> Task:
+    """Override fields (in the task dict shape, e.g. due_date='...') of one occurrence"""
+    merged = dict(series.extra.get(EXCEPTIONS_KEY, {}).get(key, {}))
+    merged.update(changes)
+    return _with_entry(series, EXCEPTIONS_KEY, key, merged)
@@ -0,0 +1,298 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
+
+from models import Task, Status
+from recurrence import OVERDUE_LOOKBACK, is_series, occurrence_id, occurrences, resolve_task, series_signature
+
+DEFAULT_THRESHOLDS = ((30 * 60.0, "due_in_0:30:00"),)
+
+
+class ReminderScheduler:
+    """Min-heap of upcoming reminder instants, one per (task, threshold).
+
+    Each open task contributes an entry at `due - threshold` for every
+    threshold of its priority plus an 'overdue' entry at `due`. Entries are
+    invalidated lazily: re-tracking or untracking a task bumps its generation
+    and stale entries are dropped when they reach the top of the heap, so
+    `pop_due` costs O(k log N) for k due reminders. Updates that leave the due
+    date, priority and status alone keep the existing entries, so reminders
+    that already fired are not repeated.
+
+    A recurring task has the entries of one occurrence at a time, the oldest
+    open one not yet past `OVERDUE_LOOKBACK`; once its 'overdue' entry fires
+    the next occurrence's entries take its place.
+    """
+
+    def __init__(self, thresholds_by_priority: Dict[str, tuple]):
+        self.thresholds_by_priority = thresholds_by_priority
+        self._heap: List[tuple] = []
+        # task id -> [generation, live entries still in the heap]
+        self._tracked: Dict[str, list] = {}
+        # task id -> (due_ts, priority, status) the entries were built from
+        self._signatures: Dict[str, tuple] = {}
+        # series id -> series, to line up its next occurrence
+        self._series: Dict[str, Task] = {}
+        self._counter = itertools.count()
+        self._stale = 0
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._stale
+
+    def track(self, task: Task, now: float = None):
+        """(Re)schedule the reminders for a task"""
+        signature = self._signature(task)
+        if self._signatures.get(task.id) == signature:
+            return
+        self.untrack(task.id)
+        self._signatures[task.id] = signature
+        for entry in self._entries_for(task, time.time() if now is None else now):
+            heapq.heappush(self._heap, entry)
+
+    def untrack(self, task_id: str):
+        """Drop every pending reminder for a task"""
+        self._signatures.pop(task_id, None)
+        self._series.pop(task_id, None)
+        tracked = self._tracked.pop(task_id, None)
+        if tracked is not None:
+            self._stale += tracked[1]
+            self._maybe_compact()
+
+    def rebuild(self, tasks, now: float = None):
+        """Replace the heap with the reminders for `tasks`"""
+        now = time.time() if now is None else now
+        self._tracked = {}
+        self._signatures = {}
+        self._series = {}
+        self._stale = 0
+        heap = []
+        for task in tasks:
+            self._signatures[task.id] = self._signature(task)
+            heap.extend(self._entries_for(task, now))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    @staticmethod
+    def _signature(task: Task) -> tuple:
+        signature = (task.due_ts, task.priority, task.status)
+        return signature + series_signature(task) if is_series(task) else signature
+
+    def _entries_for(self, task: Task, now: float, after: float = None) -> List[tuple]:
+        """Heap entries for a task's upcoming reminders, registering its generation
+
+        For a series, the entries of its first open occurrence due after
+        `after`, by default the oldest one within `OVERDUE_LOOKBACK`.
+        """
+        if task.status is Status.COMPLETED or task.due_ts is None:
+            return []
+
+        task_id = task.id
+        key = None
+        if is_series(task):
+            self._series[task_id] = task
+            task = self._next_open(task, now - OVERDUE_LOOKBACK if after is None else after, after is not None)
+            if task is None:
+                return []
+            key = task.extra['occurrence']
+
+        thresholds = self.thresholds_by_priority.get(task.priority.label, DEFAULT_THRESHOLDS)
+        triggers = [(task.due_ts - seconds, reminder_type) for seconds, reminder_type in thresholds]
+        triggers.append((task.due_ts, 'overdue'))
+
+        # Of the instants already passed, only the most recent one still matters
+        past = [trigger for trigger in triggers if trigger[0] <= now]
+        if past:
+            latest = max(past, key=lambda trigger: trigger[0])
+            triggers = [trigger for trigger in triggers if trigger[0] > now] + [latest]
+
+        generation = next(self._counter)
+        self._tracked[task_id] = [generation, len(triggers)]
+        return [(trigger_ts, generation, task_id, reminder_type, key)
+                for trigger_ts, reminder_type in triggers]
+
+    @staticmethod
+    def _next_open(series: Task, after: float, strict: bool) -> Optional[Task]:
+        for occurrence in occurrences(series, after):
+            if strict and occurrence.due_ts <= after:
+                continue
+            if occurrence.status is not Status.COMPLETED:
+                return occurrence
+        return None
+
+    def next_trigger(self) -> Optional[float]:
+        """Instant of the earliest live reminder, or None"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+            self._stale -= 1
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float = None) -> List[Tuple[str, str]]:
+        """Remove and return (task_id, reminder_type) for every reminder due by `now`
+
+        Reminders for an occurrence of a series carry its occurrence id.
+        """
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._is_live(entry):
+                self._stale -= 1
+                continue
+            trigger_ts, _, task_id, reminder_type, key = entry
+            tracked = self._tracked[task_id]
+            tracked[1] -= 1
+            if not tracked[1]:
+                del self._tracked[task_id]
+                if key is not None:
+                    # The occurrence's last reminder: line up the next one
+                    after = max(trigger_ts, now - OVERDUE_LOOKBACK)
+                    for next_entry in self._entries_for(self._series[task_id], now, after):
+                        heapq.heappush(self._heap, next_entry)
+            due.append((task_id if key is None else occurrence_id(task_id, key), reminder_type))
+        return due
+
+    def _is_live(self, entry: tuple) -> bool:
+        tracked = self._tracked.get(entry[2])
+        return tracked is not None and tracked[0] == entry[1]
+
+    def _maybe_compact(self):
+        """Rebuild the heap once stale entries outnumber live ones"""
+        if self._stale > max(64, len(self._heap) // 2):
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+
+class ReminderService:
+    """Background service that pushes reminders as they become due.
+
+    The service listens to a storage backend's mutations to keep its
+    `ReminderScheduler` current, sleeps until the next trigger instant and
+    then publishes a notification for each due reminder. Consumers either
+    `subscribe` a callback or poll `notifications_since(seq)`.
+    """
+
+    def __init__(self, reminder_agent, storage=None, history=200, max_wait=60.0):
+        self.reminder_agent = reminder_agent
+        self.scheduler = ReminderScheduler(reminder_agent.threshold_seconds())
+        self.storage = None
+        self.max_wait = max_wait
+        self.notifications = deque(maxlen=history)
+        self._subscribers = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        if storage is not None:
+            self.attach(storage)
+
+    def attach(self, storage, rebuild: bool = None):
+        """Follow a storage backend's mutations.
+
+        The heap is rebuilt from the storage on the first attach (or when
+        `rebuild` is true); re-attaching to a fresh instance over the same
+        data, e.g. after a Streamlit rerun, only moves the listener.
+        """
+        if storage is self.storage:
+            return
+        if rebuild is None:
+            rebuild = self.storage is None or storage.filename != self.storage.filename
+        if self.storage is not None:
+            self.storage.remove_listener(self._on_change)
+        self.storage = storage
+        storage.add_listener(self._on_change)
+        if rebuild:
+            # Read the storage before taking our lock: its writers call
+            # `_on_change` while holding theirs
+            tasks = storage.get_all_tasks()
+            with self._cond:
+                self.scheduler.rebuild(tasks)
+                self._cond.notify()
+
+    def subscribe(self, callback):
+        """Call `callback(notification)` for every reminder pushed"""
+        self._subscribers.append(callback)
+
+    def notifications_since(self, seq: int) -> List[Dict]:
+        """Notifications newer than `seq`, oldest first"""
+        with self._cond:
+            return [note for note in self.notifications if note['seq'] > seq]
+
+    def start(self):
+        """Start the background thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="reminder-service", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def tick(self, now: float = None) -> List[Dict]:
+        """Publish every reminder due by `now`; the background thread calls this"""
+        with self._cond:
+            due = self.scheduler.pop_due(now)
+        published = []
+        for task_id, reminder_type in due:
+            task = resolve_task(self.storage, task_id) if self.storage is not None else None
+            if task is None:
+                continue
+            published.append(self._publish(task, reminder_type))
+        return published
+
+    def _on_change(self, op: str, task_id: Optional[str], task: Optional[Task]):
+        tasks = self.storage.get_all_tasks() if op == 'reset' else None
+        with self._cond:
+            if op in ('add', 'update'):
+                self.scheduler.track(task)
+            elif op == 'delete':
+                self.scheduler.untrack(task_id)
+            elif op == 'reset':
+                self.scheduler.rebuild(tasks)
+            self._cond.notify()
+
+    def _publish(self, task: Task, reminder_type: str) -> Dict:
+        with self._cond:
+            self._seq += 1
+            note = {
+                'seq': self._seq,
+                'task_id': task.id,
+                'title': task.title,
+                'reminder_type': reminder_type,
+                'message': self.reminder_agent.create_reminder_message(task),
+                'time': datetime.now().strftime("%H:%M"),
+            }
+            self.notifications.append(note)
+        for callback in list(self._subscribers):
+            try:
+                callback(note)
+            except Exception as e:
+                print(f"Error in reminder subscriber: {e}")
+        return note
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                next_trigger = self.scheduler.next_trigger()
+                wait = self.max_wait if next_trigger is None else next_trigger - time.time()
+                if wait > 0:
+                    self._cond.wait(min(wait, self.max_wait))
+                    continue
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error checking reminders: {e}")
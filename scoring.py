@@ -0,0 +1,113 @@
+import heapq
+import math
+import time
+from operator import attrgetter
+from typing import List, Optional, Sequence, Tuple
+
+from models import Task, Status
+
+try:
+    import numpy
+except ImportError:  # scoring falls back to plain Python
+    numpy = None
+
+SECONDS_PER_DAY = 86400
+# Below this many tasks building the arrays costs more than the loop saves
+VECTORIZE_MIN_TASKS = 64
+
+
+class UrgencyScore:
+    """Default optimization score: urgency by whole days until due, plus priority rank.
+
+    A scoring formula provides `score` for one task and `score_array` for
+    NumPy columns; both receive the days until due (floored, `inf` for tasks
+    without a due date) and the priority rank (1-3). Subclass and override
+    both to plug in a different formula.
+    """
+
+    def score(self, days_until_due, priority_rank):
+        return max(1, 5 - days_until_due) + priority_rank  # More urgent = higher score
+
+    def score_array(self, days_until_due, priority_rank):
+        return numpy.maximum(1, 5 - days_until_due) + priority_rank
+
+
+_due_ts = attrgetter('due_ts')
+_priority_rank = attrgetter('priority.rank')
+
+
+class TaskColumns:
+    """Due timestamps and priority ranks of a task list as NumPy arrays.
+
+    Attributes are pulled out with `attrgetter` so the only per-task Python
+    work is the extraction itself; everything after that is vectorized.
+    """
+
+    def __init__(self, tasks: List[Task]):
+        # None becomes NaN under a float dtype; no due date means never urgent
+        self.due = numpy.array(list(map(_due_ts, tasks)), dtype=numpy.float64)
+        self.due[numpy.isnan(self.due)] = math.inf
+        self.priority = numpy.fromiter(map(_priority_rank, tasks), numpy.int64, len(tasks))
+
+    def days_until_due(self, now: float):
+        return numpy.floor((self.due - now) / SECONDS_PER_DAY)
+
+
+def score_tasks(tasks: List[Task], formula=None, now: float = None,
+                vectorize: Optional[bool] = None) -> Tuple[List[Task], Sequence]:
+    """Set `optimization_score` on every pending task.
+
+    Returns the pending tasks and their scores (a NumPy array on the
+    vectorized path, else a list). The vectorized path is used when NumPy is
+    installed and the list is long enough, unless `vectorize` says
+    otherwise; both give the same scores.
+    """
+    formula = formula or UrgencyScore()
+    now = time.time() if now is None else now
+    if vectorize is None:
+        vectorize = numpy is not None and len(tasks) >= VECTORIZE_MIN_TASKS
+
+    pending_status = Status.PENDING  # a local: Enum class attribute lookups are slow
+    pending = [t for t in tasks if t.status is pending_status]
+    if not vectorize:
+        scores = []
+        for task in pending:
+            days = math.inf if task.due_ts is None else math.floor((task.due_ts - now) / SECONDS_PER_DAY)
+            task.optimization_score = formula.score(days, task.priority.rank)
+            scores.append(task.optimization_score)
+        return pending, scores
+
+    columns = TaskColumns(pending)
+    scores = formula.score_array(columns.days_until_due(now), columns.priority)
+    if scores.dtype.kind == 'f' and numpy.array_equal(scores, numpy.floor(scores)):
+        scores = scores.astype(numpy.int64)
+    for task, score in zip(pending, scores.tolist()):
+        task.optimization_score = score
+    return pending, scores
+
+
+def rank(scores, top_k: int = None) -> List[int]:
+    """Indices of `scores` from highest to lowest, ties in original order.
+
+    This is the order of a stable descending sort. With `top_k` only the
+    first `top_k` indices are computed, using `argpartition` on NumPy
+    arrays and a heap otherwise.
+    """
+    count = len(scores)
+    if top_k is not None and top_k <= 0:
+        return []
+
+    if numpy is None or not isinstance(scores, numpy.ndarray):
+        if top_k is None or top_k >= count:
+            return sorted(range(count), key=lambda i: -scores[i])
+        return heapq.nsmallest(top_k, range(count), key=lambda i: (-scores[i], i))
+
+    keys = -scores
+    if top_k is None or top_k >= count:
+        return numpy.argsort(keys, kind='stable').tolist()
+    cutoff = keys[numpy.argpartition(keys, top_k - 1)[top_k - 1]]
+    better = numpy.flatnonzero(keys < cutoff)
+    ties = numpy.flatnonzero(keys == cutoff)[:top_k - len(better)]
+    chosen = numpy.concatenate((better, ties))
+    chosen.sort()
+    return chosen[numpy.argsort(keys[chosen], kind='stable')].tolist()
@@ -0,0 +1,393 @@
+import math
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from models import Task, Status, Priority
+
+try:
+    import numpy
+except ImportError:  # search falls back to plain Python
+    numpy = None
+
+# Words are runs of letters, digits and underscores, matched case-insensitively
+WORD = re.compile(r'\w+')
+QUERY_WORD = re.compile(r'(\w+)(\*?)')
+# BM25 term frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+# A posting is `doc << TF_BITS | tf`, term frequencies capped at MAX_TF
+TF_BITS = 4
+MAX_TF = (1 << TF_BITS) - 1
+# Document lengths are kept in a byte; longer documents count as MAX_LENGTH words
+LENGTH_BITS = 8
+MAX_LENGTH = (1 << LENGTH_BITS) - 1
+# Candidates are looked up in a word's postings by bisection while they
+# number under 1/BISECT_RATIO of them, else through a dense score array
+BISECT_RATIO = 16
+# New terms wait in an unsorted list until there are this many
+MERGE_TERMS = 4096
+# Deleted documents are purged once they outnumber live ones, and this many
+COMPACT_MIN = 1000
+
+# A document's status and priority share a byte, so filters are one table lookup
+STATUS_CODES = {status: code << 2 for code, status in enumerate(Status)}
+PRIORITY_CODES = {priority: code for code, priority in enumerate(Priority)}
+DEAD = 255
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words of `text`"""
+    return WORD.findall(text.lower()) if text else []
+
+
+def task_words(task: Task) -> List[str]:
+    """Words of a task's title, description and tags"""
+    return tokenize(' '.join((task.title or '', task.description or '', *task.tags)))
+
+
+def parse_query(query: str) -> List[Tuple[str, bool]]:
+    """(word, is prefix) pairs: a word ending in '*' is a prefix, and so is the
+    last word unless the query ends in a space (search as you type)"""
+    words = [(word, bool(star)) for word, star in QUERY_WORD.findall(query.lower())]
+    if words and not query[-1:].isspace():
+        words[-1] = (words[-1][0], True)
+    return words
+
+
+def _code(task: Task) -> int:
+    return STATUS_CODES[task.status] | PRIORITY_CODES[task.priority]
+
+
+class SearchIndex:
+    """In-memory inverted index over task titles, descriptions and tags.
+
+    Each task is a document numbered in insertion order, so every term's
+    postings array is sorted by document and holds one packed integer per
+    document (see TF_BITS). Changing a task's text retires its document and
+    appends a new one; retired documents are skipped by queries and purged
+    in a rebuild once they outnumber live ones. Document frequencies count
+    them until then, which only nudges the BM25 weights.
+
+    A query matches the tasks containing every word, prefixes expanding
+    to every matching term of a sorted vocabulary. Candidates come from the rarest word and
+    are looked up in the other words' postings by bisection, so a query
+    costs about as much as its rarest word (and any prefix expanding to
+    several terms) has matches. With NumPy that is vectorized, like
+    `scoring`.
+
+    Kept in step with a storage backend's mutations like `stats.TaskStats`,
+    but built on the first query rather than on `attach`, so storages
+    nobody searches pay only for ignoring their listener events.
+    """
+
+    def __init__(self):
+        self._storage = None
+        self._built = False
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # term -> one packed posting (int) or a sorted array('I') of them
+        self._postings: Dict[str, object] = {}
+        self._doc_of: Dict[str, int] = {}
+        # Per document; a retired document keeps its slot with task None
+        self._tasks: List[Optional[Task]] = []
+        self._lengths = array('B')
+        self._codes = array('B')
+        self._hashes = array('q')
+        self._live_length = 0
+        self._dead = 0
+        self._sorted_terms: List[str] = []
+        self._new_terms: List[str] = []
+        # For memory_bytes: string sizes, single postings, arrays and their postings
+        self._term_bytes = 0
+        self._singles = 0
+        self._arrays = 0
+        self._array_postings = 0
+
+    def attach(self, storage):
+        """Follow a storage backend's mutations; its tasks are indexed on the first query"""
+        self._storage = storage
+        storage.add_listener(self.on_change)
+
+    def rebuild(self, tasks):
+        with self._lock:
+            self._rebuild(tasks)
+
+    def _rebuild(self, tasks):
+        self._clear()
+        for task in tasks:
+            self._index(task)
+        self._merge_terms()
+        self._built = True
+
+    def on_change(self, op: str, task_id: Optional[str], task: Optional[Task]):
+        """Storage listener callback"""
+        with self._lock:
+            if not self._built:
+                return
+            if op == 'reset':
+                # Rebuilt by the next query
+                self._clear()
+                self._built = False
+                return
+            doc = self._doc_of.get(task_id)
+            if op == 'update' and doc is not None and self._hashes[doc] == self._text_hash(task):
+                # Same text (a completion, a reschedule): refile without re-tokenizing
+                self._tasks[doc] = task
+                self._codes[doc] = _code(task)
+                return
+            if doc is not None:
+                self._retire(task_id)
+            if op in ('add', 'update'):
+                self._index(task)
+
+    @staticmethod
+    def _text_hash(task: Task) -> int:
+        return hash((task.title, task.description, task.tags))
+
+    def _index(self, task: Task):
+        doc = len(self._tasks)
+        words = task_words(task)
+        length = min(len(words), MAX_LENGTH)
+        self._doc_of[task.id] = doc
+        self._tasks.append(task)
+        self._lengths.append(length)
+        self._codes.append(_code(task))
+        self._hashes.append(self._text_hash(task))
+        self._live_length += length
+        postings = self._postings
+        for term, tf in Counter(words).items():
+            posting = doc << TF_BITS | min(tf, MAX_TF)
+            existing = postings.get(term)
+            if existing is None:
+                postings[term] = posting
+                self._new_terms.append(term)
+                self._term_bytes += sys.getsizeof(term)
+                self._singles += 1
+            elif type(existing) is int:
+                postings[term] = array('I', (existing, posting))
+                self._singles -= 1
+                self._arrays += 1
+                self._array_postings += 2
+            else:
+                existing.append(posting)
+                self._array_postings += 1
+
+    def _retire(self, task_id: str):
+        doc = self._doc_of.pop(task_id)
+        self._tasks[doc] = None
+        self._codes[doc] = DEAD
+        self._live_length -= self._lengths[doc]
+        self._dead += 1
+        if self._dead > max(COMPACT_MIN, len(self._doc_of)):
+            self._rebuild([task for task in self._tasks if task is not None])
+
+    def _merge_terms(self):
+        if self._new_terms:
+            self._sorted_terms = sorted(self._sorted_terms + self._new_terms)
+            self._new_terms = []
+
+    def _terms(self, word: str, prefix: bool) -> List[str]:
+        """Indexed terms a query word stands for"""
+        if not prefix:
+            return [word] if word in self._postings else []
+        if len(self._new_terms) >= MERGE_TERMS:
+            self._merge_terms()
+        terms = self._sorted_terms
+        matches = []
+        for i in range(bisect_left(terms, word), len(terms)):
+            if not terms[i].startswith(word):
+                break
+            matches.append(terms[i])
+        matches += [term for term in self._new_terms if term.startswith(word)]
+        return matches
+
+    def _df(self, term: str) -> int:
+        postings = self._postings[term]
+        return 1 if type(postings) is int else len(postings)
+
+    def search(self, query: str, statuses: FrozenSet[str] = None, priorities: FrozenSet[str] = None,
+               offset: int = 0, limit: int = None, tasks=None) -> Tuple[List[Task], int]:
+        """One page of the tasks matching `query`, best BM25 score first, plus the number of matches.
+
+        Every word of the query must match (see `parse_query` for prefixes).
+        `statuses` / `priorities` restrict the result to those labels (None
+        means any); ties keep insertion order. `tasks` is what to index if
+        the index has not been built yet (default: the attached storage's).
+        """
+        offset = max(offset, 0)
+        with self._lock:
+            if not self._built:
+                self._rebuild(self._storage.get_all_tasks() if tasks is None else tasks)
+            words = [self._terms(word, prefix) for word, prefix in parse_query(query)]
+            if not words or not all(words) or not self._doc_of:
+                return [], 0
+            # Rarest word first: its matches are the candidates
+            words.sort(key=lambda terms: sum(map(self._df, terms)))
+            allowed = self._allowed(statuses, priorities)
+            if numpy is not None:
+                docs, scores = self._ranked_array(words, allowed)
+            else:
+                docs, scores = self._ranked_python(words, allowed), None
+            total = len(docs)
+            end = total if limit is None else min(offset + max(limit, 0), total)
+            if scores is not None:
+                docs = self._top_array(docs, scores, end)
+            page = [self._tasks[doc] for doc in docs[offset:end]]
+        return page, total
+
+    def _allowed(self, statuses: Optional[FrozenSet[str]],
+                 priorities: Optional[FrozenSet[str]]) -> Optional[bytearray]:
+        """Which document codes a query keeps, or None for all of them"""
+        if statuses is None and priorities is None and not self._dead:
+            return None
+        allowed = bytearray(DEAD + 1)
+        for status, status_code in STATUS_CODES.items():
+            for priority, priority_code in PRIORITY_CODES.items():
+                if ((statuses is None or status.label in statuses)
+                        and (priorities is None or priority.label in priorities)):
+                    allowed[status_code | priority_code] = 1
+        return allowed
+
+    def _weights(self, df: int):
+        """BM25 idf of a term in `df` documents times (K1 + 1), and the length normalisation terms"""
+        live = len(self._doc_of)
+        # Retired documents still in df could otherwise make the idf negative
+        df = min(df, live)
+        idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+        return idf * (K1 + 1), K1 * (1 - B), K1 * B * live / max(self._live_length, 1)
+
+    # NumPy path: matches with their scores, then the best `end` of them in order
+
+    def _postings_array(self, term: str):
+        postings = self._postings[term]
+        if type(postings) is int:
+            return numpy.array((postings,), dtype=numpy.uint32)
+        return numpy.frombuffer(postings, dtype=numpy.uint32)
+
+    def _score_table(self, df: int):
+        """BM25 scores of a term in `df` documents, by tf << LENGTH_BITS | document length"""
+        weight, flat, per_length = self._weights(df)
+        tf = numpy.arange(MAX_TF + 1, dtype=numpy.float32)[:, None]
+        length = numpy.arange(MAX_LENGTH + 1, dtype=numpy.float32)
+        return (weight * tf / (tf + flat + per_length * length)).ravel()
+
+    def _scores_array(self, df: int, postings, docs):
+        slot = (postings & MAX_TF).astype(numpy.intp)
+        slot <<= LENGTH_BITS
+        slot |= numpy.frombuffer(self._lengths, dtype=numpy.uint8)[docs]
+        return self._score_table(df)[slot]
+
+    def _matches_array(self, terms: List[str], allowed=None):
+        """Documents with any of `terms` that `allowed` keeps, ascending, and their summed scores"""
+        found = list(map(self._postings.get, terms))
+        groups = [(postings, len(postings)) for postings in found if type(postings) is not int]
+        # Terms in one document all weigh the same: score them as one array
+        singles = [postings for postings in found if type(postings) is int]
+        if singles:
+            groups.append((array('I', singles), 1))
+        found_docs, found_scores = [], []
+        for postings, df in groups:
+            postings = numpy.frombuffer(postings, dtype=numpy.uint32)
+            # Index with intp: NumPy gathers through other integer types several times slower
+            docs = (postings >> TF_BITS).astype(numpy.intp)
+            if allowed is not None:
+                keep = numpy.frombuffer(allowed, dtype=bool)[
+                    numpy.frombuffer(self._codes, dtype=numpy.uint8)[docs].astype(numpy.intp)]
+                postings, docs = postings[keep], docs[keep]
+            found_docs.append(docs)
+            found_scores.append(self._scores_array(df, postings, docs))
+        if len(terms) == 1:
+            return found_docs[0], found_scores[0]
+        docs, inverse = numpy.unique(numpy.concatenate(found_docs), return_inverse=True)
+        return docs, numpy.bincount(inverse, weights=numpy.concatenate(found_scores)).astype(numpy.float32)
+
+    def _ranked_array(self, words, allowed):
+        docs, scores = self._matches_array(words[0], allowed)
+        for terms in words[1:]:
+            df = sum(map(self._df, terms))
+            if len(terms) == 1 and len(docs) * BISECT_RATIO < df:
+                # Few candidates: bisect the postings instead of scoring them all
+                postings = self._postings_array(terms[0])
+                position = numpy.searchsorted(postings, docs.astype(numpy.uint32) << TF_BITS)
+                found = postings[numpy.minimum(position, len(postings) - 1)]
+                hit = (found >> TF_BITS) == docs
+                docs = docs[hit]
+                scores = scores[hit] + self._scores_array(df, found[hit], docs)
+            else:
+                word_docs, word_scores = self._matches_array(terms)
+                dense = numpy.zeros(len(self._tasks), dtype=numpy.float32)
+                dense[word_docs] = word_scores
+                gain = dense[docs]
+                # Scores are positive, so zero means the word is missing
+                hit = gain > 0
+                docs, scores = docs[hit], scores[hit] + gain[hit]
+        return docs, scores
+
+    def _top_array(self, docs, scores, end: int) -> List[int]:
+        if end == 0:
+            return []
+        if end < len(docs):
+            # The `end` best, ties at the cut going to the lowest documents (docs is ascending)
+            cut = numpy.partition(scores, len(scores) - end)[len(scores) - end]
+            above = numpy.flatnonzero(scores > cut)
+            tied = numpy.flatnonzero(scores == cut)[:end - len(above)]
+            top = numpy.concatenate((above, tied))
+            docs, scores = docs[top], scores[top]
+        order = numpy.lexsort((docs, -scores))
+        return docs[order].tolist()
+
+    # Plain Python path
+
+    def _term_postings(self, term: str):
+        postings = self._postings[term]
+        return (postings,) if type(postings) is int else postings
+
+    def _ranked_python(self, words, allowed) -> List[int]:
+        scores = None
+        for terms in words:
+            word_scores = {}
+            for term in terms:
+                weight, flat, per_length = self._weights(self._df(term))
+                for posting in self._term_postings(term):
+                    doc = posting >> TF_BITS
+                    if scores is None:
+                        if allowed is not None and not allowed[self._codes[doc]]:
+                            continue
+                    elif doc not in scores:
+                        continue
+                    tf = posting & MAX_TF
+                    word_scores[doc] = (word_scores.get(doc, 0.0)
+                                        + weight * tf / (tf + flat + per_length * self._lengths[doc]))
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {doc: scores[doc] + score for doc, score in word_scores.items()}
+        return sorted(scores, key=lambda doc: (-scores[doc], doc))
+
+    # Introspection
+
+    def __len__(self) -> int:
+        return len(self._doc_of)
+
+    def terms(self) -> int:
+        """Number of distinct indexed terms"""
+        return len(self._postings)
+
+    def memory_bytes(self) -> int:
+        """Estimated bytes held by the index (0 until built), not counting the tasks themselves"""
+        with self._lock:
+            if not self._built:
+                return 0
+            containers = (self._postings, self._doc_of, self._tasks, self._lengths, self._codes,
+                          self._hashes, self._sorted_terms, self._new_terms)
+            return (sum(map(sys.getsizeof, containers)) + self._term_bytes
+                    + self._singles * sys.getsizeof(1 << 40)
+                    + self._arrays * sys.getsizeof(array('I'))
+                    + self._array_postings * array('I').itemsize)
@@ -0,0 +1,498 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union
+from backups import archive_tasks, iter_backup, write_backup
+from engines import LogEngine
+from metrics import instrument
+from models import Task, due_timestamp, task_to_json
+from search import parse_query
+from storage import StorageListeners, VersionConflict, _labels
+from importers import iter_task_file
+from streams import base_extension
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    due_ts REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(priority, status);
+CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks(due_ts);
+"""
+
+# Full-text index over title, description and tags, keyed by tasks.seq and
+# kept in step by triggers ('_' counts as a letter, as in search.WORD). The
+# delete trigger also covers INSERT OR REPLACE, given recursive_triggers.
+FTS_TEXT = ("json_extract(new.data, '$.title'), json_extract(new.data, '$.description'), "
+            "json_extract(new.data, '$.tags')")
+FTS_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    title, description, tags, tokenize = "unicode61 tokenchars '_'"
+);
+CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+    INSERT INTO tasks_fts (rowid, title, description, tags) VALUES (new.seq, {FTS_TEXT});
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF data ON tasks BEGIN
+    DELETE FROM tasks_fts WHERE rowid = old.seq;
+    INSERT INTO tasks_fts (rowid, title, description, tags) VALUES (new.seq, {FTS_TEXT});
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+    DELETE FROM tasks_fts WHERE rowid = old.seq;
+END;
+"""
+FTS_POPULATE = f"INSERT INTO tasks_fts (rowid, title, description, tags) SELECT seq, {FTS_TEXT.replace('new.', '')} FROM tasks"
+FTS_EXISTS = "SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'"
+FTS_SIZE = "SELECT COALESCE(SUM(length(block)), 0) FROM tasks_fts_data"
+SEARCH_FROM = "FROM tasks_fts JOIN tasks ON tasks.seq = tasks_fts.rowid WHERE tasks_fts MATCH ?"
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache reuses the prepared form on every call.
+INSERT_TASK = "INSERT OR REPLACE INTO tasks (id, status, priority, due_ts, data) VALUES (?, ?, ?, ?, ?)"
+UPDATE_TASK = "UPDATE tasks SET status = ?, priority = ?, due_ts = ?, data = ? WHERE id = ?"
+DELETE_TASK = "DELETE FROM tasks WHERE id = ?"
+SELECT_ALL = "SELECT data FROM tasks ORDER BY seq"
+SELECT_PAGE_BY_ID = "SELECT id, data FROM tasks WHERE id > ? ORDER BY id LIMIT ?"
+SELECT_ROWS_BY_ID = "SELECT id, data FROM tasks ORDER BY id"
+SELECT_BY_ID = "SELECT data FROM tasks WHERE id = ?"
+SELECT_VERSION = "SELECT json_extract(data, '$.version') FROM tasks WHERE id = ?"
+SELECT_BY_STATUS = "SELECT data FROM tasks WHERE status = ? ORDER BY seq"
+SELECT_BY_PRIORITY = "SELECT data FROM tasks WHERE priority = ? ORDER BY seq"
+# A recurring task's due date only starts the series; it is never overdue itself
+NOT_RECURRING = "json_extract(data, '$.recurrence') IS NULL"
+SELECT_OVERDUE = f"SELECT data FROM tasks WHERE due_ts < ? AND status != 'completed' AND {NOT_RECURRING} ORDER BY due_ts"
+COUNT_BY_STATUS = "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+COUNT_OPEN_BY_PRIORITY = "SELECT priority, COUNT(*) FROM tasks WHERE status != 'completed' GROUP BY priority"
+COUNT_OVERDUE = f"SELECT COUNT(*) FROM tasks WHERE due_ts < ? AND status != 'completed' AND {NOT_RECURRING}"
+# `query` orders as (expression, ascending) terms, matching indexes.SORT_KEYS
+CREATED_DATE = "json_extract(data, '$.created_date')"
+QUERY_ORDERS = {
+    'due_date': (("due_ts IS NULL", True), ("due_ts", True), ("id", True)),
+    'priority': (("CASE priority WHEN 'High' THEN 0 WHEN 'Medium' THEN 1 ELSE 2 END", True),
+                 ("due_ts IS NULL", True), ("due_ts", True), ("id", True)),
+    'created_date': ((f"{CREATED_DATE} IS NULL", True), (CREATED_DATE, False), ("id", True)),
+}
+# Completed one-off tasks by their completed date, plus each completed
+# occurrence of a series (as in stats.TaskStats)
+COMPLETIONS_BY_DAY = f"""
+SELECT day, COUNT(*) FROM (
+    SELECT substr(json_extract(data, '$.completed_date'), 1, 10) AS day
+    FROM tasks WHERE status = 'completed' AND {NOT_RECURRING}
+    UNION ALL
+    SELECT substr(completion.value, 1, 10)
+    FROM tasks, json_each(tasks.data, '$.completions') AS completion
+    WHERE NOT ({NOT_RECURRING})
+) WHERE day >= ? GROUP BY day
+"""
+
+
+def _row_values(task: Dict) -> tuple:
+    """Indexed column values plus the JSON document for a task"""
+    return (task['status'], task['priority'], due_timestamp(task),
+            json.dumps(task, default=task_to_json))
+
+
+@instrument
+class SQLiteTaskStorage(StorageListeners):
+    """SQLite-backed storage for tasks with the same API as TaskStorage.
+
+    Each task is stored as a JSON document with its id, status, priority and
+    due timestamp mirrored into indexed columns. The database runs in WAL
+    mode so readers in other sessions don't block the writer. `search` runs
+    on an FTS5 table that triggers keep in step with `tasks`.
+
+    Reads always see the database, but listeners only hear about this
+    connection's writes; commits from other processes are detected through
+    `PRAGMA data_version` (at most every `refresh_interval` seconds) and
+    reported as a 'reset'.
+    """
+
+    def __init__(self, filename="tasks.db", refresh_interval=0.5):
+        self.filename = filename
+        self.refresh_interval = refresh_interval
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._in_transaction = False
+        self.conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute(FTS_EXISTS).fetchone() is None:
+            # First open of a database from before full-text search
+            self.conn.executescript(FTS_SCHEMA)
+            self.conn.execute(FTS_POPULATE)
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self._last_refresh = time.monotonic()
+
+    def refresh(self) -> bool:
+        """Notify listeners if another connection committed since the last check"""
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+        if changed:
+            self._notify('reset')
+        return changed
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[Task]:
+        self._maybe_refresh()
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [Task.from_dict(json.loads(row[0])) for row in rows]
+
+    def flush(self):
+        """Checkpoint the WAL into the main database file"""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed mutations in one SQLite transaction.
+        
+        The connection is held for the whole block, so other threads' writes
+        can't interleave; an exception rolls everything back. Nested
+        transactions join the outermost one.
+        """
+        with self._lock:
+            if self._in_transaction:
+                yield self
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                yield self
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._notify('reset')
+                raise
+            finally:
+                self._in_transaction = False
+
+    def add_task(self, task: Dict) -> bool:
+        """Add a new task"""
+        try:
+            task = Task.coerce(task)
+            if task.version is None:
+                task.version = 1
+            with self._lock:
+                self.conn.execute(INSERT_TASK, (task.id,) + _row_values(task))
+            self._notify('add', task.id, task)
+            return True
+        except Exception as e:
+            print(f"Error adding task: {e}")
+            return False
+
+    def get_all_tasks(self) -> List[Task]:
+        """Get all tasks"""
+        return self._query(SELECT_ALL)
+
+    def iter_tasks(self, batch_size: int = 500) -> Iterator[Task]:
+        """Yield every task in id order, reading `batch_size` rows at a time
+
+        Only a batch is in memory at once. Writes committed while iterating
+        may or may not be seen.
+        """
+        last_id = ''
+        while True:
+            with self._lock:
+                rows = self.conn.execute(SELECT_PAGE_BY_ID, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield Task.from_dict(json.loads(data))
+            last_id = rows[-1][0]
+
+    def get_task_by_id(self, task_id: str) -> Optional[Task]:
+        """Get a specific task by ID"""
+        tasks = self._query(SELECT_BY_ID, (task_id,))
+        return tasks[0] if tasks else None
+
+    def update_task(self, task_id: str, updated_task: Dict, expected_version: int = None) -> bool:
+        """Update an existing task, compare-and-swap on its version (see TaskStorage)"""
+        try:
+            updated_task = Task.coerce(updated_task)
+            expected = updated_task.version if expected_version is None else expected_version
+            conflict = None
+            with self.transaction():
+                row = self.conn.execute(SELECT_VERSION, (task_id,)).fetchone()
+                if row is None:
+                    return False
+                current = row[0] or 0
+                if expected is not None and expected != current:
+                    # Raised after the (empty) transaction commits, not as a rollback
+                    conflict = VersionConflict(task_id, expected, current)
+                else:
+                    updated_task.version = current + 1
+                    self.conn.execute(UPDATE_TASK, _row_values(updated_task) + (task_id,))
+            if conflict is not None:
+                raise conflict
+            self._notify('update', task_id, updated_task)
+            return True
+        except VersionConflict:
+            raise
+        except Exception as e:
+            print(f"Error updating task: {e}")
+            return False
+
+    def delete_task(self, task_id: str) -> bool:
+        """Delete a task"""
+        try:
+            with self._lock:
+                deleted = self.conn.execute(DELETE_TASK, (task_id,)).rowcount
+            if not deleted:
+                return False
+            self._notify('delete', task_id)
+            return True
+        except Exception as e:
+            print(f"Error deleting task: {e}")
+            return False
+
+    def bulk_add(self, tasks: Iterable[Dict]) -> int:
+        """Add many tasks in one transaction; returns the number added"""
+        with self.transaction():
+            return sum(1 for task in tasks if self.add_task(task))
+
+    def bulk_update(self, tasks: Iterable[Dict]) -> int:
+        """Update many tasks (matched by their `id`) in one transaction"""
+        with self.transaction():
+            return sum(1 for task in tasks if self.update_task(task['id'], task))
+
+    def bulk_delete(self, task_ids: Iterable[str]) -> int:
+        """Delete many tasks in one transaction"""
+        deleted = 0
+        with self.transaction():
+            for task_id in task_ids:
+                if self.conn.execute(DELETE_TASK, (task_id,)).rowcount:
+                    deleted += 1
+                    self._notify('delete', task_id)
+        return deleted
+
+    def import_file(self, source, batch_size: int = 1000, prepare=None, errors=None) -> int:
+        """Stream tasks from a CSV, JSON or JSONL file, committing every `batch_size` rows
+
+        `prepare`, if given, is called on each batch of Task records before
+        it is stored, e.g. `PlannerAgent.tag_tasks`. Invalid rows are skipped
+        and reported to `errors` (see `iter_task_file`).
+        """
+        rows = iter_task_file(source, errors=errors)
+        imported = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return imported
+            if prepare is not None:
+                batch = prepare(batch)
+            imported += self.bulk_add(batch)
+
+    def get_tasks_by_status(self, status: str) -> List[Task]:
+        """Get tasks filtered by status"""
+        return self._query(SELECT_BY_STATUS, (status,))
+
+    def get_tasks_by_priority(self, priority: str) -> List[Task]:
+        """Get tasks filtered by priority"""
+        return self._query(SELECT_BY_PRIORITY, (priority,))
+
+    def query(self, status: Union[str, Iterable[str]] = None, priority: Union[str, Iterable[str]] = None,
+              sort_by: str = 'due_date', descending: bool = False,
+              offset: int = 0, limit: int = None) -> Tuple[List[Task], int]:
+        """Get one page of filtered, sorted tasks and the total number of matches"""
+        if sort_by not in QUERY_ORDERS:
+            raise ValueError(f"Unknown sort order {sort_by!r}, expected one of {tuple(QUERY_ORDERS)}")
+        conditions, params = [], []
+        for column, labels in (('status', _labels(status)), ('priority', _labels(priority))):
+            if labels is not None:
+                conditions.append(f"{column} IN ({', '.join('?' * len(labels))})")
+                params.extend(sorted(labels))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = ', '.join(f"{expr} {'ASC' if ascending != descending else 'DESC'}"
+                          for expr, ascending in QUERY_ORDERS[sort_by])
+        with self._lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM tasks{where}", params).fetchone()[0]
+        if limit is not None and limit <= 0:
+            return [], total
+        tasks = self._query(f"SELECT data FROM tasks{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                            tuple(params) + (-1 if limit is None else limit, max(offset, 0)))
+        return tasks, total
+
+    def search(self, text: str, status: Union[str, Iterable[str]] = None,
+               priority: Union[str, Iterable[str]] = None,
+               offset: int = 0, limit: int = None) -> Tuple[List[Task], int]:
+        """Get one page of full-text matches, best FTS5 bm25 rank first, and the total number of matches"""
+        words = parse_query(text)
+        if not words:
+            return [], 0
+        match = ' '.join(f'"{word}"*' if prefix else f'"{word}"' for word, prefix in words)
+        conditions, params = [], [match]
+        for column, labels in (('status', _labels(status)), ('priority', _labels(priority))):
+            if labels is not None:
+                conditions.append(f" AND tasks.{column} IN ({', '.join('?' * len(labels))})")
+                params.extend(sorted(labels))
+        where = SEARCH_FROM + ''.join(conditions)
+        with self._lock:
+            total = self.conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+        if limit is not None and limit <= 0:
+            return [], total
+        tasks = self._query(f"SELECT tasks.data {where} ORDER BY rank, tasks.seq LIMIT ? OFFSET ?",
+                            tuple(params) + (-1 if limit is None else limit, max(offset, 0)))
+        return tasks, total
+
+    def get_overdue_tasks(self) -> List[Task]:
+        """Get overdue tasks, most overdue first"""
+        return self._query(SELECT_OVERDUE, (datetime.now().timestamp(),))
+
+    def get_stats(self) -> Dict:
+        """Get storage statistics from SQL aggregates"""
+        with self._lock:
+            status_counts = dict(self.conn.execute(COUNT_BY_STATUS).fetchall())
+            open_counts = dict(self.conn.execute(COUNT_OPEN_BY_PRIORITY).fetchall())
+            overdue_tasks = self.conn.execute(COUNT_OVERDUE, (datetime.now().timestamp(),)).fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            search_index_bytes = self.conn.execute(FTS_SIZE).fetchone()[0]
+
+        total_tasks = sum(status_counts.values())
+        completed_tasks = status_counts.get('completed', 0)
+        priority_counts = {'High': 0, 'Medium': 0, 'Low': 0}
+        priority_counts.update(open_counts)
+
+        return {
+            'total_tasks': total_tasks,
+            'completed_tasks': completed_tasks,
+            'pending_tasks': total_tasks - completed_tasks,
+            'overdue_tasks': overdue_tasks,
+            'priority_counts': priority_counts,
+            'file_size': page_count * page_size,
+            'search_index_bytes': search_index_bytes
+        }
+
+    def get_completion_histogram(self, days: int = 14) -> Dict:
+        """Completed tasks per day for the last `days` days"""
+        today = date.today()
+        start = today - timedelta(days=days - 1)
+        with self._lock:
+            counts = dict(self.conn.execute(COMPLETIONS_BY_DAY, (start.isoformat(),)).fetchall())
+        return {day: counts.get(day.isoformat(), 0)
+                for day in (start + timedelta(days=offset) for offset in range(days))}
+
+    def backup_tasks(self, backup_filename: str = None, base: str = None) -> bool:
+        """Create a backup of tasks using SQLite's online backup API
+
+        A .json or .jsonl file name (optionally .gz or .zst), or a `base`
+        full backup to diff against, streams a JSONL backup instead, as
+        `TaskStorage.backup_tasks` does.
+        """
+        if not backup_filename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_filename = f"tasks_backup_{timestamp}.db"
+
+        try:
+            if base is not None or base_extension(backup_filename) in ('.json', '.jsonl'):
+                # One statement reads a consistent snapshot, a batch at a time
+                with self._lock:
+                    cursor = self.conn.execute(SELECT_ROWS_BY_ID)
+                    rows = (row for batch in iter(lambda: cursor.fetchmany(500), []) for row in batch)
+                    write_backup(backup_filename, rows, base)
+                return True
+            target = sqlite3.connect(backup_filename)
+            try:
+                with self._lock:
+                    self.conn.backup(target)
+            finally:
+                target.close()
+            return True
+        except Exception as e:
+            print(f"Error creating backup: {e}")
+            return False
+
+    def restore_from_backup(self, backup_filename: str) -> bool:
+        """Restore tasks from a SQLite backup, a JSONL backup or a JSON export"""
+        try:
+            if base_extension(backup_filename) in ('.json', '.jsonl'):
+                with self.transaction():
+                    self.conn.execute("DELETE FROM tasks")
+                    self._insert_many(iter_backup(backup_filename))
+            else:
+                source = sqlite3.connect(backup_filename)
+                try:
+                    with self._lock:
+                        source.backup(self.conn)
+                finally:
+                    source.close()
+            self._notify('reset')
+            return True
+        except Exception as e:
+            print(f"Error restoring from backup: {e}")
+            return False
+
+    def archive_completed(self, archive_filename: str = "tasks_archive.jsonl.gz",
+                          older_than_days: float = 30) -> int:
+        """Move tasks completed more than `older_than_days` ago to an archive file (see TaskStorage)"""
+        cutoff = time.time() - older_than_days * 86400
+        archived = []
+
+        def old_tasks(cursor):
+            for (data,) in cursor:
+                task = Task.from_dict(json.loads(data))
+                if task.completed_ts is None or task.completed_ts < cutoff:
+                    archived.append(task.id)
+                    yield task
+
+        try:
+            with self.transaction():
+                archive_tasks(archive_filename, old_tasks(self.conn.execute(SELECT_BY_STATUS, ('completed',))))
+                for task_id in archived:
+                    self.conn.execute(DELETE_TASK, (task_id,))
+        except Exception as e:
+            print(f"Error archiving tasks: {e}")
+            return 0
+        for task_id in archived:
+            self._notify('delete', task_id)
+        return len(archived)
+
+    def _insert_many(self, tasks):
+        self.conn.executemany(INSERT_TASK, ((task['id'],) + _row_values(task) for task in tasks))
+
+
+def migrate_json_to_sqlite(json_filename="tasks.json", db_filename="tasks.db") -> int:
+    """One-shot copy of a JSON task file (and its operation log) into SQLite.
+
+    Returns the number of migrated tasks. Existing rows with the same id are
+    replaced, so re-running the migration is safe.
+    """
+    tasks = LogEngine(json_filename).load()
+    storage = SQLiteTaskStorage(db_filename)
+    try:
+        with storage.transaction():
+            storage._insert_many(tasks)
+    finally:
+        storage.close()
+    return len(tasks)
+
+
+if __name__ == '__main__':
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else "tasks.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".db"
+    count = migrate_json_to_sqlite(source, target)
+    print(f"Migrated {count} tasks from {source} to {target}")
@@ -0,0 +1,128 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import date, timedelta
+from typing import List, Dict, Optional
+
+from models import Task, Status, parse_timestamp
+from recurrence import COMPLETIONS_KEY, is_series
+
+
+class TaskStats:
+    """Task counters maintained incrementally from storage mutations.
+
+    Totals, counts by status, pending counts by priority and completions per
+    day are plain counters keyed by label; the overdue count is a bisect over
+    the sorted due timestamps of open tasks. `snapshot()` is therefore O(log N) no matter how
+    many tasks exist, and the completion histogram never rescans history.
+
+    A recurring task counts once, is never overdue itself and adds each
+    completed occurrence to the completions per day.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.by_status = Counter()
+        self.open_by_priority = Counter()
+        self.completions_by_day = Counter()
+        self._open_due: List[float] = []
+        # task id -> (status, priority, due_ts, completed day)
+        self._entries: Dict[str, tuple] = {}
+        self._storage = None
+        self._lock = threading.Lock()
+
+    def attach(self, storage):
+        """Build the counters from a storage backend and follow its mutations"""
+        self._storage = storage
+        self.rebuild(storage.get_all_tasks())
+        storage.add_listener(self.on_change)
+
+    def rebuild(self, tasks):
+        """Recount from a full task list"""
+        with self._lock:
+            self.total = 0
+            self.by_status = Counter()
+            self.open_by_priority = Counter()
+            self.completions_by_day = Counter()
+            self._entries = {}
+            open_due = []
+            for task in tasks:
+                entry = self._count(task)
+                if entry[0] is not Status.COMPLETED and entry[2] is not None:
+                    open_due.append(entry[2])
+            open_due.sort()
+            self._open_due = open_due
+
+    def on_change(self, op: str, task_id: Optional[str], task: Optional[Task]):
+        """Storage listener callback"""
+        if op == 'reset':
+            self.rebuild(self._storage.get_all_tasks())
+            return
+        with self._lock:
+            self._uncount(task_id)
+            if op in ('add', 'update'):
+                entry = self._count(task)
+                if entry[0] is not Status.COMPLETED and entry[2] is not None:
+                    insort(self._open_due, entry[2])
+
+    def overdue_count(self, now: float = None) -> int:
+        """Open tasks due before `now`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return bisect_left(self._open_due, now)
+
+    def snapshot(self, now: float = None) -> Dict:
+        """Current counters in the `get_stats` shape, plus the overdue count"""
+        overdue_tasks = self.overdue_count(now)
+        with self._lock:
+            completed_tasks = self.by_status['completed']
+            priority_counts = {'High': 0, 'Medium': 0, 'Low': 0}
+            priority_counts.update(self.open_by_priority)
+            return {
+                'total_tasks': self.total,
+                'completed_tasks': completed_tasks,
+                'pending_tasks': self.total - completed_tasks,
+                'overdue_tasks': overdue_tasks,
+                'priority_counts': priority_counts,
+            }
+
+    def completion_histogram(self, days: int = 14, today: date = None) -> Dict[date, int]:
+        """Completions per day for the last `days` days, oldest first"""
+        today = today or date.today()
+        with self._lock:
+            return {day: self.completions_by_day.get(day, 0)
+                    for day in (today - timedelta(days=offset) for offset in range(days - 1, -1, -1))}
+
+    def _count(self, task: Task) -> tuple:
+        completed_days = ()
+        due_ts = task.due_ts
+        if is_series(task):
+            due_ts = None
+            completed_days = tuple(date.fromtimestamp(parse_timestamp(completed))
+                                   for completed in task.extra.get(COMPLETIONS_KEY, {}).values())
+        elif task.status is Status.COMPLETED and task.completed_ts is not None:
+            completed_days = (date.fromtimestamp(task.completed_ts),)
+        self.completions_by_day.update(completed_days)
+        entry = (task.status, task.priority, due_ts, completed_days)
+        self._entries[task.id] = entry
+        self.total += 1
+        self.by_status[task.status.label] += 1
+        if task.status is not Status.COMPLETED:
+            self.open_by_priority[task.priority.label] += 1
+        return entry
+
+    def _uncount(self, task_id: str):
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return
+        status, priority, due_ts, completed_days = entry
+        self.total -= 1
+        self.by_status[status.label] -= 1
+        if status is not Status.COMPLETED:
+            self.open_by_priority[priority.label] -= 1
+            if due_ts is not None:
+                i = bisect_left(self._open_due, due_ts)
+                if i < len(self._open_due) and self._open_due[i] == due_ts:
+                    del self._open_due[i]
+        self.completions_by_day.subtract(completed_days)
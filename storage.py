@@ -1,139 +1,528 @@
-import json
+import functools
 import os
-from typing import List, Dict, Optional
+import time
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union
+from backups import archive_tasks, iter_backup, task_rows, write_backup
+from engines import JSONFileEngine, LogEngine
+from indexes import TaskIndex, SORT_KEYS
+from locks import RWLock
+from metrics import instrument
+from models import Task
+from search import SearchIndex
+from stats import TaskStats
+from importers import iter_task_file
 
-class TaskStorage:
-    """Simple JSON-based storage for tasks"""
+class StorageListeners:
+    """Mutation callbacks shared by the storage backends.
     
-    def __init__(self, filename="tasks.json"):
+    Listeners are called as `callback(op, task_id, task)` after each change,
+    with `op` one of 'add', 'update', 'delete' or 'reset' (whole task set
+    replaced; `task_id` and `task` are None).
+    
+    `generation` counts those changes. It is bumped once the listeners have
+    run, so anything they maintain is current for the generation read.
+    """
+    
+    generation = 0
+    
+    def add_listener(self, callback):
+        """Register a mutation callback"""
+        self._listeners.append(callback)
+    
+    def remove_listener(self, callback):
+        """Unregister a mutation callback"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def current_generation(self) -> int:
+        """`generation`, after picking up other processes' changes if `refresh_interval` has passed"""
+        self._maybe_refresh()
+        return self.generation
+    
+    def _notify(self, op: str, task_id: Optional[str] = None, task: Optional[Task] = None):
+        for callback in list(self._listeners):
+            try:
+                callback(op, task_id, task)
+            except Exception as e:
+                print(f"Error in storage listener: {e}")
+        self.generation += 1
+
+class VersionConflict(Exception):
+    """An update was based on an older version of the task than the stored one"""
+    
+    def __init__(self, task_id: str, expected: int, actual: int):
+        super().__init__(f"Task {task_id} is at version {actual}, not {expected}")
+        self.task_id = task_id
+        self.expected = expected
+        self.actual = actual
+
+def _reads(method):
+    """Run a storage method under the shared lock, after picking up external changes"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._maybe_refresh()
+        with self._rwlock.read():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _labels(value: Union[str, Iterable[str], None]) -> Optional[frozenset]:
+    """A filter argument as a set of labels, or None for no filter"""
+    if value is None:
+        return None
+    return frozenset((value,) if isinstance(value, str) else value)
+
+def _writes(method):
+    """Run a storage method under the exclusive locks, on top of the latest file state"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._rwlock.write(), self.engine.lock:
+            self.refresh()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+@instrument(include=('_load_tasks', '_save_tasks'))
+class TaskStorage(StorageListeners):
+    """Simple JSON-based storage for tasks
+    
+    Tasks are held as `Task` records, parsed once at load; `add_task` and
+    `update_task` also accept the plain dict shape.
+    
+    Persistence is delegated to a pluggable engine. The default `LogEngine`
+    appends each mutation to an operation log instead of rewriting the file;
+    pass `engine=JSONFileEngine(filename)` for the old full-rewrite behaviour.
+    
+    Lookups go through a `TaskIndex` (id -> position, status and priority
+    buckets, sorted open due dates) kept in step with every mutation, and
+    `stats` maintains the dashboard counters the same way. `search` runs
+    full-text queries on a `SearchIndex`, built on first use.
+    
+    One instance is meant to be shared by every session in the process:
+    reads take a shared lock and mutations an exclusive one. Changes other
+    processes make to the files are picked up before each write and at most
+    every `refresh_interval` seconds before reads, by replaying only the new
+    log records when the engine allows it.
+    
+    Mutations also hold the engine's cross-process file lock from that
+    refresh until the record is written, so workers sharing one task file
+    never write over each other's changes. `update_task` compare-and-swaps
+    on the task `version` (see `VersionConflict`).
+    """
+    
+    def __init__(self, filename="tasks.json", engine=None, refresh_interval=0.5):
         self.filename = filename
+        self.refresh_interval = refresh_interval
+        self._listeners = []
+        self._batch = None
+        self._rwlock = RWLock()
+        self._last_refresh = time.monotonic()
+        self.engine = engine if engine is not None else LogEngine(filename)
         self.tasks = self._load_tasks()
+        self.index = TaskIndex()
+        self.index.rebuild(self.tasks)
+        self.stats = TaskStats()
+        self.stats.attach(self)
+        self.search_index = SearchIndex()
+        self.search_index.attach(self)
     
-    def _load_tasks(self) -> List[Dict]:
-        """Load tasks from JSON file"""
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return []
-        return []
+    def _load_tasks(self) -> List[Task]:
+        """Load tasks through the storage engine
+        
+        An unreadable task file raises instead of loading as empty, so the
+        next save can't overwrite it.
+        """
+        return [Task.from_dict(task) for task in self.engine.load()]
     
     def _save_tasks(self):
-        """Save tasks to JSON file"""
+        """Persist the full task list as a new snapshot"""
         try:
-            with open(self.filename, 'w') as f:
-                json.dump(self.tasks, f, indent=2, default=str)
+            self.engine.write_snapshot(self.tasks)
         except Exception as e:
             print(f"Error saving tasks: {e}")
     
+    def refresh(self) -> bool:
+        """Apply changes other processes made to the files; True if there were any"""
+        with self._rwlock.write():
+            self._last_refresh = time.monotonic()
+            if self._batch is not None:
+                return False
+            try:
+                records = self.engine.poll()
+            except Exception as e:
+                print(f"Error checking for external changes: {e}")
+                return False
+            for record in records or ():
+                self._apply_external(record)
+            return bool(records)
+    
+    def _maybe_refresh(self):
+        if (time.monotonic() - self._last_refresh >= self.refresh_interval
+                and not self._rwlock.owned()):
+            self.refresh()
+    
+    def _apply_external(self, record: Dict):
+        """Apply a log record written by another process to memory only"""
+        op = record['op']
+        if op == 'batch':
+            for sub_record in record['ops']:
+                self._apply_external(sub_record)
+        elif op in ('add', 'update'):
+            task = Task.from_dict(record['task'])
+            pos = self.index.position(task.id)
+            if pos is None:
+                self.tasks.append(task)
+                self.index.add(task, len(self.tasks) - 1)
+                self._notify('add', task.id, task)
+            else:
+                self.index.remove(task.id)
+                self.tasks[pos] = task
+                self.index.add(task, pos)
+                self._notify('update', task.id, task)
+        elif op == 'delete':
+            pos = self.index.position(record['id'])
+            if pos is not None:
+                self.index.remove(record['id'])
+                del self.tasks[pos]
+                self.index.shift(self.tasks, pos)
+                self._notify('delete', record['id'])
+        elif op == 'reset':
+            self.tasks = [Task.from_dict(task) for task in record['tasks']]
+            self.index.rebuild(self.tasks)
+            self._notify('reset')
+    
+    def _log(self, record: Dict):
+        """Persist a single mutation record, or queue it inside a transaction"""
+        if self._batch is not None:
+            self._batch.append(record)
+        else:
+            self.engine.append(record, self.tasks)
+    
+    @contextmanager
+    def transaction(self):
+        """Group mutations into a single atomic write.
+        
+        Inside the block mutations apply to memory (indexes and listeners
+        included) and are persisted once on exit: as one batch record for the
+        log engine, as a temp-file-and-rename rewrite for the JSON engine. If
+        the block raises, the in-memory task list is rolled back and nothing
+        is written. Nested transactions join the outermost one. Other
+        threads are locked out of the storage for the whole block.
+        """
+        with self._rwlock.write(), self.engine.lock:
+            if self._batch is not None:
+                yield self
+                return
+            
+            self.refresh()
+            saved_tasks = list(self.tasks)
+            self._batch = []
+            try:
+                yield self
+                if self._batch:
+                    self.engine.append_batch(self._batch, self.tasks)
+            except BaseException:
+                if self._batch:
+                    self.tasks = saved_tasks
+                    self.index.rebuild(self.tasks)
+                    self._notify('reset')
+                raise
+            finally:
+                self._batch = None
+    
+    def flush(self):
+        """Force pending writes to disk"""
+        self.engine.flush()
+    
+    def close(self):
+        """Flush and release the storage engine"""
+        self.engine.close()
+    
+    @_writes
     def add_task(self, task: Dict) -> bool:
-        """Add a new task"""
+        """Add a new task
+        
+        A task whose id is already stored replaces the stored one in place,
+        as `SQLiteTaskStorage` and log replay do; listeners see an 'update'.
+        """
         try:
-            self.tasks.append(task)
-            self._save_tasks()
+            task = Task.coerce(task)
+            if task.version is None:
+                task.version = 1
+            pos = self.index.position(task.id)
+            previous = None if pos is None else self.tasks[pos]
+            # Undo steps for the changes made so far, run in reverse on failure.
+            # `index.remove` also clears a partially applied `index.add`.
+            undo = []
+            try:
+                if previous is None:
+                    self.tasks.append(task)
+                    undo.append(self.tasks.pop)
+                    undo.append(lambda: self.index.remove(task.id))
+                    self.index.add(task, len(self.tasks) - 1)
+                else:
+                    self.index.remove(task.id)
+                    undo.append(lambda: self.index.add(previous, pos))
+                    self.tasks[pos] = task
+                    undo.append(lambda: self.tasks.__setitem__(pos, previous))
+                    undo.append(lambda: self.index.remove(task.id))
+                    self.index.add(task, pos)
+                self._log({'op': 'add', 'task': task})
+            except Exception:
+                for step in reversed(undo):
+                    step()
+                raise
+            op = 'add' if previous is None else 'update'
+            self._notify(op, task.id, task)
             return True
         except Exception as e:
             print(f"Error adding task: {e}")
             return False
     
-    def get_all_tasks(self) -> List[Dict]:
+    @_reads
+    def get_all_tasks(self) -> List[Task]:
         """Get all tasks"""
         return self.tasks.copy()
     
-    def get_task_by_id(self, task_id: str) -> Optional[Dict]:
+    def iter_tasks(self) -> Iterator[Task]:
+        """Yield every task, as of the first `next`"""
+        yield from self.get_all_tasks()
+    
+    @_reads
+    def get_task_by_id(self, task_id: str) -> Optional[Task]:
         """Get a specific task by ID"""
-        for task in self.tasks:
-            if task['id'] == task_id:
-                return task.copy()
-        return None
+        pos = self.index.position(task_id)
+        if pos is None:
+            return None
+        return self.tasks[pos].copy()
     
-    def update_task(self, task_id: str, updated_task: Dict) -> bool:
-        """Update an existing task"""
+    @_writes
+    def update_task(self, task_id: str, updated_task: Dict, expected_version: int = None) -> bool:
+        """Update an existing task
+        
+        Compare-and-swap: if `expected_version` (by default the `version`
+        `updated_task` carries, when it has one) differs from the stored
+        version, `VersionConflict` is raised and nothing is written. The
+        stored task gets the next version, which is also set on
+        `updated_task`.
+        """
         try:
-            for i, task in enumerate(self.tasks):
-                if task['id'] == task_id:
-                    self.tasks[i] = updated_task
-                    self._save_tasks()
-                    return True
-            return False
+            pos = self.index.position(task_id)
+            if pos is None:
+                return False
+            updated_task = Task.coerce(updated_task)
+            current = self.tasks[pos].version or 0
+            expected = updated_task.version if expected_version is None else expected_version
+            if expected is not None and expected != current:
+                raise VersionConflict(task_id, expected, current)
+            updated_task.version = current + 1
+            self.index.remove(task_id)
+            self.tasks[pos] = updated_task
+            self.index.add(updated_task, pos)
+            self._log({'op': 'update', 'id': task_id, 'task': updated_task})
+            self._notify('update', task_id, updated_task)
+            return True
+        except VersionConflict:
+            raise
         except Exception as e:
             print(f"Error updating task: {e}")
             return False
     
+    @_writes
     def delete_task(self, task_id: str) -> bool:
         """Delete a task"""
         try:
-            self.tasks = [task for task in self.tasks if task['id'] != task_id]
-            self._save_tasks()
+            pos = self.index.position(task_id)
+            if pos is None:
+                return False
+            self.index.remove(task_id)
+            del self.tasks[pos]
+            self.index.shift(self.tasks, pos)
+            self._log({'op': 'delete', 'id': task_id})
+            self._notify('delete', task_id)
             return True
         except Exception as e:
             print(f"Error deleting task: {e}")
             return False
     
-    def get_tasks_by_status(self, status: str) -> List[Dict]:
+    def bulk_add(self, tasks: Iterable[Dict]) -> int:
+        """Add many tasks with a single write; returns the number added"""
+        with self.transaction():
+            return sum(1 for task in tasks if self.add_task(task))
+    
+    def bulk_update(self, tasks: Iterable[Dict]) -> int:
+        """Update many tasks (matched by their `id`) with a single write"""
+        with self.transaction():
+            return sum(1 for task in tasks if self.update_task(task['id'], task))
+    
+    @_writes
+    def bulk_delete(self, task_ids: Iterable[str]) -> int:
+        """Delete many tasks with one pass over the list and a single write"""
+        task_ids = {task_id for task_id in task_ids if self.index.position(task_id) is not None}
+        if not task_ids:
+            return 0
+        with self.transaction():
+            first = min(self.index.position(task_id) for task_id in task_ids)
+            for task_id in task_ids:
+                self.index.remove(task_id)
+            self.tasks = [task for task in self.tasks if task.id not in task_ids]
+            self.index.shift(self.tasks, first)
+            for task_id in task_ids:
+                self._log({'op': 'delete', 'id': task_id})
+                self._notify('delete', task_id)
+        return len(task_ids)
+    
+    def import_file(self, source, batch_size: int = 1000, prepare=None, errors=None) -> int:
+        """Stream tasks from a CSV, JSON or JSONL file, committing every `batch_size` rows
+    
+        `prepare`, if given, is called on each batch of Task records before
+        it is stored, e.g. `PlannerAgent.tag_tasks`. Invalid rows are skipped
+        and reported to `errors` (see `iter_task_file`).
+        """
+        rows = iter_task_file(source, errors=errors)
+        imported = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return imported
+            if prepare is not None:
+                batch = prepare(batch)
+            imported += self.bulk_add(batch)
+    
+    @_reads
+    def get_tasks_by_status(self, status: str) -> List[Task]:
         """Get tasks filtered by status"""
-        return [task for task in self.tasks if task['status'] == status]
+        return self.index.tasks_with_status(status)
     
-    def get_tasks_by_priority(self, priority: str) -> List[Dict]:
+    @_reads
+    def get_tasks_by_priority(self, priority: str) -> List[Task]:
         """Get tasks filtered by priority"""
-        return [task for task in self.tasks if task['priority'] == priority]
+        return self.index.tasks_with_priority(priority)
     
-    def get_overdue_tasks(self) -> List[Dict]:
-        """Get overdue tasks"""
-        from datetime import datetime
-        current_time = datetime.now()
-        overdue = []
+    @_reads
+    def query(self, status: Union[str, Iterable[str]] = None, priority: Union[str, Iterable[str]] = None,
+              sort_by: str = 'due_date', descending: bool = False,
+              offset: int = 0, limit: int = None) -> Tuple[List[Task], int]:
+        """Get one page of filtered, sorted tasks and the total number of matches
         
-        for task in self.tasks:
-            if task['status'] != 'completed':
-                due_date = datetime.fromisoformat(task['due_date'])
-                if due_date < current_time:
-                    overdue.append(task)
+        `status` and `priority` take a label or a list of labels. `sort_by`
+        is 'due_date' (no due date last), 'priority' (highest first, then by
+        due date) or 'created_date' (newest first); `descending` reverses it.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort order {sort_by!r}, expected one of {tuple(SORT_KEYS)}")
+        return self.index.query(_labels(status), _labels(priority), sort_by, descending, offset, limit)
+    
+    @_reads
+    def search(self, text: str, status: Union[str, Iterable[str]] = None,
+               priority: Union[str, Iterable[str]] = None,
+               offset: int = 0, limit: int = None) -> Tuple[List[Task], int]:
+        """Get one page of the tasks whose title, description or tags contain
+        every word of `text`, most relevant first, and the total number of matches
         
-        return overdue
+        The last word also matches longer words it starts, as does any word
+        ending in '*'. `status` and `priority` filter as in `query`.
+        """
+        return self.search_index.search(text, _labels(status), _labels(priority), offset, limit, self.tasks)
     
+    @_reads
+    def get_overdue_tasks(self) -> List[Task]:
+        """Get overdue tasks, most overdue first"""
+        from datetime import datetime
+        return self.index.open_due_before(datetime.now().timestamp())
+    
+    @_reads
     def get_stats(self) -> Dict:
         """Get storage statistics"""
-        total_tasks = len(self.tasks)
-        completed_tasks = len([t for t in self.tasks if t['status'] == 'completed'])
-        pending_tasks = total_tasks - completed_tasks
-        
-        priority_counts = {'High': 0, 'Medium': 0, 'Low': 0}
-        for task in self.tasks:
-            if task['status'] != 'completed':
-                priority_counts[task['priority']] += 1
+        stats = self.stats.snapshot()
+        stats['file_size'] = self.engine.size()
+        stats['search_index_bytes'] = self.search_index.memory_bytes()
+        return stats
+    
+    @_reads
+    def get_completion_histogram(self, days: int = 14) -> Dict:
+        """Completed tasks per day for the last `days` days"""
+        return self.stats.completion_histogram(days)
+    
+    @_reads
+    def backup_tasks(self, backup_filename: str = None, base: str = None) -> bool:
+        """Stream a JSONL backup of the tasks, gzip- or zstd-compressed by extension
         
-        return {
-            'total_tasks': total_tasks,
-            'completed_tasks': completed_tasks,
-            'pending_tasks': pending_tasks,
-            'priority_counts': priority_counts,
-            'file_size': os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
-        }
-    
-    def backup_tasks(self, backup_filename: str = None) -> bool:
-        """Create a backup of tasks"""
+        With `base`, an earlier full backup, only the changes since it are
+        written (see `backups.write_backup`).
+        """
         if not backup_filename:
             from datetime import datetime
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"tasks_backup_{timestamp}.json"
+            backup_filename = f"tasks_backup_{timestamp}.jsonl.gz"
         
         try:
-            with open(backup_filename, 'w') as f:
-                json.dump(self.tasks, f, indent=2, default=str)
+            write_backup(backup_filename, task_rows(sorted(self.tasks, key=attrgetter('id'))), base)
             return True
         except Exception as e:
             print(f"Error creating backup: {e}")
             return False
     
+    @_writes
     def restore_from_backup(self, backup_filename: str) -> bool:
-        """Restore tasks from backup"""
+        """Restore tasks from a backup, or from a JSON or JSONL task file"""
         try:
-            with open(backup_filename, 'r') as f:
-                self.tasks = json.load(f)
+            self.tasks = [Task.from_dict(task) for task in iter_backup(backup_filename)]
+            self.index.rebuild(self.tasks)
             self._save_tasks()
+            self._notify('reset')
             return True
         except Exception as e:
             print(f"Error restoring from backup: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    @_writes
+    def archive_completed(self, archive_filename: str = "tasks_archive.jsonl.gz",
+                          older_than_days: float = 30) -> int:
+        """Move tasks completed more than `older_than_days` ago to an archive file
+        
+        The tasks are appended to the (JSONL, optionally compressed) archive
+        and synced before they are deleted here. Returns the number moved;
+        `backups.iter_archive` reads them back.
+        """
+        cutoff = time.time() - older_than_days * 86400
+        done = [task for task in self.index.tasks_with_status('completed')
+                if task.completed_ts is None or task.completed_ts < cutoff]
+        if not done:
+            return 0
+        try:
+            archive_tasks(archive_filename, done)
+        except Exception as e:
+            print(f"Error archiving tasks: {e}")
+            return 0
+        return self.bulk_delete(task.id for task in done)
+
+
+STORAGE_BACKENDS = ('log', 'json', 'sqlite')
+
+def create_storage(backend: str = None, filename: str = None):
+    """Build the configured storage backend.
+    
+    `backend` and `filename` default to the TODO_STORAGE_BACKEND and
+    TODO_STORAGE_FILE environment variables, then to the log engine over
+    tasks.json. Opening a new SQLite database next to an existing JSON file
+    migrates the JSON tasks into it first.
+    """
+    backend = (backend or os.environ.get('TODO_STORAGE_BACKEND') or 'log').lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {STORAGE_BACKENDS}")
+    
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteTaskStorage, migrate_json_to_sqlite
+        filename = filename or os.environ.get('TODO_STORAGE_FILE') or 'tasks.db'
+        json_filename = os.path.splitext(filename)[0] + '.json'
+        if not os.path.exists(filename) and (os.path.exists(json_filename) or
+                                             os.path.exists(json_filename + '.wal')):
+            migrate_json_to_sqlite(json_filename, filename)
+        return SQLiteTaskStorage(filename)
+    
+    filename = filename or os.environ.get('TODO_STORAGE_FILE') or 'tasks.json'
+    if backend == 'json':
+        return TaskStorage(filename, engine=JSONFileEngine(filename))
+    return TaskStorage(filename)
@@ -0,0 +1,168 @@
+import gzip
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # .zst files are unavailable, gzip and plain files still work
+    zstandard = None
+
+# Characters read per step by the streaming JSON parser
+CHUNK_SIZE = 1 << 16
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+# zlib's default; 9 is about three times slower for 3% smaller task files
+GZIP_LEVEL = 6
+
+_decoder = json.JSONDecoder()
+_SPACE = re.compile(r'\s*')
+
+
+def _fsync_dir(path: str):
+    """Flush a directory entry so a rename survives a crash"""
+    dirname = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def file_signature(path) -> Optional[tuple]:
+    """(inode, mtime, size) of a file, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def compression(filename) -> Optional[str]:
+    """'gzip' or 'zstd' from the file name's extension, None for a plain file"""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(str(filename))[1].lower())
+
+
+def base_extension(filename) -> str:
+    """The extension under any compression suffix, e.g. '.jsonl' for 'a.jsonl.gz'"""
+    root, ext = os.path.splitext(str(filename))
+    if ext.lower() in COMPRESSION_EXTENSIONS:
+        ext = os.path.splitext(root)[1]
+    return ext.lower()
+
+
+def _wrap(raw, filename, mode: str) -> io.TextIOWrapper:
+    """Text layer over an open binary file, (de)compressing by the file name"""
+    kind = compression(filename)
+    if kind == 'gzip':
+        raw = gzip.GzipFile(fileobj=raw, mode='rb' if mode == 'r' else 'wb', compresslevel=GZIP_LEVEL)
+    elif kind == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f"{filename}: .zst files need the zstandard package")
+        if mode == 'r':
+            raw = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+        else:
+            raw = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+@contextmanager
+def open_stream(filename, mode: str = 'r', atomic: bool = False):
+    """Text stream over a plain, gzip (.gz) or zstd (.zst) file.
+
+    `mode` is 'r', 'w' or 'a'. Appending to a compressed file adds a gzip
+    member or zstd frame, which readers see as one continuous stream.
+    Written files are fsynced when the block ends; with `atomic` they go to
+    a temp file that replaces `filename` only if the block completes.
+    """
+    path = f"{filename}.tmp" if atomic and mode != 'r' else filename
+    try:
+        with open(path, mode + 'b') as raw:
+            f = _wrap(raw, filename, mode)
+            if mode == 'r':
+                try:
+                    yield f
+                finally:
+                    f.close()
+                return
+            yield f
+            # Close the text and compression layers, but sync the file itself
+            f.flush()
+            inner = f.detach()
+            if inner is not raw:
+                inner.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+    except BaseException:
+        if path != filename and os.path.exists(path):
+            os.remove(path)
+        raise
+    if path != filename:
+        os.replace(path, filename)
+        _fsync_dir(filename)
+
+
+def iter_json(f, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the items of a JSON array, or the values of a JSON lines file, one at a time.
+
+    Reads `f` in chunks, so memory holds one chunk and one value however
+    large the file is. Array items must be separated by exactly one comma.
+    """
+    buffer, pos, eof, array = '', 0, False, None
+    # Inside an array: 'first' after '[', 'item' after ',', 'separator' after an item
+    expect = 'first'
+    while True:
+        pos = _SPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                if array:
+                    raise ValueError("JSON array is not terminated")
+                return
+            buffer, pos = buffer[pos:] + f.read(chunk_size), 0
+            eof = pos == len(buffer)
+            continue
+        if array is None:
+            array = buffer[pos] == '['
+            if array:
+                pos += 1
+            continue
+        if array:
+            char = buffer[pos]
+            if char == ']' and expect != 'item':
+                return
+            if expect == 'separator':
+                if char != ',':
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+                pos += 1
+                expect = 'item'
+                continue
+            if char in ',]':
+                raise ValueError(f"Unexpected {char!r} in JSON array")
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+            if eof:
+                raise
+        if end is None or (end == len(buffer) and not eof):
+            # The value may continue in the next chunk
+            chunk = f.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+            continue
+        pos = end
+        expect = 'separator'
+        yield value
+
+
+def iter_json_file(filename, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """`iter_json` over a plain or compressed file"""
+    with open_stream(filename) as f:
+        yield from iter_json(f, chunk_size)
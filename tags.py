@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from streams import file_signature
+
+# Built-in dictionary, used when there is no tag file
+DEFAULT_TAGS = {tag: [tag + '*'] for tag in
+                ('meeting', 'call', 'email', 'report', 'review', 'urgent', 'important')}
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class TagAutomaton:
+    """Aho-Corasick matcher from keywords to tags.
+
+    Built once from a {tag: [keywords]} dictionary. `extract` reads a text
+    a single time along goto/failure links, so a task costs time linear in
+    its text length however many keywords there are. Matching is
+    case-insensitive and whole-word: a keyword edge that is a letter, digit
+    or underscore must not touch another word character, so 'call' does not
+    fire on 'recall'. A keyword ending in '*' matches any word starting with
+    it ('meeting*' also finds 'meetings'). Tags come back once each, in
+    dictionary order.
+    """
+
+    def __init__(self, dictionary: Dict[str, Iterable[str]]):
+        self.tags: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # state -> (keyword length, tag number, check start, check end) of each keyword ending there
+        self._out: List[tuple] = [()]
+        for tag, keywords in dictionary.items():
+            self.tags.append(tag)
+            for keyword in keywords or (tag,):
+                self._insert(keyword, len(self.tags) - 1)
+        self._link()
+
+    def _insert(self, keyword: str, tag_number: int):
+        keyword = keyword.strip().lower()
+        prefix = keyword.endswith('*')
+        keyword = keyword.rstrip('*')
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            following = self._goto[state].get(ch)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][ch] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = following
+        self._out[state] += ((len(keyword), tag_number, _is_word(keyword[0]),
+                              not prefix and _is_word(keyword[-1])),)
+
+    def _link(self):
+        """Failure links breadth-first; each state also inherits its suffix states' keywords"""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, following in goto[state].items():
+                queue.append(following)
+                suffix = fail[state]
+                while suffix and ch not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[following] = goto[suffix].get(ch, 0) if state else 0
+                out[following] += out[fail[following]]
+
+    def extract(self, text: str) -> List[str]:
+        """Tags whose keywords occur in `text`"""
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        last = len(text) - 1
+        found = set()
+        state = 0
+        for i, ch in enumerate(text):
+            following = goto[state].get(ch)
+            while following is None and state:
+                state = fail[state]
+                following = goto[state].get(ch)
+            state = following or 0
+            for length, tag_number, check_start, check_end in out[state]:
+                if tag_number in found:
+                    continue
+                if check_start and i >= length and _is_word(text[i - length]):
+                    continue
+                if check_end and i < last and _is_word(text[i + 1]):
+                    continue
+                found.add(tag_number)
+        return [self.tags[n] for n in sorted(found)]
+
+
+class TagDictionary:
+    """Tag keywords from a JSON file, reloaded when the file changes.
+
+    The file maps each tag to its keywords, e.g.
+    {"meeting": ["meeting*", "standup"], "apollo": ["APL-1042", "apollo"]}
+    (an empty list stands for the tag itself), or is a plain list of tags.
+    Without the file the built-in tags are used. The file's signature is
+    checked at most every `reload_interval` seconds; a file that can't be
+    read keeps the previous dictionary.
+    """
+
+    def __init__(self, filename: Optional[str] = "tags.json", reload_interval: float = 1.0):
+        self.filename = filename
+        self.reload_interval = reload_interval
+        self._signature = None
+        self._last_check = 0.0
+        self._automaton = TagAutomaton(DEFAULT_TAGS)
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> bool:
+        """Rebuild the automaton if the tag file changed; True if it was rebuilt"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            signature = file_signature(self.filename) if self.filename else None
+            if signature == self._signature:
+                return False
+            try:
+                dictionary = DEFAULT_TAGS if signature is None else self._read()
+                self._automaton = TagAutomaton(dictionary)
+            except Exception as e:
+                # Keep the old signature so the next check retries
+                print(f"Error loading tag dictionary: {e}")
+                return False
+            self._signature = signature
+            return True
+
+    def _read(self) -> Dict[str, List[str]]:
+        with open(self.filename, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return {tag: [] for tag in data}
+        return {tag: [keywords] if isinstance(keywords, str) else list(keywords or ())
+                for tag, keywords in data.items()}
+
+    def automaton(self) -> TagAutomaton:
+        """The current automaton, after a throttled check for a changed file"""
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            self.reload()
+        return self._automaton
+
+    def extract_tags(self, text: str) -> List[str]:
+        return self.automaton().extract(text)
+
+    def extract_tags_many(self, texts: Iterable[str]) -> List[List[str]]:
+        """Tags for each text, all matched against the same dictionary version"""
+        extract = self.automaton().extract
+        return [extract(text) for text in texts]
@@ -0,0 +1,200 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional
+
+from models import Task, Status
+from recurrence import OVERDUE_LOOKBACK, is_series, occurrences
+
+_due_ts = attrgetter('due_ts')
+
+
+def _day_start(day: date) -> float:
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+class CalendarIndex:
+    """Open tasks bucketed by the local day they are due.
+
+    One-off tasks sit in a {task id: task} bucket per day, and the days
+    that have any are kept sorted, so the tasks of a day range or of every
+    day before a moment are found without looking at other tasks. Recurring
+    tasks are kept aside and expanded only for the days asked about. Built
+    from a storage backend and kept in step with its mutations, like
+    `stats.TaskStats`.
+    """
+
+    def __init__(self):
+        # date ordinal -> {task id: task}
+        self._days: Dict[int, Dict[str, Task]] = {}
+        self._ordinals: List[int] = []
+        # task id -> the ordinal it is filed under
+        self._task_days: Dict[str, int] = {}
+        self._series: Dict[str, Task] = {}
+        self._storage = None
+        self._lock = threading.Lock()
+
+    def attach(self, storage):
+        """Index a storage backend's tasks and follow its mutations"""
+        self._storage = storage
+        self.rebuild(storage.get_all_tasks())
+        storage.add_listener(self.on_change)
+
+    def rebuild(self, tasks):
+        with self._lock:
+            self._days = {}
+            self._task_days = {}
+            self._series = {}
+            for task in tasks:
+                self._file(task)
+            self._ordinals = sorted(self._days)
+
+    def on_change(self, op: str, task_id: Optional[str], task: Optional[Task]):
+        """Storage listener callback"""
+        if op == 'reset':
+            self.rebuild(self._storage.get_all_tasks())
+            return
+        with self._lock:
+            self._unfile(task_id)
+            if op in ('add', 'update'):
+                ordinal = self._file(task)
+                if ordinal is not None and len(self._days[ordinal]) == 1:
+                    insort(self._ordinals, ordinal)
+
+    def _file(self, task: Task) -> Optional[int]:
+        if task.status is Status.COMPLETED:
+            return None
+        if is_series(task):
+            self._series[task.id] = task
+            return None
+        if task.due_ts is None:
+            return None
+        ordinal = date.fromtimestamp(task.due_ts).toordinal()
+        self._days.setdefault(ordinal, {})[task.id] = task
+        self._task_days[task.id] = ordinal
+        return ordinal
+
+    def _unfile(self, task_id: str):
+        self._series.pop(task_id, None)
+        ordinal = self._task_days.pop(task_id, None)
+        if ordinal is None:
+            return
+        bucket = self._days[ordinal]
+        del bucket[task_id]
+        if not bucket:
+            del self._days[ordinal]
+            del self._ordinals[bisect_left(self._ordinals, ordinal)]
+
+    def _occurrences(self, series: List[Task], start: float, end: float) -> List[Task]:
+        return [occurrence for task in series for occurrence in occurrences(task, start, end)
+                if occurrence.status is not Status.COMPLETED]
+
+    def between(self, first: date, last: date) -> List[Task]:
+        """Open tasks and occurrences due on the days `first` to `last` (inclusive), by due time"""
+        with self._lock:
+            lo = bisect_left(self._ordinals, first.toordinal())
+            hi = bisect_right(self._ordinals, last.toordinal())
+            tasks = [task for ordinal in self._ordinals[lo:hi] for task in self._days[ordinal].values()]
+            series = list(self._series.values())
+        tasks += self._occurrences(series, _day_start(first), _day_start(last + timedelta(days=1)))
+        tasks.sort(key=_due_ts)
+        return tasks
+
+    def before(self, moment: float) -> List[Task]:
+        """Open tasks due before `moment`, plus occurrences missed within `OVERDUE_LOOKBACK`, by due time"""
+        ordinal = date.fromtimestamp(moment).toordinal()
+        with self._lock:
+            hi = bisect_left(self._ordinals, ordinal)
+            tasks = [task for day in self._ordinals[:hi] for task in self._days[day].values()]
+            tasks += [task for task in self._days.get(ordinal, {}).values() if task.due_ts < moment]
+            series = list(self._series.values())
+        tasks += self._occurrences(series, moment - OVERDUE_LOOKBACK, moment)
+        tasks.sort(key=_due_ts)
+        return tasks
+
+    def window(self, start: float, end: float) -> List[Task]:
+        """Open tasks and occurrences due in [start, end), by due time"""
+        if end <= start:
+            return []
+        tasks = self.between(date.fromtimestamp(start), date.fromtimestamp(end))
+        return [task for task in tasks if start <= task.due_ts < end]
+
+
+class TaskViews:
+    """Memoized task views for the reminder agent and the UI.
+
+    Each view is computed once per storage `generation` and time bucket and
+    then served from the cache: a mutation anywhere bumps the generation,
+    and rolling into the next bucket (the next day for day views, the next
+    `bucket_seconds` for views relative to the clock) makes a new key, so
+    stale entries are never served. Views relative to the clock may
+    therefore lag it by up to `bucket_seconds`. Misses are answered from a
+    `CalendarIndex` in time proportional to the tasks returned.
+
+    Views return fresh lists of the shared task records; copy a task before
+    changing it.
+    """
+
+    def __init__(self, storage, bucket_seconds: float = 60):
+        self.storage = storage
+        self.bucket_seconds = bucket_seconds
+        self.calendar = CalendarIndex()
+        self.calendar.attach(storage)
+        # view key -> (generation, bucket, value)
+        self._cache: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, key: tuple, compute: Callable[[], List], bucket=None) -> List:
+        """Memoize `compute()` under `key` for this generation and `bucket` (default: the clock's)"""
+        if bucket is None:
+            bucket = time.time() // self.bucket_seconds
+        # Read the generation first: a mutation during `compute` makes the result stale, not wrong
+        generation = self.storage.current_generation()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == generation and entry[1] == bucket:
+                self.hits += 1
+                return list(entry[2])
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._cache[key] = (generation, bucket, value)
+        return list(value)
+
+    def clear(self):
+        """Drop every cached view"""
+        with self._lock:
+            self._cache = {}
+
+    def _now(self, now: Optional[float]) -> float:
+        return time.time() if now is None else now
+
+    def next_days(self, days: int, now: float = None) -> List[Task]:
+        """Open tasks due today and on the following `days - 1` days, by due time"""
+        today = date.fromtimestamp(self._now(now))
+        return self.cached(('days', days),
+                           lambda: self.calendar.between(today, today + timedelta(days=days - 1)), today)
+
+    def today(self, now: float = None) -> List[Task]:
+        """Open tasks due today, by due time"""
+        return self.next_days(1, now)
+
+    def this_week(self, now: float = None) -> List[Task]:
+        """Open tasks due from today to Sunday, by due time"""
+        today = date.fromtimestamp(self._now(now))
+        return self.next_days(7 - today.weekday(), now)
+
+    def overdue(self, now: float = None) -> List[Task]:
+        """Open tasks past their due time, by due time; recurring ones as recently missed occurrences"""
+        now = self._now(now)
+        return self.cached(('overdue',), lambda: self.calendar.before(now), now // self.bucket_seconds)
+
+    def due_soon(self, within: float, now: float = None) -> List[Task]:
+        """Open tasks due in the next `within` seconds, by due time"""
+        now = self._now(now)
+        return self.cached(('due_soon', within), lambda: self.calendar.window(now, now + within),
+                           now // self.bucket_seconds)